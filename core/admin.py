@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.db.models import F, Value, DecimalField, ExpressionWrapper
 from django.db.models.functions import Coalesce            # ✅ para tratar NULL -> 100
 from .models import Produto, ListaTecnica, BOM, OrdemProducao
+from .utils import bom_busca
 
 
 def dash(v):
@@ -67,6 +68,13 @@ class BOMAdmin(admin.ModelAdmin):
     )
     list_filter = ("lista_pai",)
     ordering = ("lista_pai__codigo", "id")
+
+    def get_search_results(self, request, queryset, search_term):
+        # mesmos campos de search_fields, via índice de busca da BOM
+        if not search_term:
+            return queryset, False
+        return bom_busca.filtrar(queryset, search_term, por_termo=True), False
+
     list_per_page = 50
     autocomplete_fields = ("lista_pai", "sublista", "componente")
 
@@ -0,0 +1,80 @@
+# core/management/commands/benchmark_estoque.py
+"""
+Mede a normalização da posição de estoque (``estoque_loader._normalize_columns``)
+sobre um arquivo sintético com as colunas reais da planilha.
+
+    python manage.py benchmark_estoque --linhas 500000 --repeticoes 3
+"""
+from __future__ import annotations
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from core.utils import estoque_loader
+from core.utils.planilha_leitura import ler_planilha
+
+
+def posicao_sintetica(linhas: int, semente: int = 0) -> pd.DataFrame:
+    """DF no formato do arquivo de posição: vírgula decimal, brancos, booleanos em texto."""
+    rng = np.random.default_rng(semente)
+
+    def escolha(opcoes, p=None):
+        return rng.choice(np.array(opcoes, dtype=object), size=linhas, p=p)
+
+    def numero_texto(maximo):
+        v = np.round(rng.uniform(0, maximo, linhas), 2)
+        out = v.astype(object)
+        virgula = rng.random(linhas) < 0.5  # metade como texto com vírgula decimal
+        out[virgula] = np.char.replace(v[virgula].astype(str), ".", ",")
+        out[rng.random(linhas) < 0.05] = " "
+        return out
+
+    return pd.DataFrame({
+        "ORG": escolha(["ORG1", "ORG2", "ORG3", " ", "ORG4 "], p=[0.3, 0.3, 0.3, 0.01, 0.09]),
+        "PIEZA": np.char.add("P-", rng.integers(0, linhas // 5 + 1, linhas).astype(str)),
+        "Almacen / Warehouse": escolha(["A01", "A02", "B10", "  ", None]),
+        "Descripción": np.char.add("Peça ", rng.integers(0, 50_000, linhas).astype(str)).astype(object),
+        "REPARABLE": escolha(["+", "-", "Sim", "NAO", " ", None]),
+        "EMPRESTIMO?": escolha(["S", "N", "yes", "", None]),
+        "Lead Time": numero_texto(120),
+        "Preço Médio": numero_texto(1000),
+        "TOTAL Valor almacen": numero_texto(100_000),
+        "NIVEL_IMAX": rng.integers(0, 500, linhas),
+        "NIVEL_ROL": rng.integers(0, 500, linhas),
+        "NIVEL_QTDOC": rng.integers(0, 500, linhas),
+        "NIVEL_IMIN": rng.integers(0, 500, linhas),
+        "FAMILIA": escolha(["FIX", "ELE", "HID", " "]),
+        "BIS_QTY": numero_texto(50),
+    })
+
+
+class Command(BaseCommand):
+    help = "Benchmark da normalização do estoque num arquivo sintético."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--linhas", type=int, default=500_000)
+        parser.add_argument("--repeticoes", type=int, default=3)
+
+    def handle(self, *args, **opts):
+        linhas, repeticoes = opts["linhas"], opts["repeticoes"]
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho = Path(tmp) / "posicao_estoque.csv"
+            posicao_sintetica(linhas).to_csv(caminho, index=False)
+            bruto, leitura = ler_planilha(caminho, colunas=estoque_loader.COLUNAS_LIDAS.__contains__)
+        self.stdout.write(f"{linhas} linhas; leitura: {leitura['segundos']} s")
+
+        tempos = []
+        for _ in range(repeticoes):
+            df = bruto.copy()  # a normalização altera o DF no lugar
+            inicio = time.perf_counter()
+            out = estoque_loader._normalize_columns(df)
+            tempos.append(time.perf_counter() - inicio)
+        melhor = min(tempos)
+        self.stdout.write(
+            f"_normalize_columns: melhor {melhor:.3f} s de {repeticoes} "
+            f"({round(len(bruto) / melhor)} linhas/s, {len(out)} linhas válidas)"
+        )
@@ -0,0 +1,77 @@
+# core/management/commands/benchmark_mrp_fases.py
+"""
+Mede o /api/mrp/fases/ de ponta a ponta (``mrp_fases.fases_por_ordens``:
+leitura da BOM achatada, plano e montagem da resposta) sobre uma carga
+sintética gravada numa transação que é desfeita no fim.
+
+    python manage.py benchmark_mrp_fases --componentes 30000 --semanas 52
+"""
+from __future__ import annotations
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import ListaTecnica, NecessidadeUnitaria, OrdemProducao, Produto
+from core.utils import mrp_fases
+
+
+def carga_sintetica(componentes: int, semanas: int, listas: int, semente: int = 0) -> list:
+    """Produtos, listas e BOM achatada; devolve uma OP por lista e semana (não gravadas)."""
+    rng = np.random.default_rng(semente)
+    produtos = Produto.objects.bulk_create(
+        [
+            Produto(codigo=f"BENCH-{i}", nome=f"Componente {i}",
+                    estoque=Decimal(int(e)), lead_time=int(lt))
+            for i, (e, lt) in enumerate(zip(rng.integers(0, 500, componentes), rng.integers(0, 120, componentes)))
+        ],
+        batch_size=2000,
+    )
+    lts = ListaTecnica.objects.bulk_create(
+        [ListaTecnica(codigo=f"BENCH-L{k}", nome=f"Lista {k}") for k in range(listas)]
+    )
+    # cada componente em duas listas, com quantidade por unidade de 4 casas
+    necessidades = [
+        NecessidadeUnitaria(
+            lista=lts[int(k)], produto=p, quantidade=Decimal(int(q)).scaleb(-4), nivel=1, lista_origem=lts[int(k)]
+        )
+        for p in produtos
+        for k, q in zip(rng.choice(listas, 2, replace=False), rng.integers(1, 50_000, 2))
+    ]
+    NecessidadeUnitaria.objects.bulk_create(necessidades, batch_size=2000)
+
+    inicio = date.today()
+    return OrdemProducao.objects.bulk_create([
+        OrdemProducao(lista=lt, quantidade=int(rng.integers(1, 20)), data_entrega=inicio + timedelta(weeks=s))
+        for lt in lts
+        for s in range(semanas)
+    ])
+
+
+class Command(BaseCommand):
+    help = "Benchmark do MRP por período (fases_por_ordens) numa carga sintética."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--componentes", type=int, default=30_000)
+        parser.add_argument("--semanas", type=int, default=52)
+        parser.add_argument("--listas", type=int, default=20)
+        parser.add_argument("--modo", choices=mrp_fases.MODOS, default="exato")
+        parser.add_argument("--repeticoes", type=int, default=3)
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            ordens = carga_sintetica(opts["componentes"], opts["semanas"], opts["listas"])
+            tempos = []
+            for _ in range(opts["repeticoes"]):
+                inicio = time.perf_counter()
+                saida = mrp_fases.fases_por_ordens(ordens, modo=opts["modo"])
+                tempos.append(time.perf_counter() - inicio)
+            transaction.set_rollback(True)  # a carga sintética não fica no banco
+
+        self.stdout.write(
+            f"fases_por_ordens ({opts['modo']}): melhor {min(tempos):.3f} s de {opts['repeticoes']} "
+            f"({len(saida['itens'])} componentes x {len(saida['periodos'])} períodos, {len(ordens)} OPs)"
+        )
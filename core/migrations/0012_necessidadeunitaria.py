@@ -0,0 +1,93 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:38
+
+import django.db.models.deletion
+from collections import defaultdict, deque
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def preencher_necessidades_unitarias(apps, schema_editor):
+    # cópia do achatamento de utils/necessidade_unitaria.py na data da migração:
+    # listas em ordem topológica inversa (sublistas antes), cada uma a partir
+    # das já achatadas; {produto_id: (quantidade, nivel, lista_origem_id)}
+    BOM = apps.get_model("core", "BOM")
+    ListaTecnica = apps.get_model("core", "ListaTecnica")
+    NecessidadeUnitaria = apps.get_model("core", "NecessidadeUnitaria")
+
+    filhos = defaultdict(list)
+    campos = ("lista_pai_id", "componente_id", "sublista_id", "quantidade", "ponderacao_operacao")
+    for pai, comp, sub, q, p in BOM.objects.order_by("id").values_list(*campos):
+        qpond = Decimal(q or 0) * Decimal(100 if p is None else p) / Decimal("100")
+        if qpond != 0:
+            filhos[pai].append((comp, sub, qpond))
+
+    listas = list(ListaTecnica.objects.order_by("id").values_list("id", flat=True))
+    entradas = {lid: 0 for lid in listas}
+    for itens in filhos.values():
+        for _, sub, _ in itens:
+            if sub is not None:
+                entradas[sub] += 1
+    fila = deque(lid for lid in listas if entradas[lid] == 0)
+    ordem = []
+    while fila:
+        atual = fila.popleft()
+        ordem.append(atual)
+        for _, sub, _ in filhos.get(atual, ()):
+            if sub is not None:
+                entradas[sub] -= 1
+                if entradas[sub] == 0:
+                    fila.append(sub)
+    # listas em ciclo (gravadas antes da validação) ficam sem linhas
+
+    memo = {}
+    for lista_id in reversed(ordem):
+        out = {}
+        for comp, sub, qpond in filhos.get(lista_id, ()):
+            if comp is not None:
+                atual = out.get(comp)
+                out[comp] = (qpond if atual is None else atual[0] + qpond, 0, lista_id)
+            elif sub is not None:
+                for produto_id, (qtd, nivel, origem) in memo[sub].items():
+                    atual = out.get(produto_id)
+                    parcela = qpond * qtd
+                    out[produto_id] = (parcela if atual is None else atual[0] + parcela, nivel + 1, origem)
+        memo[lista_id] = out
+
+    novas = [
+        NecessidadeUnitaria(
+            lista_id=lista_id,
+            produto_id=produto_id,
+            quantidade=quantidade,
+            nivel=nivel,
+            lista_origem_id=origem,
+        )
+        for lista_id in listas if lista_id in memo
+        for produto_id, (quantidade, nivel, origem) in memo[lista_id].items()
+    ]
+    NecessidadeUnitaria.objects.bulk_create(novas, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_alter_historicalproduto_codigo_alter_produto_codigo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NecessidadeUnitaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.DecimalField(decimal_places=12, max_digits=28)),
+                ('nivel', models.IntegerField(default=0)),
+                ('lista', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='necessidades_unitarias', to='core.listatecnica')),
+                ('lista_origem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.listatecnica')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.produto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('lista', 'produto'), name='uniq_necessidade_unitaria_lista_produto')],
+            },
+        ),
+        migrations.RunPython(preencher_necessidades_unitarias, migrations.RunPython.noop),
+    ]
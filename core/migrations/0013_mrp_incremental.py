@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_necessidadeunitaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultadoMRP',
+            fields=[
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resultado_mrp', serialize=False, to='core.produto')),
+                ('necessario', models.DecimalField(decimal_places=12, default=0, max_digits=28)),
+                ('em_estoque', models.DecimalField(decimal_places=12, default=0, max_digits=28)),
+                ('em_pedido', models.DecimalField(decimal_places=12, default=0, max_digits=28)),
+                ('faltando', models.DecimalField(decimal_places=12, default=0, max_digits=28)),
+                ('data_compra', models.DateField(blank=True, null=True)),
+                ('nivel', models.IntegerField(default=0)),
+                ('codigo_pai', models.CharField(blank=True, default='', max_length=50)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='necessidadeunitaria',
+            name='lista_origem',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.listatecnica'),
+        ),
+        migrations.CreateModel(
+            name='NecessidadeBrutaMRP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('quantidade', models.DecimalField(decimal_places=12, default=0, max_digits=28)),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='necessidades_brutas', to='core.produto')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('produto', 'data'), name='uniq_necessidade_bruta_produto_data')],
+            },
+        ),
+    ]
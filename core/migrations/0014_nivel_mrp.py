@@ -0,0 +1,74 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:48
+
+from collections import defaultdict, deque
+
+from django.db import migrations, models
+
+
+def preencher_nivel_mrp(apps, schema_editor):
+    # cópia do low-level code de utils/bom_grafo.py na data da migração:
+    # maior (nível do pai + 1) entre os pais, em ordem topológica (Kahn)
+    BOM = apps.get_model("core", "BOM")
+    ListaTecnica = apps.get_model("core", "ListaTecnica")
+    Produto = apps.get_model("core", "Produto")
+
+    sub_de = defaultdict(list)
+    pais_produto = defaultdict(set)
+    for pai, comp, sub in BOM.objects.values_list("lista_pai_id", "componente_id", "sublista_id"):
+        if sub is not None:
+            sub_de[pai].append(sub)
+        if comp is not None:
+            pais_produto[comp].add(pai)
+
+    listas = list(ListaTecnica.objects.values_list("id", flat=True))
+    entradas = {lid: 0 for lid in listas}
+    for subs in sub_de.values():
+        for sub in subs:
+            entradas[sub] += 1
+    por_lista = defaultdict(int)
+    fila = deque(lid for lid, n in entradas.items() if n == 0)
+    while fila:
+        atual = fila.popleft()
+        for sub in sub_de.get(atual, ()):
+            por_lista[sub] = max(por_lista[sub], por_lista[atual] + 1)
+            entradas[sub] -= 1
+            if entradas[sub] == 0:
+                fila.append(sub)
+    # listas em ciclo (gravadas antes da validação) ficam no nível 0
+
+    for lid, nivel in por_lista.items():
+        if nivel:
+            ListaTecnica.objects.filter(pk=lid).update(nivel_mrp=nivel)
+    for pid, pais in pais_produto.items():
+        Produto.objects.filter(pk=pid).update(nivel_mrp=max(por_lista[p] + 1 for p in pais))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_mrp_incremental'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicallistatecnica',
+            name='nivel_mrp',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='historicalproduto',
+            name='nivel_mrp',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listatecnica',
+            name='nivel_mrp',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='nivel_mrp',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(preencher_nivel_mrp, migrations.RunPython.noop),
+    ]
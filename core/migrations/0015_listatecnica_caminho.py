@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 04:56
+
+from django.db import migrations, models
+
+
+def preencher_caminho(apps, schema_editor):
+    ListaTecnica = apps.get_model("core", "ListaTecnica")
+    pai_de = dict(ListaTecnica.objects.values_list("id", "parent_id"))
+
+    for lid in pai_de:
+        ids, atual = [], lid
+        # sobe até a raiz; um parent em ciclo encerra a cadeia
+        while atual is not None and atual not in ids:
+            ids.append(atual)
+            atual = pai_de.get(atual)
+        caminho = "".join(f"{i}/" for i in reversed(ids))
+        ListaTecnica.objects.filter(pk=lid).update(caminho=caminho)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_nivel_mrp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicallistatecnica',
+            name='caminho',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='listatecnica',
+            name='caminho',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(preencher_caminho, migrations.RunPython.noop),
+    ]
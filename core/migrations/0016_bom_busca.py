@@ -0,0 +1,49 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# cópia do índice de core/utils/bom_busca.py na data da migração
+TABELA = "core_bom_busca"
+
+
+def criar_indice_busca(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor != "sqlite":
+        return
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA} USING fts5(texto, tokenize='trigram')")
+    except OperationalError:
+        return  # SQLite sem FTS5/trigram: a busca usa os icontains
+
+    bom = apps.get_model("core", "BOM")._meta.db_table
+    lista = apps.get_model("core", "ListaTecnica")._meta.db_table
+    produto = apps.get_model("core", "Produto")._meta.db_table
+    texto = " || char(10) || ".join(
+        f"coalesce({c}, '')"
+        for c in ("lp.codigo", "lp.nome", "sl.codigo", "sl.nome", "p.codigo", "p.nome", "b.comentarios")
+    )
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {TABELA}")
+        cur.execute(
+            f"INSERT INTO {TABELA}(rowid, texto) "
+            f"SELECT b.id, {texto} FROM {bom} b "
+            f"JOIN {lista} lp ON lp.id = b.lista_pai_id "
+            f"LEFT JOIN {lista} sl ON sl.id = b.sublista_id "
+            f"LEFT JOIN {produto} p ON p.id = b.componente_id"
+        )
+
+
+def remover_indice_busca(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {TABELA}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_listatecnica_caminho'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice_busca, remover_indice_busca),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_bom_busca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmPedidoProduto',
+            fields=[
+                ('pieza', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('quantidade', models.DecimalField(decimal_places=6, default=0, max_digits=28)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PedidoCompra',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pedido_num', models.CharField(blank=True, default='', max_length=64)),
+                ('pieza', models.CharField(db_index=True, max_length=100)),
+                ('qty', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('ord_qty', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('recv_qty', models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                ('fornecedor', models.CharField(blank=True, db_index=True, default='', max_length=255)),
+                ('org', models.CharField(blank=True, default='', max_length=64)),
+                ('data_prevista', models.DateField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:16
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_pedidos_compra'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('tipo', models.CharField(choices=[('estoque', 'Estoque'), ('pedidos', 'Pedidos')], max_length=20)),
+                ('arquivo', models.CharField(blank=True, default='', max_length=255)),
+                ('fase', models.CharField(choices=[('na_fila', 'Na fila'), ('lendo', 'Lendo arquivo'), ('aplicando', 'Aplicando'), ('concluido', 'Concluído'), ('erro', 'Erro')], default='na_fila', max_length=20)),
+                ('linhas_processadas', models.IntegerField(default=0)),
+                ('erro', models.TextField(blank=True, default='')),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('atualizado_em', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-criado_em'],
+            },
+        ),
+    ]
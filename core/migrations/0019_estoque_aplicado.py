@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_upload_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstoqueAplicado',
+            fields=[
+                ('pieza', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('quantidade', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_ultima_alteracao(apps, schema_editor):
+    Produto = apps.get_model("core", "Produto")
+    HistoricalProduto = apps.get_model("core", "HistoricalProduto")
+    UltimaAlteracaoProduto = apps.get_model("core", "UltimaAlteracaoProduto")
+
+    ultima = HistoricalProduto.objects.filter(id=OuterRef("pk")).order_by("-history_date", "-history_id")
+    linhas = (
+        Produto.objects
+        .annotate(acao=Subquery(ultima.values("history_type")[:1]), data=Subquery(ultima.values("history_date")[:1]))
+        .filter(data__isnull=False)
+        .values_list("pk", "acao", "data")
+    )
+    UltimaAlteracaoProduto.objects.bulk_create(
+        [UltimaAlteracaoProduto(produto_id=pk, acao=acao, data=data) for pk, acao, data in linhas.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_estoque_aplicado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UltimaAlteracaoProduto',
+            fields=[
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ultima_alteracao', serialize=False, to='core.produto')),
+                ('acao', models.CharField(max_length=1)),
+                ('data', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.RunPython(preencher_ultima_alteracao, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 05:36
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def marcar_inicializado(apps, schema_editor):
+    # banco que já tem ResultadoMRP foi montado pelo recálculo completo
+    ResultadoMRP = apps.get_model("core", "ResultadoMRP")
+    EstadoMRP = apps.get_model("core", "EstadoMRP")
+    if ResultadoMRP.objects.exists():
+        EstadoMRP.objects.create(pk=1, inicializado_em=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_ultima_alteracao_produto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadoMRP',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, editable=False, primary_key=True, serialize=False)),
+                ('inicializado_em', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(marcar_inicializado, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:01
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_estado_mrp'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='historicallistatecnica',
+            name='nivel_mrp',
+        ),
+        migrations.RemoveField(
+            model_name='historicalproduto',
+            name='nivel_mrp',
+        ),
+        migrations.RemoveField(
+            model_name='listatecnica',
+            name='nivel_mrp',
+        ),
+        migrations.RemoveField(
+            model_name='produto',
+            name='nivel_mrp',
+        ),
+    ]
@@ -1,8 +1,11 @@
+import uuid
+
 from django.db import models
 from simple_history.models import HistoricalRecords
 from django.core.exceptions import ValidationError
 from decimal import Decimal, ROUND_HALF_UP
-from django.db.models import Q, CheckConstraint, F
+from django.db.models import Q, CheckConstraint, F, Value
+from django.db.models.functions import Concat, Substr
 
 PCT = Decimal("100")
 FOUR_DP = Decimal("0.0001")
@@ -52,6 +55,8 @@ class ListaTecnica(models.Model):
     nome = models.CharField(max_length=255)
     tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, default="CONJUNTO")
     parent = models.ForeignKey("self", null=True, blank=True, on_delete=models.SET_NULL, related_name="filhos")
+    # caminho materializado da raiz até esta lista: "id_raiz/.../id/" (mantido no save)
+    caminho = models.CharField(max_length=255, blank=True, default="", editable=False, db_index=True)
     observacoes = models.TextField(blank=True, default="")
     criado_em = models.DateTimeField(auto_now_add=True)
     atualizado_em = models.DateTimeField(auto_now=True)
@@ -64,14 +69,50 @@ class ListaTecnica(models.Model):
             )
         ]
 
+    def ids_caminho(self):
+        """Ids da raiz até esta lista, a partir de ``caminho``."""
+        return [int(i) for i in self.caminho.split("/") if i]
+
+    def _caminho_pelo_parent(self):
+        base = ""
+        if self.parent_id:
+            base = ListaTecnica.objects.filter(pk=self.parent_id).values_list("caminho", flat=True).first() or ""
+            if str(self.pk) in base.split("/"):
+                raise ValidationError({"parent": "A lista pai não pode ser descendente desta lista."})
+        return f"{base}{self.pk}/"
+
+    def clean(self):
+        if self.pk and self.parent_id:
+            self._caminho_pelo_parent()
+
     def save(self, *args, **kwargs):
         # 1º save para obter o PK
         creating = self.pk is None
+        anterior = ""
+        update_fields = kwargs.get("update_fields")
+        if not creating and (update_fields is None or "parent" in update_fields):
+            anterior = ListaTecnica.objects.filter(pk=self.pk).values_list("caminho", flat=True).first() or ""
+            self.caminho = self._caminho_pelo_parent()
+            if update_fields is not None:
+                kwargs["update_fields"] = set(update_fields) | {"caminho"}
         super().save(*args, **kwargs)
+
+        campos = []
+        if creating:
+            self.caminho = self._caminho_pelo_parent()
+            campos.append("caminho")
         # se não tem código ainda, atribui um sequencial baseado no id
         if creating and not self.codigo:
             self.codigo = str(self.pk)          # ou f"LT-{self.pk}" se quiser prefixo
-            super().save(update_fields=["codigo"])
+            campos.append("codigo")
+        if campos:
+            super().save(update_fields=campos)
+
+        # mudou de pai: troca o prefixo do caminho de todos os descendentes (1 UPDATE)
+        if anterior and anterior != self.caminho:
+            ListaTecnica.objects.filter(caminho__startswith=anterior).exclude(pk=self.pk).update(
+                caminho=Concat(Value(self.caminho), Substr("caminho", len(anterior) + 1))
+            )
 
 class OrdemProducao(models.Model):
     lista = models.ForeignKey('ListaTecnica', on_delete=models.CASCADE,
@@ -116,6 +157,11 @@ class BOM(models.Model):
     def clean(self):
         if bool(self.componente) == bool(self.sublista):
             raise ValidationError("Informe apenas um: componente OU sublista.")
+        if self.sublista_id and self.lista_pai_id:
+            from .utils.bom_grafo import ciclo_ao_incluir, descrever_ciclo
+            ciclo = ciclo_ao_incluir(self.lista_pai_id, self.sublista_id, ignorar_bom_id=self.pk)
+            if ciclo:
+                raise ValidationError({"sublista": descrever_ciclo(ciclo)})
         
     class Meta:
         constraints = [
@@ -132,4 +178,145 @@ class BOM(models.Model):
                 name="bom_ponderacao_0_100",
                 check=Q(ponderacao_operacao__gte=0) & Q(ponderacao_operacao__lte=100),
             ),
-        ]
\ No newline at end of file
+        ]
+
+class NecessidadeUnitaria(models.Model):
+    """
+    BOM achatada: quanto de cada Produto é consumido por UNIDADE de uma
+    Lista Técnica (produto de quantidade * ponderação/100 ao longo de todos
+    os caminhos por sublista). Tabela materializada, reconstruída pelos
+    signals de BOM (ver core/signals.py) — não editar à mão.
+    """
+    lista = models.ForeignKey(ListaTecnica, on_delete=models.CASCADE, related_name="necessidades_unitarias")
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name="+")
+    quantidade = models.DecimalField(max_digits=28, decimal_places=12)
+    # nível e lista de origem do último caminho da explosão (usados pelo front)
+    nivel = models.IntegerField(default=0)
+    # SET_NULL: ao excluir uma sublista, as linhas das listas pai ficam até a
+    # reconstrução, que precisa delas para calcular a diferença (MRP incremental)
+    lista_origem = models.ForeignKey(ListaTecnica, null=True, on_delete=models.SET_NULL, related_name="+")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["lista", "produto"], name="uniq_necessidade_unitaria_lista_produto"
+            )
+        ]
+
+
+class NecessidadeBrutaMRP(models.Model):
+    """
+    Necessidade bruta persistida por Produto e data de entrega (soma das OPs).
+    Mantida por deltas (core/utils/mrp_incremental.py): criar/alterar/excluir
+    uma OP só soma/subtrai a contribuição dela.
+    """
+    produto = models.ForeignKey(Produto, on_delete=models.CASCADE, related_name="necessidades_brutas")
+    data = models.DateField()
+    quantidade = models.DecimalField(max_digits=28, decimal_places=12, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["produto", "data"], name="uniq_necessidade_bruta_produto_data")
+        ]
+
+
+class ResultadoMRP(models.Model):
+    """
+    Resultado do MRP por Produto (o que o /api/mrp/ devolve), re-liquidado só
+    para os produtos afetados por cada alteração.
+    """
+    produto = models.OneToOneField(Produto, on_delete=models.CASCADE, primary_key=True, related_name="resultado_mrp")
+    necessario = models.DecimalField(max_digits=28, decimal_places=12, default=0)
+    em_estoque = models.DecimalField(max_digits=28, decimal_places=12, default=0)
+    em_pedido = models.DecimalField(max_digits=28, decimal_places=12, default=0)
+    faltando = models.DecimalField(max_digits=28, decimal_places=12, default=0)
+    data_compra = models.DateField(null=True, blank=True)
+    # exibição no front: nível/lista de origem da OP mais recente que usa o produto
+    nivel = models.IntegerField(default=0)
+    codigo_pai = models.CharField(max_length=50, blank=True, default="")
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+
+class EstadoMRP(models.Model):
+    """
+    Linha única (pk=1): marca que NecessidadeBrutaMRP/ResultadoMRP já foram
+    montados por um recálculo completo e, daí em diante, são mantidos por
+    deltas (core/utils/mrp_incremental.py).
+    """
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1, editable=False)
+    inicializado_em = models.DateTimeField()
+
+
+class PedidoCompra(models.Model):
+    """
+    Linha de pedido de compra aberto, carregada do arquivo de pedidos a cada
+    upload (core/utils/pedidos_db.py). ``qty`` = pedida - recebida (>= 0).
+    """
+    pedido_num = models.CharField(max_length=64, blank=True, default="")
+    pieza = models.CharField(max_length=100, db_index=True)
+    qty = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    ord_qty = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    recv_qty = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    fornecedor = models.CharField(max_length=255, blank=True, default="", db_index=True)
+    org = models.CharField(max_length=64, blank=True, default="")
+    data_prevista = models.DateField(null=True, blank=True, db_index=True)
+
+
+class EmPedidoProduto(models.Model):
+    """
+    Saldo em pedido por código de peça (soma de PedidoCompra.qty), refeito
+    junto com a carga dos pedidos. É o que o netting do MRP consulta.
+    """
+    pieza = models.CharField(max_length=100, primary_key=True)
+    quantidade = models.DecimalField(max_digits=28, decimal_places=6, default=0)
+
+
+class EstoqueAplicado(models.Model):
+    """
+    Soma de estoque por código de peça do último upload aplicado em
+    ``Produto.estoque`` (core/utils/estoque_db.py). O próximo upload compara
+    com ela e só escreve as peças que mudaram.
+    """
+    pieza = models.CharField(max_length=50, primary_key=True)
+    quantidade = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+
+class UltimaAlteracaoProduto(models.Model):
+    """
+    Última entrada do histórico (simple_history) de cada produto, mantida a
+    cada gravação (core/utils/historico_resumo.py). A visão geral do
+    histórico lê esta tabela em vez de procurar no HistoricalProduto.
+    """
+    produto = models.OneToOneField(
+        Produto, on_delete=models.CASCADE, primary_key=True, related_name="ultima_alteracao"
+    )
+    acao = models.CharField(max_length=1)  # history_type: "+", "~"
+    data = models.DateTimeField(db_index=True)
+
+
+class UploadJob(models.Model):
+    """
+    Upload de planilha processado em segundo plano (core/utils/uploads_async.py).
+    O POST devolve o id e a tela consulta a fase por GET .../upload/<id>/.
+    """
+    TIPO_CHOICES = [("estoque", "Estoque"), ("pedidos", "Pedidos")]
+    FASE_CHOICES = [
+        ("na_fila", "Na fila"),
+        ("lendo", "Lendo arquivo"),
+        ("aplicando", "Aplicando"),
+        ("concluido", "Concluído"),
+        ("erro", "Erro"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    arquivo = models.CharField(max_length=255, blank=True, default="")
+    fase = models.CharField(max_length=20, choices=FASE_CHOICES, default="na_fila")
+    linhas_processadas = models.IntegerField(default=0)
+    erro = models.TextField(blank=True, default="")
+    resultado = models.JSONField(null=True, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-criado_em"]
@@ -4,16 +4,21 @@ from rest_framework.validators import UniqueTogetherValidator
 from .models import Produto, ListaTecnica, BOM, OrdemProducao
 
 from decimal import Decimal
-from .utils.pedidos_loader import get_snapshot_map
+from .utils.mrp_netting import em_pedido_por_codigo
+from .utils.bom_grafo import ciclo_ao_incluir, descrever_ciclo
+from .utils.listagem import CamposEsparsosMixin
 
 
 # =========================
 # Produtos / Listas Técnicas
 # =========================
-class ProdutoSerializer(serializers.ModelSerializer):
+class ProdutoSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
+    em_pedido = serializers.SerializerMethodField()
+
     class Meta:
         model = Produto
         fields = "__all__"
+        colunas_metodos = {"em_pedido": ["codigo"]}  # ?fields= (utils/listagem.py)
         extra_kwargs = {
             "codigo": {"required": False, "allow_null": True, "allow_blank": True}
         }
@@ -35,11 +40,14 @@ class ProdutoSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
     
     def get_em_pedido(self, obj: Produto):
-        snap = get_snapshot_map()
-        return float(snap.get(obj.codigo, Decimal("0")))
+        # o mapa {codigo: qtd} entra no contexto uma vez por request (o contexto
+        # do many=True é o mesmo para todas as linhas)
+        if "em_pedido" not in self.context:
+            self.context["em_pedido"] = em_pedido_por_codigo()
+        return float(self.context["em_pedido"].get(obj.codigo, Decimal("0")))
 
 
-class ListaTecnicaSerializer(serializers.ModelSerializer):
+class ListaTecnicaSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     class Meta:
         model = ListaTecnica
         fields = "__all__"
@@ -55,11 +63,17 @@ class ListaTecnicaSerializer(serializers.ModelSerializer):
             )
         ]
 
+    def validate_parent(self, value):
+        inst = self.instance
+        if value is not None and inst is not None and str(inst.pk) in value.caminho.split("/"):
+            raise serializers.ValidationError("A lista pai não pode ser descendente desta lista.")
+        return value
+
 
 # =========================
 # BOM (árvore) - já usado no CRUD
 # =========================
-class BOMSerializer(serializers.ModelSerializer):
+class BOMSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     componente = serializers.PrimaryKeyRelatedField(
         queryset=Produto.objects.all(),
         required=False,
@@ -108,10 +122,22 @@ class BOMSerializer(serializers.ModelSerializer):
             "componente_codigo",
             "componente_nome",
         ]
+        colunas_metodos = {"quant_ponderada": ["quant_ponderada"]}  # ?fields= (utils/listagem.py)
 
     def get_quant_ponderada(self, obj):
         return obj.quant_ponderada
 
+    def validate(self, attrs):
+        # sublista que alcança a própria lista pai criaria um ciclo na explosão
+        inst = self.instance
+        lista_pai = attrs.get("lista_pai", getattr(inst, "lista_pai", None))
+        sublista = attrs.get("sublista", getattr(inst, "sublista", None))
+        if lista_pai is not None and sublista is not None:
+            ciclo = ciclo_ao_incluir(lista_pai.pk, sublista.pk, ignorar_bom_id=getattr(inst, "pk", None))
+            if ciclo:
+                raise serializers.ValidationError({"sublista": descrever_ciclo(ciclo)})
+        return attrs
+
 
 # =========================
 # BOM "Flat" (para /api/bom-flat/)
@@ -154,7 +180,7 @@ class BOMFlatRowSerializer(serializers.Serializer):
 # =========================
 # Ordens de Produção
 # =========================
-class OrdemProducaoSerializer(serializers.ModelSerializer):
+class OrdemProducaoSerializer(CamposEsparsosMixin, serializers.ModelSerializer):
     lista_nome = serializers.CharField(source="lista.nome", read_only=True)
     lista_codigo = serializers.CharField(source="lista.codigo", read_only=True)
 
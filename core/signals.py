@@ -0,0 +1,135 @@
+# core/signals.py
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from simple_history.signals import post_create_historical_record
+
+from django.db.models.functions import Substr
+
+from .models import BOM, ListaTecnica, OrdemProducao, Produto
+from .utils.necessidade_unitaria import agendar_reconstrucao, necessidades_reconstruidas
+from .utils import bom_busca, historico_resumo, mrp_incremental
+
+
+# =========================
+# BOM -> NecessidadeUnitaria (BOM achatada)
+# =========================
+
+@receiver(pre_save, sender=BOM)
+def _bom_guardar_lista_anterior(sender, instance, **kwargs):
+    # se a linha mudou de lista_pai, a lista antiga também precisa ser refeita
+    instance._lista_pai_anterior = None
+    if instance.pk:
+        instance._lista_pai_anterior = (
+            BOM.objects.filter(pk=instance.pk).values_list("lista_pai_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=BOM)
+def _bom_salvo(sender, instance, **kwargs):
+    agendar_reconstrucao({instance.lista_pai_id, getattr(instance, "_lista_pai_anterior", None)})
+    bom_busca.reindexar("b.id = %s", [instance.pk])
+
+
+@receiver(post_delete, sender=BOM)
+def _bom_excluido(sender, instance, **kwargs):
+    agendar_reconstrucao({instance.lista_pai_id})
+    bom_busca.remover(instance.pk)
+
+
+# =========================
+# MRP incremental (NecessidadeBrutaMRP / ResultadoMRP)
+# =========================
+
+@receiver(necessidades_reconstruidas)
+def _mrp_bom_alterada(sender, antes, depois, **kwargs):
+    if not mrp_incremental.garantir_inicializado():
+        mrp_incremental.aplicar_mudanca_listas(antes, depois)
+
+
+@receiver(pre_save, sender=OrdemProducao)
+def _op_guardar_anterior(sender, instance, **kwargs):
+    instance._mrp_anterior = None
+    if instance.pk:
+        instance._mrp_anterior = (
+            OrdemProducao.objects.filter(pk=instance.pk)
+            .values_list("lista_id", "data_entrega", "quantidade")
+            .first()
+        )
+
+
+@receiver(post_save, sender=OrdemProducao)
+def _op_salva(sender, instance, **kwargs):
+    if mrp_incremental.garantir_inicializado():
+        return
+    anterior = getattr(instance, "_mrp_anterior", None)
+    atual = (instance.lista_id, instance.data_entrega, instance.quantidade)
+    if anterior == atual:
+        return
+    if anterior:
+        mrp_incremental.aplicar_ordem(*anterior, sinal=-1)
+    mrp_incremental.aplicar_ordem(*atual)
+
+
+@receiver(pre_delete, sender=OrdemProducao)
+def _op_excluida(sender, instance, **kwargs):
+    # pre_delete: na exclusão em cascata (ListaTecnica) a BOM achatada ainda existe aqui
+    mrp_incremental.garantir_inicializado()
+    mrp_incremental.aplicar_ordem(instance.lista_id, instance.data_entrega, instance.quantidade, sinal=-1)
+
+
+@receiver(pre_save, sender=Produto)
+def _produto_guardar_anterior(sender, instance, **kwargs):
+    instance._mrp_anterior = None
+    if instance.pk:
+        instance._mrp_anterior = (
+            Produto.objects.filter(pk=instance.pk).values_list("codigo", "estoque", "lead_time").first()
+        )
+
+
+@receiver(post_save, sender=Produto)
+def _produto_salvo(sender, instance, created, **kwargs):
+    # estoque, lead time e código (chave dos pedidos) mudam só o netting do próprio produto
+    anterior = getattr(instance, "_mrp_anterior", None)
+    if created or not anterior:
+        return
+    if anterior != (instance.codigo, instance.estoque, instance.lead_time):
+        if not mrp_incremental.garantir_inicializado():
+            mrp_incremental.renetar([instance.pk])
+
+
+# =========================
+# ListaTecnica.caminho (caminho materializado do parent)
+# =========================
+
+@receiver(post_delete, sender=ListaTecnica)
+def _lista_excluida(sender, instance, **kwargs):
+    # o parent dos filhos vira NULL (SET_NULL): os descendentes perdem o prefixo até esta lista
+    if instance.caminho:
+        ListaTecnica.objects.filter(caminho__startswith=instance.caminho).update(
+            caminho=Substr("caminho", len(instance.caminho) + 1)
+        )
+
+
+# =========================
+# Índice de busca da BOM (códigos/nomes de listas e produtos)
+# =========================
+
+@receiver(post_save, sender=Produto)
+def _produto_reindexar_busca(sender, instance, created, **kwargs):
+    if not created:
+        bom_busca.reindexar("b.componente_id = %s", [instance.pk])
+
+
+@receiver(post_save, sender=ListaTecnica)
+def _lista_reindexar_busca(sender, instance, created, **kwargs):
+    if not created:
+        bom_busca.reindexar("b.lista_pai_id = %s OR b.sublista_id = %s", [instance.pk, instance.pk])
+
+
+# =========================
+# Histórico -> UltimaAlteracaoProduto (visão geral do histórico)
+# =========================
+
+@receiver(post_create_historical_record, sender=Produto.history.model)
+def _produto_historico_criado(sender, history_instance, **kwargs):
+    historico_resumo.registrar([history_instance])
@@ -1,3 +1,979 @@
-from django.test import TestCase
+import io
+import json
+import pickle
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import numpy as np
+from openpyxl import load_workbook
+
+from .models import Produto, ListaTecnica, BOM, OrdemProducao, NecessidadeUnitaria, ResultadoMRP
+from .utils import mrp_incremental, pedidos_db
+from .utils.bom_estrutura import EstruturaBOM, adicionar_detalhes
+from .utils.bom_grafo import CicloBOMError
+from .utils.necessidade_unitaria import achatar
+
+
+def _criar_estrutura():
+    """SERIE -> CONJUNTO -> ITEM, com componentes em cada nível."""
+    serie = ListaTecnica.objects.create(nome="Série A", tipo="SERIE")
+    conjunto = ListaTecnica.objects.create(nome="Conjunto A", tipo="CONJUNTO", parent=serie)
+    item = ListaTecnica.objects.create(nome="Item A", tipo="ITEM", parent=conjunto)
+
+    parafuso = Produto.objects.create(codigo="C001", nome="Parafuso", estoque=10)
+    porca = Produto.objects.create(codigo="C002", nome="Porca", estoque=0, lead_time=5)
+    chapa = Produto.objects.create(codigo="C003", nome="Chapa", estoque=3)
+
+    BOM.objects.create(lista_pai=serie, componente=chapa, quantidade=1)
+    BOM.objects.create(lista_pai=serie, sublista=conjunto, quantidade=2)
+    BOM.objects.create(lista_pai=conjunto, componente=parafuso, quantidade=4, ponderacao_operacao=50)
+    BOM.objects.create(lista_pai=conjunto, sublista=item, quantidade=3)
+    BOM.objects.create(lista_pai=item, componente=porca, quantidade=Decimal("1.5"))
+    return serie
+
+
+class ExplosaoMRPQueryCountTests(TestCase):
+    """A explosão não pode fazer uma consulta por nó/OP."""
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.serie = _criar_estrutura()
+
+    def _criar_ordens(self, n):
+        for _ in range(n):
+            OrdemProducao.objects.create(lista=self.serie, quantidade=2, data_entrega=date(2030, 1, 1))
+
+    def _contar_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries), resp
+
+    def test_mrp_queries_nao_crescem_com_ordens(self):
+        self._criar_ordens(1)
+        poucas, _ = self._contar_queries("/api/mrp/")
+        self._criar_ordens(20)
+        muitas, _ = self._contar_queries("/api/mrp/")
+        self.assertEqual(poucas, muitas)
+
+    def test_mrp_detalhado_queries_nao_crescem_com_ordens(self):
+        self._criar_ordens(1)
+        poucas, _ = self._contar_queries("/api/mrp/detalhado/")
+        self._criar_ordens(20)
+        muitas, _ = self._contar_queries("/api/mrp/detalhado/")
+        self.assertEqual(poucas, muitas)
+
+    def test_mrp_excel_queries_nao_crescem_com_ordens(self):
+        self._criar_ordens(1)
+        poucas, _ = self._contar_queries("/api/mrp/excel/")
+        self._criar_ordens(20)
+        muitas, resp = self._contar_queries("/api/mrp/excel/")
+        self.assertEqual(poucas, muitas)
+
+        ws = load_workbook(io.BytesIO(b"".join(resp.streaming_content))).active
+        linhas = list(ws.iter_rows(values_only=True))
+        self.assertEqual(linhas[0][0], "OP")
+        self.assertEqual(len(linhas), 1 + 21 * 3)  # 3 componentes por OP
+        self.assertEqual(linhas[1][6], "01/01/2030")
+        self.assertGreater(ws.column_dimensions["F"].width, len("Componente"))
+
+    def test_mrp_csv_detalhado(self):
+        self._criar_ordens(2)
+        poucas, resp = self._contar_queries("/api/exportar-mrp-csv/")
+        linhas = b"".join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(linhas[0].split(",")[-1], "Saldo Estoque")
+        self.assertEqual(len(linhas), 1 + 2 * 3)
+        # linhas saem OP a OP; o saldo da chapa (3 em estoque, 2 por OP) passa de uma OP para a outra
+        chapa = [l.split(",") for l in linhas[1:] if ",C003 - " in l]
+        self.assertEqual([[Decimal(v) for v in c[-3:]] for c in chapa], [[3, 0, 1], [1, 1, -1]])
+        self._criar_ordens(20)
+        muitas, _ = self._contar_queries("/api/exportar-mrp-csv/")
+        self.assertEqual(poucas, muitas)
+
+    def test_mrp_quantidades(self):
+        self._criar_ordens(1)
+        _, resp = self._contar_queries("/api/mrp/")
+        por_codigo = {r["codigo"]: r for r in resp.json()}
+        # OP de 2 séries: chapa 2; parafuso 2*2*4*50% = 8; porca 2*2*3*1.5 = 18
+        self.assertEqual(por_codigo["C003"]["necessario"], 2.0)
+        self.assertEqual(por_codigo["C001"]["necessario"], 8.0)
+        self.assertEqual(por_codigo["C001"]["faltando"], 0.0)
+        self.assertEqual(por_codigo["C002"]["necessario"], 18.0)
+        self.assertEqual(por_codigo["C002"]["nivel"], 2)
+
+
+class NecessidadeUnitariaTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.serie = _criar_estrutura()
+
+    def _tabela(self, lista):
+        return {
+            n.produto.codigo: n.quantidade
+            for n in NecessidadeUnitaria.objects.filter(lista=lista).select_related("produto")
+        }
+
+    def test_tabela_achatada(self):
+        # por série: chapa 1; parafuso 2*4*50% = 4; porca 2*3*1.5 = 9
+        self.assertEqual(self._tabela(self.serie), {
+            "C003": Decimal("1"), "C001": Decimal("4"), "C002": Decimal("9"),
+        })
+
+    def test_alteracao_em_descendente_refaz_ancestrais(self):
+        linha = BOM.objects.get(lista_pai__nome="Item A")
+        with self.captureOnCommitCallbacks(execute=True):
+            linha.quantidade = Decimal("2")
+            linha.save()
+        self.assertEqual(self._tabela(self.serie)["C002"], Decimal("12"))
+        self.assertEqual(self._tabela(linha.lista_pai)["C002"], Decimal("2"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            linha.delete()
+        self.assertNotIn("C002", self._tabela(self.serie))
+
+    def test_savepoint_desfeito_nao_reconstroi(self):
+        from .utils import necessidade_unitaria
+        item = ListaTecnica.objects.get(nome="Item A")
+        conjunto = ListaTecnica.objects.get(nome="Conjunto A")
+        chapa = Produto.objects.get(codigo="C003")
+        with mock.patch.object(necessidade_unitaria, "reconstruir") as reconstruir:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        BOM.objects.create(lista_pai=item, componente=chapa, quantidade=2)
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+            reconstruir.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        BOM.objects.create(lista_pai=item, componente=chapa, quantidade=2)
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                BOM.objects.create(lista_pai=conjunto, componente=chapa, quantidade=1)
+                BOM.objects.create(lista_pai=conjunto, componente=chapa, quantidade=3)
+        reconstruir.assert_called_once_with({conjunto.id})
+
+
+class NettingMRPTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        snap = Path(self.tmp.name) / "pedidos_snapshot.pkl"
+        with open(snap, "wb") as fh:
+            pickle.dump({"C002": Decimal("5")}, fh)
+        settings_ctx = override_settings(
+            PEDIDOS_PATH=Path(self.tmp.name) / "pedidos.xlsx",
+            PEDIDOS_SNAPSHOT_PKL=snap,
+        )
+        settings_ctx.enable()
+        self.addCleanup(settings_ctx.disable)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            serie = _criar_estrutura()
+        OrdemProducao.objects.create(lista=serie, quantidade=3, data_entrega=date(2030, 1, 1))
+
+    def test_desconta_estoque_e_em_pedido(self):
+        por_codigo = {r["codigo"]: r for r in self.client.get("/api/mrp/").json()}
+        # porca: 3*9 = 27 necessárias, 0 em estoque, 5 em pedido
+        self.assertEqual(por_codigo["C002"]["em_pedido"], 5.0)
+        self.assertEqual(por_codigo["C002"]["faltando"], 22.0)
+        # parafuso: 3*4 = 12 necessários, 10 em estoque
+        self.assertEqual(por_codigo["C001"]["faltando"], 2.0)
+
+    def test_modo_float_igual_ao_exato(self):
+        exato = {r["id"]: r for r in self.client.get("/api/mrp/").json()}
+        flt = {r["id"]: r for r in self.client.get("/api/mrp/?modo=float").json()}
+        for pid, linha in exato.items():
+            self.assertAlmostEqual(linha["faltando"], flt[pid]["faltando"])
+        self.assertEqual(self.client.get("/api/mrp/?modo=xyz").status_code, 400)
+
+    def test_em_pedido_nos_produtos_carregado_uma_vez(self):
+        from .utils import mrp_netting
+        with mock.patch.object(mrp_netting, "get_snapshot_map", wraps=mrp_netting.get_snapshot_map) as snap:
+            linhas = {p["codigo"]: p for p in self.client.get("/api/componentes/").json()}
+        self.assertEqual(snap.call_count, 1)
+        self.assertEqual(linhas["C002"]["em_pedido"], 5.0)
+        self.assertEqual(linhas["C001"]["em_pedido"], 0.0)
+        self.assertIn("em_pedido", self.client.get("/api/produtos/").json()[0])
+
+
+class MRPFasesTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            serie = _criar_estrutura()
+        OrdemProducao.objects.create(lista=serie, quantidade=2, data_entrega=date(2030, 1, 10))
+        OrdemProducao.objects.create(lista=serie, quantidade=2, data_entrega=date(2030, 2, 10))
+
+    def test_data_compra_pela_primeira_falta_menos_lead_time(self):
+        por_codigo = {r["codigo"]: r for r in self.client.get("/api/mrp/").json()}
+        # chapa: estoque 3 cobre a 1ª OP (2), falta na 2ª; lead time 0
+        self.assertEqual(por_codigo["C003"]["data_compra"], "2030-02-10")
+        self.assertEqual(por_codigo["C003"]["faltando"], 1.0)
+        # porca: sem estoque, falta já na 1ª OP; lead time 5
+        self.assertEqual(por_codigo["C002"]["data_compra"], "2030-01-05")
+
+    def test_fases_por_periodo(self):
+        dados = self.client.get("/api/mrp/fases/").json()
+        self.assertEqual(dados["periodos"], ["2030-01-10", "2030-02-10"])
+        chapa = next(i for i in dados["itens"] if i["codigo"] == "C003")
+        self.assertEqual(chapa["bruto"], [2.0, 2.0])
+        self.assertEqual(chapa["projetado"], [1.0, -1.0])
+        self.assertEqual(chapa["liquido"], [0.0, 1.0])
+        self.assertEqual(chapa["liberacao"], [None, "2030-02-10"])
+
+    def test_necessidade_bruta_por_lista_e_periodo(self):
+        from .utils.mrp_netting import IndiceDenso, necessidade_bruta
+
+        indice = IndiceDenso([10, 20, 30])
+        por_lista = {
+            1: (indice.posicoes([10, 30]), np.array([2, 5])),
+            2: (indice.posicoes([30]), np.array([7])),
+        }
+        ops = {1: np.array([1, 0, 3]), 2: np.array([0, 4, 1]), 99: np.array([9, 9, 9])}  # 99: sem BOM
+        esperado = [[2, 0, 6], [0, 0, 0], [5, 28, 22]]
+        self.assertEqual(necessidade_bruta(indice, por_lista, ops).tolist(), esperado)
+
+        # dtype=object (fora do int64): mesmas somas em inteiros Python
+        grande = {k: (pos, q.astype(object) * 2 ** 70) for k, (pos, q) in por_lista.items()}
+        ops_obj = {k: v.astype(object) for k, v in ops.items()}
+        bruto = necessidade_bruta(indice, grande, ops_obj, dtype=object)
+        self.assertEqual(bruto.tolist(), [[v * 2 ** 70 for v in linha] for linha in esperado])
+
+    def test_para_float_da_matriz_inteira_igual_ao_decimal(self):
+        from .utils.mrp_netting import de_fixo, para_fixo, para_float
+
+        valores = [Decimal("0.1"), Decimal("-2.000000000001"), Decimal("1234.5678"), 0]
+        fixo = para_fixo(valores).reshape(2, 2)
+        esperado = [[float(de_fixo(v)) for v in linha] for linha in fixo]
+        self.assertEqual(para_float(fixo), esperado)
+        self.assertEqual(para_float(fixo.astype(object)), esperado)  # fora do int64: caminho exato
+
+
+class MRPIncrementalTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.serie = _criar_estrutura()
+        self.op = OrdemProducao.objects.create(lista=self.serie, quantidade=2, data_entrega=date(2030, 1, 10))
+
+    def _faltando(self, codigo):
+        return ResultadoMRP.objects.get(produto__codigo=codigo).faltando
+
+    def test_deltas_batem_com_recalculo_completo(self):
+        OrdemProducao.objects.create(lista=self.serie, quantidade=1, data_entrega=date(2030, 2, 1))
+        self.assertEqual(self._faltando("C003"), Decimal("0"))  # 3 em estoque, 3 necessárias
+
+        self.op.quantidade = 5
+        self.op.data_entrega = date(2030, 3, 1)
+        self.op.save()
+        self.assertEqual(self._faltando("C003"), Decimal("3"))
+
+        Produto.objects.filter(codigo="C003").update(estoque=10)  # update() não dispara sinal
+        chapa = Produto.objects.get(codigo="C003")
+        chapa.estoque = 1
+        chapa.save()
+        self.assertEqual(self._faltando("C003"), Decimal("5"))
+
+        item = ListaTecnica.objects.get(nome="Item A")
+        with self.captureOnCommitCallbacks(execute=True):
+            BOM.objects.create(lista_pai=item, componente=chapa, quantidade=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            BOM.objects.filter(lista_pai__nome="Conjunto A", componente__codigo="C001").delete()
+        self.assertFalse(ResultadoMRP.objects.filter(produto__codigo="C001").exists())
+
+        exibicao = list(ResultadoMRP.objects.order_by("produto_id").values_list("produto_id", "nivel", "codigo_pai"))
+        mrp_incremental.recalcular_tudo()
+        self.assertEqual(
+            exibicao, list(ResultadoMRP.objects.order_by("produto_id").values_list("produto_id", "nivel", "codigo_pai"))
+        )
+
+        self.op.delete()
+        self.assertEqual(mrp_incremental.verificar_consistencia(), [])
+
+    def test_sem_resultado_nao_recalcula_tudo(self):
+        # a marca em EstadoMRP vale mesmo com ResultadoMRP vazio
+        self.op.delete()
+        self.assertFalse(ResultadoMRP.objects.exists())
+        with mock.patch.object(mrp_incremental, "recalcular_tudo") as recalcular:
+            OrdemProducao.objects.create(lista=self.serie, quantidade=1, data_entrega=date(2030, 1, 10))
+        recalcular.assert_not_called()
+        self.assertEqual(mrp_incremental.verificar_consistencia(), [])
+
+    def test_verificar_e_corrigir(self):
+        ResultadoMRP.objects.filter(produto__codigo="C002").update(faltando=0)
+        dados = self.client.get("/api/mrp/verificar/").json()
+        self.assertFalse(dados["consistente"])
+        self.assertEqual(dados["amostra"][0]["campos"], ["faltando"])
+
+        self.assertTrue(self.client.get("/api/mrp/verificar/?corrigir=1").json()["corrigido"])
+        self.assertTrue(self.client.get("/api/mrp/verificar/").json()["consistente"])
+
+
+class GrafoBOMTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.serie = _criar_estrutura()
+        self.item = ListaTecnica.objects.get(nome="Item A")
+
+    def test_ciclo_recusado_na_gravacao(self):
+        linha = BOM(lista_pai=self.item, sublista=self.serie, quantidade=1)
+        with self.assertRaises(ValidationError):
+            linha.full_clean()
+
+        resp = self.client.post("/api/bom/", {
+            "lista_pai": self.item.id, "sublista": self.serie.id,
+            "quantidade": "1", "ponderacao_operacao": "100",
+        })
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("sublista", resp.json())
+
+    def test_explosao_sem_recursao_detecta_ciclo(self):
+        # gravado por fora da validação: explosão e achatamento falham sem estourar a pilha
+        BOM.objects.create(lista_pai=self.item, sublista=self.serie, quantidade=1)
+        estrutura = EstruturaBOM.carregar()
+        with self.assertRaises(CicloBOMError):
+            adicionar_detalhes(estrutura, self.serie.id, 1, {}, None, "")
+        with self.assertRaises(CicloBOMError):
+            achatar(estrutura.filhos, self.serie.id)
+
+    def test_ciclo_gravado_por_fora_responde_400(self):
+        OrdemProducao.objects.create(lista=self.serie, quantidade=1, data_entrega=date(2030, 1, 1))
+        BOM.objects.create(lista_pai=self.item, sublista=self.serie, quantidade=1)
+        for url in ("/api/mrp/detalhado/", "/api/mrp/excel/", "/api/exportar-mrp-csv/"):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 400, url)
+            self.assertIn("ciclo", resp.json()["detail"])
+
+
+class CaminhoListaTecnicaTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.serie = _criar_estrutura()
+        self.conjunto = ListaTecnica.objects.get(nome="Conjunto A")
+        self.item = ListaTecnica.objects.get(nome="Item A")
+
+    def test_caminho_mantido_no_save_e_exclusao(self):
+        self.assertEqual(self.item.ids_caminho(), [self.serie.id, self.conjunto.id, self.item.id])
+
+        outra = ListaTecnica.objects.create(nome="Série B", tipo="SERIE")
+        self.conjunto.parent = outra
+        self.conjunto.save()
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.ids_caminho(), [outra.id, self.conjunto.id, self.item.id])
+
+        outra.delete()
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.ids_caminho(), [self.conjunto.id, self.item.id])
+
+        resp = self.client.patch(
+            f"/api/listas-tecnicas/{self.conjunto.id}/", {"parent": self.item.id}, content_type="application/json"
+        )
+        self.assertEqual(resp.status_code, 400)
+
+    def test_bom_flat_sem_consulta_por_nivel(self):
+        with CaptureQueriesContext(connection) as ctx:
+            linhas = self.client.get("/api/bom-flat/").json()
+        porca = next(l for l in linhas if l["componente_codigo"] == "C002")
+        self.assertEqual(porca["serie_nome"], "Série A")
+        self.assertEqual(porca["sistema_nome"], "Conjunto A")
+        self.assertEqual(porca["conjunto_nome"], "Item A")
+        self.assertLessEqual(len(ctx.captured_queries), 2)
+
+
+class BOMFlatPaginacaoTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            _criar_estrutura()
+
+    def test_cursor_percorre_tudo_na_mesma_ordem(self):
+        completo = self.client.get("/api/bom-flat/?incluir_grupos=1").json()
+        paginas, cursor = [], None
+        while True:
+            url = "/api/bom-flat/?incluir_grupos=1&page_size=2" + (f"&cursor={cursor}" if cursor else "")
+            dados = self.client.get(url).json()
+            paginas.extend(dados["results"])
+            cursor = dados["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(paginas, completo)
+        self.assertEqual(self.client.get("/api/bom-flat/?cursor=xyz").status_code, 400)
+
+    def test_ndjson(self):
+        resp = self.client.get("/api/bom-flat/?formato=ndjson")
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        linhas = [json.loads(l) for l in b"".join(resp.streaming_content).decode().splitlines()]
+        self.assertEqual(linhas, self.client.get("/api/bom-flat/").json())
+
+
+class ListagemViewSetsTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            _criar_estrutura()
+
+    def test_cursor_opcional_e_campos_esparsos(self):
+        completo = self.client.get("/api/componentes/").json()
+        self.assertIsInstance(completo, list)  # sem page_size/cursor: lista inteira
+
+        ids, url = [], "/api/componentes/?page_size=2&fields=id,codigo,em_pedido"
+        with CaptureQueriesContext(connection) as ctx:
+            while url:
+                dados = self.client.get(url).json()
+                self.assertEqual({tuple(sorted(r)) for r in dados["results"]}, {("codigo", "em_pedido", "id")})
+                ids.extend(r["id"] for r in dados["results"])
+                url = dados["next"]
+        self.assertEqual(ids, sorted(p["id"] for p in completo))
+        sql = " ".join(q["sql"] for q in ctx.captured_queries if "core_produto" in q["sql"])
+        self.assertNotIn("fabricante", sql)
+
+        # relação usada por ?fields= vira select_related das colunas pedidas
+        with CaptureQueriesContext(connection) as ctx:
+            boms = self.client.get("/api/bom/?fields=id,lista_pai_codigo,quantidade&ordering=-id&page_size=50").json()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(set(boms["results"][0]), {"id", "lista_pai_codigo", "quantidade"})
+        self.assertEqual([b["id"] for b in boms["results"]], sorted((b["id"] for b in boms["results"]), reverse=True))
+        self.assertIsNone(boms["next_cursor"])
+
+
+class BuscaBOMTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            _criar_estrutura()
+
+    def _codigos(self, url):
+        return sorted(l["componente_codigo"] for l in self.client.get(url).json())
+
+    def test_busca_usa_indice_e_acompanha_alteracoes(self):
+        from .utils import bom_busca
+        self.assertTrue(bom_busca.disponivel())
+        self.assertEqual(self._codigos("/api/bom-flat/?search=paraf"), ["C001"])
+        self.assertEqual(self._codigos("/api/bom-flat/?search=item%20a"), ["C002"])
+
+        porca = Produto.objects.get(codigo="C002")
+        porca.nome = "Porca sextavada"
+        porca.save()
+        self.assertEqual(self._codigos("/api/bom-flat/?search=sextav"), ["C002"])
+
+        BOM.objects.filter(componente=porca).first().delete()
+        self.assertEqual(self._codigos("/api/bom-flat/?search=sextav"), [])
+
+    def test_search_filter_do_viewset(self):
+        ids = [b["id"] for b in self.client.get("/api/bom/?search=Conjunto%20paraf").json()]
+        self.assertEqual(ids, list(BOM.objects.filter(componente__codigo="C001").values_list("id", flat=True)))
+        self.assertEqual(len(self.client.get("/api/bom/?search=50%25").json()), 0)
+
+
+class IndiceTextoTests(TestCase):
+    """Índice de trigramas: mesmas linhas que ``str.contains`` (sem maiúsculas, vazios nunca casam)."""
+
+    def _esperado(self, serie, termo):
+        return np.flatnonzero(serie.str.contains(termo, case=False, regex=False, na=False).to_numpy())
+
+    def test_prefixo_e_trecho_iguais_ao_str_contains(self):
+        import pandas as pd
+        from .utils.indice_texto import IndiceTexto
+
+        serie = pd.Series(["ABC-123", "abc-999", "XABC", None, "", "Açúcar", "ab", "C123", "abc-123"] * 3, dtype=object)
+        indice = IndiceTexto.de_serie(serie)
+        for termo in ("abc", "ABC-1", "bc-", "123", "açú", "a", "ab", "zzz", "c-12", "xab"):
+            np.testing.assert_array_equal(indice.linhas_com(termo), self._esperado(serie, termo), err_msg=termo)
+
+        # mais valores distintos que _MUITOS_VALORES: linhas saem pela máscara
+        muitos = pd.Series([f"P{i:05d}" for i in range(3000)] + [None] * 5, dtype=object).sample(frac=1, random_state=1)
+        muitos = muitos.reset_index(drop=True)
+        indice = IndiceTexto.de_serie(muitos)
+        for termo in ("p0", "P01", "99", "p02999"):
+            np.testing.assert_array_equal(indice.linhas_com(termo), self._esperado(muitos, termo), err_msg=termo)
+
+    def test_filtros_intersectados_e_indice_refeito_no_upload(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .utils import pedidos_loader
+
+        with tempfile.TemporaryDirectory() as tmp, override_settings(
+            PEDIDOS_PATH=Path(tmp) / "pedidos.xlsx",
+            PEDIDOS_SNAPSHOT_PKL=Path(tmp) / "pedidos_snapshot.pkl",
+            MEDIA_ROOT=Path(tmp),
+        ):
+            def enviar(linhas):
+                csv = "ORL_ORDER,ORL_PART,ORL_ORDQTY,ORL_ORDER_ORG,ORL_SUPPLIER\n" + "\n".join(linhas)
+                resp = self.client.post(
+                    "/api/pedidos/upload/?aguardar=1",
+                    {"file": SimpleUploadedFile("pedidos.csv", csv.encode())},
+                )
+                self.assertEqual(resp.status_code, 200)
+                return pedidos_loader.get_df()
+
+            def conferir(df, **filtros):
+                mascara = np.ones(len(df), dtype=bool)
+                for col in ("pieza", "org", "fornecedor"):
+                    if filtros.get(col):
+                        mascara &= df[col].astype(object).str.contains(filtros[col], case=False, regex=False, na=False)
+                if filtros.get("search"):
+                    mascara &= np.logical_or.reduce([
+                        df[c].astype(object).str.contains(filtros["search"], case=False, regex=False, na=False)
+                        for c in ("pedido_num", "pieza", "fornecedor")
+                    ])
+                np.testing.assert_array_equal(
+                    pedidos_loader.linhas_filtradas(**filtros), np.flatnonzero(mascara), err_msg=str(filtros)
+                )
+
+            df = enviar([f"PO{i},C{i % 7:03d},1,ORG{i % 3},{'ACME' if i % 2 else 'Outra'}" for i in range(40)])
+            for filtros in ({"pieza": "c00"}, {"pieza": "003", "org": "org1"},
+                            {"fornecedor": "acm", "search": "po1"}, {"org": "g2", "search": "outra"}):
+                conferir(df, **filtros)
+
+            # novo arquivo: os índices acompanham o DF novo, não o anterior
+            df = enviar([f"PN{i},X{i:03d},1,ORG9,Beta" for i in range(10)])
+            conferir(df, pieza="c00")
+            conferir(df, pieza="x00", org="org9")
+            self.assertEqual(len(pedidos_loader.linhas_filtradas(search="po1")), 0)
+
+
+class EstoqueColunarTests(TestCase):
+    def setUp(self):
+        from .utils import estoque_loader
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        caminho = Path(self.tmp.name) / "posicao_estoque.csv"
+        caminho.write_text(
+            "ORG,PIEZA,Almacen / Warehouse,Descripción,FAMILIA,BIS_QTY,Preço Médio\n"
+            "SP,P-1,W1,Parafuso M8,FIX,\"2,5\",10\n"
+            "SP,P-1,W2,Parafuso M8,FIX,3,10\n"
+            "RJ,p-2,W1,Porca,,,5\n"
+            "RJ,P-3,,Arruela (lisa),FIX,7,\n"
+            ", ,W1,sem chave,FIX,1,1\n",
+            encoding="utf-8",
+        )
+        patcher = mock.patch.object(estoque_loader, "ESTOQUE_PATH", caminho)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        estoque_loader.clear_cache()
+        self.addCleanup(estoque_loader.clear_cache)
+        self.loader = estoque_loader
+
+    def test_store_mapeado_e_consulta(self):
+        store = self.loader.get_store()
+        self.assertTrue((Path(self.tmp.name) / "posicao_estoque.colunas" / "000001" / "meta.json").exists())
+        self.assertEqual(len(store), 4)
+        self.assertIsInstance(store.codigos["org"], np.memmap)
+        self.assertEqual(sorted(store.valores["familia"].tolist()), ["FIX"])
+
+        total, linhas = self.loader.query(search="P-", sort_by="bis_qty", sort_dir="desc")
+        self.assertEqual(total, 4)
+        self.assertEqual([l["bis_qty"] for l in linhas], [7.0, 3.0, 2.5, ""])
+        self.assertEqual(linhas[0]["warehouse"], "")
+        # texto literal (sem regex) e sem distinção de maiúsculas
+        self.assertEqual(self.loader.query(search="(lisa)")[0], 1)
+        self.assertEqual(self.loader.query(pieza="P-2", org="rj")[0], 1)
+
+        self.assertEqual(self.loader.somas_por_pieza(store), {"P-1": 5.5, "p-2": 0.0, "P-3": 7.0})
+
+        # outro processo (cache limpo) reabre os .npy sem reler o arquivo
+        self.loader.clear_cache()
+        with mock.patch.object(self.loader, "_ler_planilha", side_effect=AssertionError):
+            self.assertEqual(self.loader.query()[0], 4)
+
+    def test_geracao_publicada_para_outros_workers(self):
+        antigo = self.loader.get_store()
+        self.assertEqual(self.loader.ler_geracao(), 1)
+        estado_outro_worker = (self.loader._cache.store, self.loader._cache.geracao, self.loader._cache.mtime)
+
+        # "upload" em um worker: reconstrói e publica a geração 2
+        novo = self.loader.get_store(force=True)
+        self.assertEqual(self.loader.ler_geracao(), 2)
+        self.assertIsNot(novo, antigo)
+
+        # o outro worker ainda tem a geração 1 em memória: vê o número mudar e só mapeia a pasta nova
+        self.loader._cache.store, self.loader._cache.geracao, self.loader._cache.mtime = estado_outro_worker
+        with mock.patch.object(self.loader, "_ler_planilha", side_effect=AssertionError):
+            self.assertEqual(self.loader.get_store().meta["geracao"], 2)
+
+
+class AplicarEstoqueTests(TestCase):
+    def test_aplica_por_conjunto_e_conta_so_o_que_mudou(self):
+        from .models import EstoqueAplicado
+        from .utils import estoque_db
+
+        Produto.objects.create(codigo="C1", nome="igual", estoque=5)
+        c2 = Produto.objects.create(codigo="C2", nome="muda", estoque=0)
+        c3 = Produto.objects.create(codigo="C3", nome="fora do arquivo", estoque=3)
+        Produto.objects.create(codigo="C4", nome="fora, já zerado", estoque=0)
+        sem_codigo = Produto.objects.create(codigo=None, nome="sem código", estoque=2)
+        mp = Produto.objects.create(codigo="MP1", nome="matéria-prima", tipo="materia_prima", estoque=1)
+
+        # mais códigos que o limite de variáveis do SQLite (32766)
+        somas = {f"X{i}": Decimal("1") for i in range(40_000)}
+        somas.update({"C1": Decimal("5"), "C2": Decimal("7.504"), "MP1": Decimal("9")})
+        atualizados, zerados = estoque_db.aplicar(somas, zerar_nao_encontrados=True)
+
+        self.assertEqual(atualizados, [c2.pk])
+        self.assertEqual(sorted(zerados), sorted([c3.pk, sem_codigo.pk]))
+        c2.refresh_from_db()
+        self.assertEqual(c2.estoque, Decimal("7.50"))
+        mp.refresh_from_db()
+        self.assertEqual(mp.estoque, Decimal("1"))
+        self.assertEqual(c2.history.first().history_change_reason, "Upload de estoque")
+        self.assertEqual(c3.history.count(), 2)  # criação + zerado pelo upload
+
+        # mesmo arquivo de novo: nenhum produto gravado e a EstoqueAplicado não é lida no Python
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(estoque_db.aplicar(somas), ([], []))
+        sqls = [q["sql"] for q in ctx.captured_queries]
+        self.assertFalse([q for q in sqls if q.startswith('UPDATE "core_produto"')])
+        self.assertFalse([q for q in sqls if q.startswith('SELECT "core_estoqueaplicado"')])
+
+        # só a peça que mudou no arquivo e a que foi editada à mão desde o último upload
+        Produto.objects.filter(pk=c2.pk).update(estoque=1)
+        somas["C1"] = Decimal("6")
+        del somas["X0"]
+        atualizados, _ = estoque_db.aplicar(somas)
+        self.assertEqual(sorted(atualizados), sorted([c2.pk, Produto.objects.get(codigo="C1").pk]))
+        c2.refresh_from_db()
+        self.assertEqual(c2.estoque, Decimal("7.50"))
+        aplicado = EstoqueAplicado.objects
+        self.assertEqual(aplicado.count(), len(somas))
+        self.assertEqual(aplicado.get(pieza="C1").quantidade, Decimal("6"))
+        self.assertFalse(aplicado.filter(pieza="X0").exists())
+
+
+class HistoricoGeralTests(TestCase):
+    def test_ultima_alteracao_mantida_na_gravacao_e_consulta_unica(self):
+        from .models import UltimaAlteracaoProduto
+        from .utils import estoque_db
+
+        a = Produto.objects.create(codigo="A1", nome="A")
+        b = Produto.objects.create(codigo="B1", nome="B")
+        a.nome = "A alterado"
+        a.save()
+        estoque_db.aplicar({"B1": Decimal("4")})  # histórico em lote (sem sinal)
+        self.assertEqual(
+            dict(UltimaAlteracaoProduto.objects.values_list("produto_id", "acao")), {a.pk: "~", b.pk: "~"}
+        )
+
+        with CaptureQueriesContext(connection) as ctx:
+            linhas = self.client.get("/api/historico-todos/").json()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual([(l["codigo"], l["ultima_acao"]) for l in linhas], [("A1", "Alterado"), ("B1", "Alterado")])
+
+        # páginas na mesma ordem (codigo, id) da lista inteira, inclusive com código vazio
+        Produto.objects.create(codigo=None, nome="Sem código")
+        inteira = self.client.get("/api/historico-todos/").json()
+        paginas, cursor = [], ""
+        while cursor is not None:
+            pagina = self.client.get(f"/api/historico-todos/?page_size=1&cursor={cursor}").json()
+            self.assertLessEqual(len(pagina["results"]), 1)
+            paginas += pagina["results"]
+            cursor = pagina["next_cursor"]
+        self.assertEqual(paginas, inteira)
+        self.assertEqual([l["codigo"] for l in inteira], [None, "A1", "B1"])
+
+        hoje = timezone.localdate()
+        self.assertEqual(len(self.client.get(f"/api/historico-todos/?desde={hoje}&ate={hoje}").json()), 3)
+        self.assertEqual(self.client.get(f"/api/historico-todos/?ate={hoje - timedelta(days=1)}").json(), [])
+        self.assertEqual(self.client.get("/api/historico-todos/?desde=2999-01-01").json(), [])
+        self.assertEqual(self.client.get("/api/historico-todos/?ate=ontem").status_code, 400)
+
+        b.delete()
+        self.assertFalse(UltimaAlteracaoProduto.objects.filter(produto_id=b.pk).exists())
+
+
+class NormalizacaoEstoqueTests(TestCase):
+    def test_booleanos_numeros_e_brancos_por_coluna(self):
+        import pandas as pd
+        from .utils.estoque_loader import _normalize_columns
+
+        bruto = pd.DataFrame({
+            " ORG ": ["SP", "SP", "RJ", " "],
+            "PIEZA": [" P-1", "P-2", "P-3", "P-4"],
+            "Descripción": ["Parafuso", "  ", None, "x"],
+            "REPARABLE": ["+", " Sim ", "talvez", None],
+            "EMPRESTIMO?": [1, 0, 1, 0],
+            "BIS_QTY": ["2,5", " 3 ", " ", 4],
+            "Lead Time": ["30,0", None, "abc", "7"],
+        })
+        df = _normalize_columns(bruto)
+
+        self.assertEqual(df["pieza"].tolist(), ["P-1", "P-2", "P-3"])
+        self.assertEqual(df["descricao"].isna().tolist(), [False, True, True])
+        self.assertEqual(df["reparable"].tolist()[:2], [1.0, 1.0])
+        self.assertTrue(np.isnan(df["reparable"].iloc[2]))
+        self.assertEqual(df["emprestimo"].tolist(), [1.0, 0.0, 1.0])
+        np.testing.assert_array_equal(df["bis_qty"].to_numpy(), [2.5, 3.0, np.nan])
+        np.testing.assert_array_equal(df["lead_time_dias"].to_numpy(), [30.0, np.nan, np.nan])
+
+
+def _xlsx_a_mao(pasta, aba: str, strings: str = "", data1904: bool = False) -> Path:
+    """xlsx mínimo com o XML da aba escrito à mão (o que o openpyxl não gera)."""
+    import zipfile
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    ns_r = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+    pkg = 'xmlns="http://schemas.openxmlformats.org/package/2006/relationships"'
+    tipo = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    ct = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+    partes = {
+        "[Content_Types].xml": (
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{ct}.sheet.main+xml"/>'
+            f'<Override PartName="/xl/worksheets/sheet1.xml" ContentType="{ct}.worksheet+xml"/>'
+            f'<Override PartName="/xl/styles.xml" ContentType="{ct}.styles+xml"/>'
+            f'<Override PartName="/xl/sharedStrings.xml" ContentType="{ct}.sharedStrings+xml"/>'
+            "</Types>"
+        ),
+        "_rels/.rels": f'<Relationships {pkg}><Relationship Id="rId1" Type="{tipo}/officeDocument" Target="xl/workbook.xml"/></Relationships>',
+        "xl/workbook.xml": (
+            f"<workbook {ns} {ns_r}>"
+            + ('<workbookPr date1904="1"/>' if data1904 else "")
+            + '<sheets><sheet name="A" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            f'<Relationships {pkg}>'
+            f'<Relationship Id="rId1" Type="{tipo}/worksheet" Target="worksheets/sheet1.xml"/>'
+            f'<Relationship Id="rId2" Type="{tipo}/styles" Target="styles.xml"/>'
+            f'<Relationship Id="rId3" Type="{tipo}/sharedStrings" Target="sharedStrings.xml"/>'
+            "</Relationships>"
+        ),
+        # estilo 1 = formato de data embutido (14)
+        "xl/styles.xml": (
+            f'<styleSheet {ns}><fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+            '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+            '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            '<cellStyleXfs count="1"><xf numFmtId="0"/></cellStyleXfs>'
+            '<cellXfs count="2"><xf numFmtId="0" xfId="0"/><xf numFmtId="14" xfId="0" applyNumberFormat="1"/></cellXfs>'
+            '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles></styleSheet>'
+        ),
+        "xl/sharedStrings.xml": f"<sst {ns}>{strings}</sst>",
+        "xl/worksheets/sheet1.xml": f"<worksheet {ns}><sheetData>{aba}</sheetData></worksheet>",
+    }
+    caminho = Path(pasta) / "manual.xlsx"
+    with zipfile.ZipFile(caminho, "w") as zf:
+        for nome, xml in partes.items():
+            zf.writestr(nome, '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>' + xml)
+    return caminho
+
+
+class LeituraPlanilhaTests(TestCase):
+    def _compara_com_read_excel(self, aba: str, **kwargs):
+        import pandas as pd
+        from .utils.planilha_leitura import ler_planilha
+
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        caminho = _xlsx_a_mao(pasta.name, aba, **kwargs)
+        df, _ = ler_planilha(caminho)
+        esperado = pd.read_excel(caminho).dropna(how="all").reset_index(drop=True)
+        pd.testing.assert_frame_equal(df, esperado)
+        return df
+
+    def test_xlsx_igual_ao_read_excel_so_com_as_colunas_pedidas(self):
+        import pandas as pd
+        from datetime import datetime
+        from openpyxl import Workbook
+        from .utils.planilha_leitura import ler_planilha
+
+        wb = Workbook()
+        ws = wb.active
+        ws.append([" PIEZA ", "Descrição", "BIS_QTY", "Data", "Ignorada", "Ativo"])
+        ws.append(["P-1", "Parafuso <M8> & cia", 2.5, datetime(2030, 1, 10), "x", True])
+        ws.append(["P-2", None, 3, None, "y", False])
+        ws.append([])
+        ws.append([123, "Porca", "4", datetime(2030, 2, 1, 12, 30), "z", None])
+        caminho = Path(tempfile.mkdtemp()) / "p.xlsx"
+        self.addCleanup(caminho.unlink)
+        wb.save(caminho)
+
+        df, leitura = ler_planilha(caminho, colunas=lambda nome: nome != "Ignorada")
+        esperado = pd.read_excel(caminho).drop(columns=["Ignorada"]).dropna(how="all").reset_index(drop=True)
+        esperado.columns = [c.strip() for c in esperado.columns]
+        pd.testing.assert_frame_equal(df, esperado)
+        self.assertEqual(leitura["linhas"], 3)
+
+    def test_xlsx_strings_inline_e_formatadas(self):
+        strings = (
+            "<si><t>PIEZA</t></si>"
+            "<si><r><t>Para</t></r><r><rPr><b/></rPr><t xml:space=\"preserve\">fuso M8</t></r></si>"
+            "<si><t>Porca</t><rPh sb=\"0\" eb=\"1\"><t>fonética</t></rPh></si>"
+        )
+        aba = (
+            '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="inlineStr"><is><t>Descrição</t></is></c></row>'
+            '<row r="2"><c r="A2" t="s"><v>1</v></c><c r="B2" t="inlineStr"><is><r><t>Aço </t></r><r><t>inox</t></r></is></c></row>'
+            '<row r="3"><c r="A3" t="s"><v>2</v></c><c r="B3" t="inlineStr"><is><t>&lt;M8&gt; &amp; cia</t></is></c></row>'
+        )
+        df = self._compara_com_read_excel(aba, strings=strings)
+        self.assertEqual(df["PIEZA"].tolist(), ["Parafuso M8", "Porca"])
+        self.assertEqual(df["Descrição"].tolist(), ["Aço inox", "<M8> & cia"])
+
+    def test_xlsx_datas_1904(self):
+        from datetime import datetime
+
+        aba = (
+            '<row r="1"><c r="A1" t="inlineStr"><is><t>Data</t></is></c><c r="B1" t="inlineStr"><is><t>Qtd</t></is></c></row>'
+            '<row r="2"><c r="A2" s="1"><v>1</v></c><c r="B2"><v>1</v></c></row>'
+            '<row r="3"><c r="A3" s="1"><v>46000.5</v></c><c r="B3"><v>2.5</v></c></row>'
+        )
+        df = self._compara_com_read_excel(aba, data1904=True)
+        self.assertEqual(df["Data"][0], datetime(1904, 1, 2))
+
+    def test_xlsx_celulas_e_linhas_sem_referencia(self):
+        # sem atributo r (as células seguem na ordem) e linhas com colunas puladas
+        aba = (
+            "<row><c t=\"inlineStr\"><is><t>A</t></is></c><c t=\"inlineStr\"><is><t>B</t></is></c>"
+            "<c t=\"inlineStr\"><is><t>C</t></is></c></row>"
+            "<row><c><v>1</v></c><c><v>2</v></c><c><v>3</v></c></row>"
+            '<row r="4"><c r="C4"><v>9</v></c></row>'
+            '<row r="5"><c r="A5"><v>4</v></c><c><v>5</v></c></row>'
+        )
+        df = self._compara_com_read_excel(aba)
+        self.assertEqual(len(df), 3)
+
+    def test_xlsx_celulas_de_erro(self):
+        aba = (
+            '<row r="1"><c r="A1" t="inlineStr"><is><t>PIEZA</t></is></c><c r="B1" t="inlineStr"><is><t>Qtd</t></is></c></row>'
+            '<row r="2"><c r="A2" t="inlineStr"><is><t>P-1</t></is></c><c r="B2" t="e"><f>1/0</f><v>#DIV/0!</v></c></row>'
+            '<row r="3"><c r="A3" t="inlineStr"><is><t>P-2</t></is></c><c r="B3"><v>4</v></c></row>'
+            '<row r="4"><c r="A4" t="e"><v>#N/A</v></c><c r="B4"><v>5</v></c></row>'
+        )
+        df = self._compara_com_read_excel(aba)
+        self.assertTrue(df["Qtd"].isna()[0])
+
+
+class PedidosCacheTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        settings_ctx = override_settings(
+            PEDIDOS_PATH=Path(self.tmp.name) / "pedidos.xlsx",
+            PEDIDOS_SNAPSHOT_PKL=Path(self.tmp.name) / "pedidos_snapshot.pkl",
+            MEDIA_ROOT=Path(self.tmp.name),
+        )
+        settings_ctx.enable()
+        self.addCleanup(settings_ctx.disable)
+
+    def test_upload_aquece_e_consultas_nao_releem_o_disco(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .utils import pedidos_loader
+
+        csv = b"ORL_ORDER,ORL_PART,ORL_ORDQTY,ORL_RECVQTY,ORL_SUPPLIER\nPO1,C001,10,4,ACME\nPO2,C001,3,0,ACME\n"
+        resp = self.client.post("/api/pedidos/upload/?aguardar=1", {"file": SimpleUploadedFile("pedidos.csv", csv)})
+        self.assertEqual(resp.status_code, 200)
+        antes = pedidos_loader.estatisticas_cache()
+
+        with mock.patch("pandas.read_pickle", side_effect=AssertionError), \
+                mock.patch.object(pedidos_loader.pickle, "load", side_effect=AssertionError):
+            self.assertEqual(pedidos_loader.query(search="acme")[0], 2)
+            self.assertEqual(pedidos_loader.get_snapshot_map(), {"C001": Decimal("9")})
+
+        depois = pedidos_loader.estatisticas_cache()
+        self.assertEqual(depois["df"]["hits"], antes["df"]["hits"] + 1)
+        self.assertEqual(depois["snapshot"]["misses"], antes["snapshot"]["misses"])
+
+        # outro processo regravou o snapshot: carimbo mudou -> recarrega
+        snap = Path(self.tmp.name) / "pedidos_snapshot.pkl"
+        with open(snap, "wb") as fh:
+            pickle.dump({"C001": Decimal("1"), "C002": Decimal("2")}, fh)
+        self.assertEqual(pedidos_loader.get_snapshot_map()["C002"], Decimal("2"))
+        self.assertEqual(pedidos_loader.estatisticas_cache()["snapshot"]["misses"], depois["snapshot"]["misses"] + 1)
+
+    def test_consulta_pelo_arquivo_serializa_por_coluna(self):
+        import json
+        import pandas as pd
+        from .utils import pedidos_loader
+
+        pd.DataFrame({
+            "ORL_ORDER": ["PO1", "PO2", None], "ORL_PART": ["C001", "C002", "C003"],
+            "ORL_ORDQTY": ["10,5", "3", "1"], "ORL_RECVQTY": [4, 0, 1],
+            "ORL_SUPPLIER": ["ACME", None, "ACME"], "ORL_UDFDATE01": ["2030-01-10", None, "2030-02-01"],
+        }).to_csv(Path(self.tmp.name) / "pedidos.csv", index=False)
+        with self.settings(PEDIDOS_PATH=Path(self.tmp.name) / "pedidos.csv"):
+            pedidos_loader.clear_cache()
+            total, linhas = pedidos_loader.query(sort_by="pieza")
+            self.assertEqual(total, 3)
+            self.assertEqual(linhas[0], {
+                "pedido_num": "PO1", "pieza": "C001", "qty": 6.5, "ord_qty": 10.5, "recv_qty": 4.0,
+                "fornecedor": "ACME", "org": "", "data_prevista": "2030-01-10",
+            })
+            self.assertEqual((linhas[1]["fornecedor"], linhas[1]["data_prevista"]), ("", None))
+            self.assertEqual(linhas[2]["pedido_num"], "")
+
+            corpo = pedidos_loader.query_json(sort_by="pieza", limit=2, offset=1)
+            self.assertEqual(json.loads(corpo), {"count": 3, "results": linhas[1:]})
+            resp = self.client.get("/api/pedidos/?sort_by=pieza")
+            self.assertEqual(resp["Content-Type"], "application/json")
+            self.assertEqual(resp.json()["results"], linhas)
+
+    def test_upload_carrega_tabelas_usadas_pelo_mrp_e_pela_consulta(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .models import EmPedidoProduto, PedidoCompra
+        from .utils import mrp_netting
+
+        csv = (
+            b"ORL_ORDER,ORL_PART,ORL_ORDQTY,ORL_RECVQTY,ORL_SUPPLIER,ORL_UDFDATE01\n"
+            b"PO1,C001,10,4,ACME,2030-01-10\nPO2,C001,3,0,ACME,\nPO3,C002,5,5,Outra,2030-02-01\n"
+        )
+        resp = self.client.post("/api/pedidos/upload/?aguardar=1", {"file": SimpleUploadedFile("pedidos.csv", csv)})
+        self.assertEqual(resp.json()["linhas_no_banco"], 3)
+        self.assertEqual(PedidoCompra.objects.filter(pieza="C001").count(), 2)
+        self.assertEqual(EmPedidoProduto.objects.get(pieza="C001").quantidade, Decimal("9"))
+        self.assertEqual(mrp_netting.em_pedido_por_codigo()["C002"], Decimal("0"))
+
+        dados = self.client.get("/api/pedidos/?fornecedor=acme&sort_by=data_prevista&sort_dir=desc").json()
+        self.assertEqual(dados["count"], 2)
+        self.assertEqual([r["data_prevista"] for r in dados["results"]], ["2030-01-10", None])
+        self.assertEqual(self.client.get("/api/pedidos/?prazo_ini=2030-01-15").json()["count"], 1)
+        asc = self.client.get("/api/pedidos/?sort_by=data_prevista").json()["results"]
+        self.assertEqual(asc[-1]["data_prevista"], None)
+
+        # texto pelos índices do DF (id = posição + 1), sem LIKE no banco
+        with CaptureQueriesContext(connection) as ctx:
+            total, linhas = pedidos_db.query(search="o", org="", pieza="c00")
+        self.assertFalse(any("LIKE" in q["sql"] for q in ctx.captured_queries))
+        self.assertEqual(total, 3)
+        self.assertEqual(pedidos_db.query(fornecedor="outra")[1][0]["pedido_num"], "PO3")
+        self.assertEqual(pedidos_db.query(pieza="c001", search="po2")[0], 1)
+
+    def test_upload_em_segundo_plano_informa_fase_pelo_job(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .utils import uploads_async
+
+        csv = b"ORL_ORDER,ORL_PART,ORL_ORDQTY,ORL_RECVQTY,ORL_SUPPLIER\nPO1,C001,10,4,ACME\nPO2,C002,3,0,ACME\n"
+        # o executor roda em outra thread/conexão; aqui executa na hora, na transação do teste
+        with mock.patch.object(uploads_async, "despachar", side_effect=uploads_async.executar) as despachar:
+            resp = self.client.post("/api/pedidos/upload/", {"file": SimpleUploadedFile("pedidos.csv", csv)})
+        self.assertEqual(resp.status_code, 202)
+        despachar.assert_called_once()
+        job = resp.json()["job"]
+        self.assertTrue(resp.json()["status_url"].endswith(f"/api/pedidos/upload/{job}/"))
+
+        status = self.client.get(f"/api/pedidos/upload/{job}/").json()
+        self.assertEqual(status["fase"], "concluido")
+        self.assertEqual(status["linhas_processadas"], 2)
+        self.assertEqual(status["resultado"]["linhas_no_banco"], 2)
+        self.assertEqual(self.client.get(f"/api/estoque/upload/{job}/").status_code, 404)
+        self.assertFalse(any((Path(self.tmp.name) / "uploads").glob("*.csv")))
+
+    def test_job_sem_batimento_vira_erro_no_status(self):
+        from datetime import timedelta
+        from .models import UploadJob
+        from .utils import uploads_async
+
+        vivo = UploadJob.objects.create(tipo="pedidos", arquivo="x.csv", fase="lendo")
+        parado = UploadJob.objects.create(tipo="pedidos", arquivo="y.csv", fase="aplicando")
+        antigo = timezone.now() - timedelta(seconds=uploads_async.LIMITE_SEM_SINAL + 1)
+        UploadJob.objects.filter(pk=parado.pk).update(atualizado_em=antigo)
+
+        self.assertEqual(self.client.get(f"/api/pedidos/upload/{vivo.pk}/").json()["fase"], "lendo")
+        status = self.client.get(f"/api/pedidos/upload/{parado.pk}/").json()
+        self.assertEqual(status["fase"], "erro")
+        self.assertIn("interrompido", status["erro"])
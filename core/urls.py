@@ -11,13 +11,15 @@ from .views import (
     historico_produto,
     historico_todos_os_produtos,
     mrp_detalhado,
+    mrp_fases,
+    mrp_verificar,
     ComponenteViewSet,
     ListaTecnicaViewSet,
 )
 
 from .views import BOMFlatView, BOMFlatXLSXView
 
-from .views_estoque import UploadEstoqueView, ConsultaEstoqueView
+from .views_estoque import UploadEstoqueView, ConsultaEstoqueView, StatusUploadView
 from .views_pedidos import UploadPedidosView, ConsultaPedidosView
 
 
@@ -36,6 +38,8 @@ urlpatterns = [
     # path('api/listas-tecnicas/', criar_lista_tecnica),  # sobrescreve o ViewSet, se houver
     path('api/mrp/', executar_mrp),
     path('api/mrp/detalhado/', mrp_detalhado),
+    path('api/mrp/fases/', mrp_fases),
+    path('api/mrp/verificar/', mrp_verificar),
 
     # Excel
     path('api/mrp/excel/', exportar_mrp_excel),            # novo caminho
@@ -49,9 +53,11 @@ urlpatterns = [
     path('api/historico-todos/', historico_todos_os_produtos),
 
     path("api/estoque/upload/", UploadEstoqueView.as_view(), name="upload-estoque"),
+    path("api/estoque/upload/<uuid:job>/", StatusUploadView.as_view(tipo="estoque"), name="upload-estoque-status"),
     path("api/estoque/", ConsultaEstoqueView.as_view(), name="consulta-estoque"),
 
     path("api/pedidos/upload/", UploadPedidosView.as_view(), name="upload-pedidos"),
+    path("api/pedidos/upload/<uuid:job>/", StatusUploadView.as_view(tipo="pedidos"), name="upload-pedidos-status"),
     path("api/pedidos/",       ConsultaPedidosView.as_view(), name="consulta-pedidos"),
     
 ]
@@ -0,0 +1,121 @@
+# core/utils/bom_busca.py
+"""
+Índice de busca da BOM (SQLite FTS5, tokenizer trigram), criado e
+preenchido pela migration 0016.
+
+Uma linha por BOM (rowid = BOM.id) com os códigos/nomes da lista pai,
+da sublista e do componente e os comentários, separados por quebra de
+linha. ``LIKE '%termo%'`` nessa tabela usa o índice de trigramas e tem a
+mesma semântica do ``icontains`` do Django no SQLite (sem distinção de
+maiúsculas ASCII), sem os três JOINs por linha.
+
+Mantido pelos signals de BOM, Produto e ListaTecnica (core/signals.py).
+Em outro banco (ou SQLite sem FTS5) o filtro volta para os ``icontains``.
+"""
+from __future__ import annotations
+from typing import Dict, Iterable
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+from ..models import BOM, ListaTecnica, Produto
+
+TABELA = "core_bom_busca"
+
+CAMPOS_ICONTAINS = (
+    "lista_pai__codigo", "lista_pai__nome",
+    "sublista__codigo", "sublista__nome",
+    "componente__codigo", "componente__nome",
+    "comentarios",
+)
+
+_disponivel: Dict[str, bool] = {}
+
+
+def disponivel() -> bool:
+    chave = f"{connection.alias}:{connection.settings_dict.get('NAME')}"
+    if chave not in _disponivel:
+        ok = False
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cur:
+                cur.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [TABELA])
+                ok = cur.fetchone() is not None
+        _disponivel[chave] = ok
+    return _disponivel[chave]
+
+
+def _texto_sql() -> str:
+    sep = " || char(10) || "
+    return sep.join(
+        f"coalesce({c}, '')"
+        for c in ("lp.codigo", "lp.nome", "sl.codigo", "sl.nome", "p.codigo", "p.nome", "b.comentarios")
+    )
+
+
+def reindexar(where: str = "", params: Iterable = ()) -> None:
+    """
+    Regrava as linhas do índice das BOMs que atendem ``where`` (SQL sobre
+    ``b`` = core_bom) num único INSERT ... SELECT. Sem ``where``: todas.
+    """
+    if not disponivel():
+        return
+    params = list(params)
+    bom, lista, produto = BOM._meta.db_table, ListaTecnica._meta.db_table, Produto._meta.db_table
+    filtro = f"WHERE {where}" if where else ""
+    with connection.cursor() as cur:
+        if where:
+            cur.execute(f"DELETE FROM {TABELA} WHERE rowid IN (SELECT b.id FROM {bom} b {filtro})", params)
+        else:
+            cur.execute(f"DELETE FROM {TABELA}")
+        cur.execute(
+            f"INSERT INTO {TABELA}(rowid, texto) "
+            f"SELECT b.id, {_texto_sql()} FROM {bom} b "
+            f"JOIN {lista} lp ON lp.id = b.lista_pai_id "
+            f"LEFT JOIN {lista} sl ON sl.id = b.sublista_id "
+            f"LEFT JOIN {produto} p ON p.id = b.componente_id "
+            f"{filtro}",
+            params,
+        )
+
+
+def remover(bom_id: int) -> None:
+    if disponivel():
+        with connection.cursor() as cur:
+            cur.execute(f"DELETE FROM {TABELA} WHERE rowid = %s", [bom_id])
+
+
+def _padrao_like(termo: str) -> str:
+    termo = termo.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{termo}%"
+
+
+def filtrar(qs, busca: str, por_termo: bool = False):
+    """
+    Filtra um queryset de BOM pelo texto. ``por_termo``: cada palavra
+    precisa aparecer (como no SearchFilter/admin); senão o texto inteiro.
+    """
+    termos = busca.split() if por_termo else [busca.strip()]
+    for termo in termos:
+        if not termo:
+            continue
+        if disponivel():
+            qs = qs.filter(pk__in=RawSQL(
+                f"SELECT rowid FROM {TABELA} WHERE texto LIKE %s ESCAPE '\\'", [_padrao_like(termo)]
+            ))
+        else:
+            q = Q()
+            for campo in CAMPOS_ICONTAINS:
+                q |= Q(**{f"{campo}__icontains": termo})
+            qs = qs.filter(q)
+    return qs
+
+
+class BuscaBOMFilter(filters.SearchFilter):
+    """SearchFilter do BOMViewSet usando o índice (mesmo ?search=, termos em AND)."""
+
+    def filter_queryset(self, request, queryset, view):
+        for termo in self.get_search_terms(request):
+            queryset = filtrar(queryset, termo)
+        return queryset
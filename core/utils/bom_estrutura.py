@@ -0,0 +1,176 @@
+# core/utils/bom_estrutura.py
+"""
+Estrutura de produto (BOM) carregada inteira em memória.
+
+Em vez de consultar ``BOM.objects.filter(lista_pai=...)`` a cada nó da
+árvore, carrega todas as linhas de BOM, Listas Técnicas e Produtos em um
+número fixo de consultas e indexa os filhos por ``lista_pai_id``.
+A explosão detalhada (/api/mrp/detalhado/ e exportações) e a BOM
+achatada (ver necessidade_unitaria.py) caminham só por esse índice.
+"""
+from __future__ import annotations
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from ..models import BOM, ListaTecnica, Produto
+from .bom_grafo import CicloBOMError
+
+PCT = Decimal("100")
+
+
+@dataclass(frozen=True)
+class ItemBOM:
+    id: int
+    lista_pai_id: int
+    componente_id: Optional[int]
+    sublista_id: Optional[int]
+    # quantidade POR UNIDADE já ponderada: quantidade * ponderação / 100
+    qpond_unidade: Decimal
+
+
+@dataclass(frozen=True)
+class NoLista:
+    id: int
+    codigo: str
+    nome: str
+
+
+@dataclass(frozen=True)
+class NoProduto:
+    id: int
+    codigo: str
+    nome: str
+    estoque: Decimal
+    lead_time: int
+    tipo: str
+
+
+def _qpond_unidade(quantidade, ponderacao) -> Decimal:
+    # Ponderação correta (None→100, 0→0)
+    p = Decimal(100 if ponderacao is None else ponderacao)
+    return (Decimal(quantidade or 0) * p) / PCT
+
+
+@dataclass
+class EstruturaBOM:
+    filhos: Dict[int, List[ItemBOM]]
+    listas: Dict[int, NoLista]
+    produtos: Dict[int, NoProduto]
+
+    @classmethod
+    def carregar(cls) -> "EstruturaBOM":
+        """Carrega BOM + Listas + Produtos usados em BOM (3 consultas, sempre)."""
+        filhos: Dict[int, List[ItemBOM]] = defaultdict(list)
+        campos_bom = ("id", "lista_pai_id", "componente_id", "sublista_id",
+                      "quantidade", "ponderacao_operacao")
+        for (bom_id, lista_pai_id, componente_id, sublista_id,
+             quantidade, ponderacao) in BOM.objects.order_by("id").values_list(*campos_bom):
+            filhos[lista_pai_id].append(ItemBOM(
+                id=bom_id,
+                lista_pai_id=lista_pai_id,
+                componente_id=componente_id,
+                sublista_id=sublista_id,
+                qpond_unidade=_qpond_unidade(quantidade, ponderacao),
+            ))
+
+        listas = {
+            lid: NoLista(id=lid, codigo=codigo or "", nome=nome or "")
+            for lid, codigo, nome in ListaTecnica.objects.values_list("id", "codigo", "nome")
+        }
+
+        produtos = {}
+        usados = Produto.objects.filter(
+            id__in=BOM.objects.filter(componente__isnull=False).values("componente_id")
+        )
+        for pid, codigo, nome, estoque, lead_time, tipo in usados.values_list(
+            "id", "codigo", "nome", "estoque", "lead_time", "tipo"
+        ):
+            produtos[pid] = NoProduto(
+                id=pid,
+                codigo=codigo or "",
+                nome=nome or "",
+                estoque=Decimal(estoque or 0),
+                lead_time=int(lead_time or 0),
+                tipo=tipo or "componente",
+            )
+
+        return cls(filhos=dict(filhos), listas=listas, produtos=produtos)
+
+    def itens(self, lista_id: int) -> List[ItemBOM]:
+        return self.filhos.get(lista_id, [])
+
+
+# =========================
+# Explosão detalhada (mesmo formato de saída das views)
+# =========================
+
+def percorrer(estrutura: EstruturaBOM, lista_id, multiplicador):
+    """
+    Cada ocorrência de componente abaixo de ``lista_id``, na ordem da DFS:
+    (NoProduto, multiplicador do pai, qtd por unidade ponderada, qtd total).
+    Pilha explícita; levanta CicloBOMError se uma sublista voltar para uma
+    lista do caminho.
+    """
+    pilha = [(iter(estrutura.itens(lista_id)), multiplicador)]
+    caminho = [lista_id]
+    while pilha:
+        itens, mult = pilha[-1]
+        item = next(itens, None)
+        if item is None:
+            pilha.pop()
+            caminho.pop()
+            continue
+
+        qpond_unidade = item.qpond_unidade
+
+        # se 0%, não propaga e não gera linha
+        if qpond_unidade == 0:
+            continue
+
+        qtd_total = qpond_unidade * (Decimal(mult or 1))
+
+        if item.componente_id is not None:
+            yield estrutura.produtos[item.componente_id], mult, qpond_unidade, qtd_total
+
+        elif item.sublista_id is not None:
+            if item.sublista_id in caminho:
+                raise CicloBOMError(caminho[caminho.index(item.sublista_id):] + [item.sublista_id])
+            # desce usando a QUANTIDADE PONDERADA como multiplicador
+            pilha.append((iter(estrutura.itens(item.sublista_id)), qtd_total))
+            caminho.append(item.sublista_id)
+
+
+def adicionar_detalhes(estrutura: EstruturaBOM, lista_id, multiplicador, acumulado,
+                       ordem_id, lista_final_nome):
+    """
+    Necessidade por componente com o detalhe de cada OP (formato de /api/mrp/detalhado/).
+    Percorre a árvore com ``percorrer`` (mesma ordem da DFS recursiva).
+    """
+    for comp, mult, qpond_unidade, qtd_total in percorrer(estrutura, lista_id, multiplicador):
+        comp_id = comp.id
+        if comp_id not in acumulado:
+            acumulado[comp_id] = {
+                "id": comp_id,
+                "produto_id": comp_id,
+                "codigo": comp.codigo,
+                "nome": comp.nome,
+                "necessario": Decimal(0),
+                "em_estoque": comp.estoque,
+                "faltando": Decimal(0),
+                "lead_time": comp.lead_time,
+                "detalhes": [],
+            }
+
+        # "faltando" é calculado depois, em lote (mrp_netting.liquidar_acumulado)
+        acumulado[comp_id]["necessario"] += qtd_total
+
+        acumulado[comp_id]["detalhes"].append({
+            "ordem_producao": ordem_id,
+            "produto_final": lista_final_nome,
+            "qtd_produto": mult,
+            # quantidade POR UNIDADE já ponderada
+            "qtd_componente_por_unidade": qpond_unidade,
+            "qtd_necessaria": qtd_total,
+        })
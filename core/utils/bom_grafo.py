@@ -0,0 +1,122 @@
+# core/utils/bom_grafo.py
+"""
+Grafo Lista -> Sublista da BOM, sem recursão.
+
+  - ``ciclo_ao_incluir``: recusa (em BOM.clean / BOMSerializer) a linha cuja
+    sublista alcança a própria lista pai, antes de gravar;
+  - ``ordem_topologica``: listas de cima para baixo (pais antes dos filhos),
+    usada para achatar/explodir a BOM iterativamente.
+"""
+from __future__ import annotations
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Set
+
+from ..models import BOM, ListaTecnica
+
+
+class CicloBOMError(ValueError):
+    """A estrutura tem uma sublista que volta para uma lista acima dela."""
+
+    def __init__(self, caminho: List[int]):
+        self.caminho = caminho
+        super().__init__("Ciclo na BOM: " + " -> ".join(str(lid) for lid in caminho))
+
+
+def sublistas_por_lista(filhos) -> Dict[int, List[int]]:
+    """{lista_pai_id: [sublista_id, ...]} a partir de ``EstruturaBOM.filhos``."""
+    sub_de: Dict[int, List[int]] = defaultdict(list)
+    for pai_id, itens in filhos.items():
+        for item in itens:
+            if item.sublista_id is not None:
+                sub_de[pai_id].append(item.sublista_id)
+    return sub_de
+
+
+def caminho(sub_de: Dict[int, Iterable[int]], origem: int, destino: int) -> Optional[List[int]]:
+    """Caminho origem -> destino descendo por sublistas (BFS), ou None."""
+    anterior: Dict[int, Optional[int]] = {origem: None}
+    fila = deque([origem])
+    while fila:
+        atual = fila.popleft()
+        if atual == destino:
+            out = []
+            while atual is not None:
+                out.append(atual)
+                atual = anterior[atual]
+            return out[::-1]
+        for sub in sub_de.get(atual, ()):
+            if sub not in anterior:
+                anterior[sub] = atual
+                fila.append(sub)
+    return None
+
+
+def ciclo_ao_incluir(lista_pai_id: int, sublista_id: int,
+                     ignorar_bom_id: Optional[int] = None) -> Optional[List[int]]:
+    """
+    Ciclo que a linha (lista_pai -> sublista) criaria, ou None.
+    ``ignorar_bom_id``: a própria linha, quando é uma edição.
+    """
+    if lista_pai_id is None or sublista_id is None:
+        return None
+    if lista_pai_id == sublista_id:
+        return [lista_pai_id, sublista_id]
+
+    arestas = BOM.objects.filter(sublista__isnull=False)
+    if ignorar_bom_id is not None:
+        arestas = arestas.exclude(pk=ignorar_bom_id)
+    sub_de: Dict[int, List[int]] = defaultdict(list)
+    for pai_id, sub_id in arestas.values_list("lista_pai_id", "sublista_id"):
+        sub_de[pai_id].append(sub_id)
+
+    volta = caminho(sub_de, sublista_id, lista_pai_id)
+    return [lista_pai_id] + volta if volta else None
+
+
+def descrever_ciclo(ciclo: List[int]) -> str:
+    nomes = dict(ListaTecnica.objects.filter(id__in=ciclo).values_list("id", "nome"))
+    return "A sublista cria um ciclo na estrutura: " + " -> ".join(nomes.get(i, str(i)) for i in ciclo)
+
+
+def ordem_topologica(sub_de: Dict[int, Iterable[int]], listas: Iterable[int]) -> List[int]:
+    """Listas com os pais antes dos filhos (Kahn). Levanta CicloBOMError se houver ciclo."""
+    nos = set(listas)
+    for pai_id, subs in sub_de.items():
+        nos.add(pai_id)
+        nos.update(subs)
+
+    entradas: Dict[int, int] = {lid: 0 for lid in nos}
+    for subs in sub_de.values():
+        for sub in subs:
+            entradas[sub] += 1
+
+    fila = deque(sorted(lid for lid, n in entradas.items() if n == 0))
+    ordem: List[int] = []
+    while fila:
+        atual = fila.popleft()
+        ordem.append(atual)
+        for sub in sub_de.get(atual, ()):
+            entradas[sub] -= 1
+            if entradas[sub] == 0:
+                fila.append(sub)
+
+    if len(ordem) < len(nos):
+        raise CicloBOMError(_algum_ciclo(sub_de, {lid for lid, n in entradas.items() if n > 0}))
+    return ordem
+
+
+def _algum_ciclo(sub_de: Dict[int, Iterable[int]], restantes: Set[int]) -> List[int]:
+    # todo nó que sobrou no Kahn tem um pai também no ciclo: segue até repetir
+    pais_de: Dict[int, int] = {}
+    for pai_id, subs in sub_de.items():
+        if pai_id in restantes:
+            for sub in subs:
+                if sub in restantes:
+                    pais_de.setdefault(sub, pai_id)
+    atual = min(restantes)
+    visitados: List[int] = []
+    while atual not in visitados:
+        visitados.append(atual)
+        atual = pais_de[atual]
+    ciclo = visitados[visitados.index(atual):][::-1]
+    return ciclo + [ciclo[0]]
@@ -0,0 +1,194 @@
+# core/utils/estoque_colunar.py
+"""
+Posição de estoque em formato colunar, gravada como um conjunto de .npy.
+
+  - colunas de texto: codificadas por dicionário (``<col>.codigos.npy``
+    int32, -1 = vazio, + ``<col>.valores.npy`` com os valores distintos);
+  - colunas numéricas (quantidades, preços, níveis...): float64 com NaN.
+
+Os arquivos são abertos com ``np.load(mmap_mode="r")``: todos os workers
+compartilham as mesmas páginas do cache do SO e a partida a frio não
+precisa desserializar nada. Filtros de texto rodam sobre o dicionário
+(valores distintos) e são expandidos para as linhas pelos códigos; as
+colunas de busca ganham ainda um índice de trigramas (indice_texto.py).
+"""
+from __future__ import annotations
+import json
+import os
+import shutil
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .indice_texto import IndiceTexto
+
+VERSAO_FORMATO = 2
+
+# tudo que não for texto vira float64 (NaN = vazio)
+COLUNAS_NUMERICAS = {
+    "preco_medio", "total_valor_almacen", "nivel_imax", "nivel_rol", "nivel_qtdoc",
+    "nivel_imin", "bis_qty", "lead_time_dias", "reparable", "emprestimo",
+}
+
+
+@dataclass
+class EstoqueColunar:
+    n: int
+    colunas: List[str]
+    numericas: Dict[str, np.ndarray] = field(default_factory=dict)
+    codigos: Dict[str, np.ndarray] = field(default_factory=dict)
+    valores: Dict[str, np.ndarray] = field(default_factory=dict)
+    meta: dict = field(default_factory=dict)
+    indices: Dict[str, IndiceTexto] = field(default_factory=dict)
+    _minusculas: Dict[str, np.ndarray] = field(default_factory=dict, repr=False)
+
+    # ---------- construção ----------
+    @classmethod
+    def de_dataframe(cls, df: pd.DataFrame, meta: Optional[dict] = None) -> "EstoqueColunar":
+        store = cls(n=len(df), colunas=[str(c) for c in df.columns], meta=dict(meta or {}))
+        for col in store.colunas:
+            serie = df[col]
+            if col in COLUNAS_NUMERICAS or pd.api.types.is_bool_dtype(serie) \
+                    or (pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_object_dtype(serie)):
+                store.numericas[col] = pd.to_numeric(serie, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+                continue
+            vazio = serie.isna().to_numpy()
+            texto = serie.astype(str).where(~vazio, None)
+            codigos, valores = pd.factorize(texto, use_na_sentinel=True)
+            store.codigos[col] = codigos.astype(np.int32)
+            store.valores[col] = np.asarray(valores, dtype=str) if len(valores) else np.array([], dtype="<U1")
+        return store
+
+    def indexar(self, colunas) -> None:
+        for col in colunas:
+            if col in self.codigos:
+                self.indices[col] = IndiceTexto.montar(self.codigos[col], self.valores[col])
+
+    def para_dataframe(self, colunas: Optional[List[str]] = None) -> pd.DataFrame:
+        colunas = colunas or self.colunas
+        return pd.DataFrame({c: self.coluna(c) for c in colunas}, columns=colunas)
+
+    # ---------- persistência ----------
+    def salvar(self, destino: Path) -> None:
+        """Grava num diretório temporário e troca de uma vez (leitores veem o antigo ou o novo)."""
+        destino = Path(destino)
+        tmp = destino.with_name(f".{destino.name}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        for i, col in enumerate(self.colunas):
+            nome = _arquivo(i, col)
+            if col in self.numericas:
+                np.save(tmp / f"{nome}.npy", self.numericas[col], allow_pickle=False)
+            else:
+                np.save(tmp / f"{nome}.codigos.npy", self.codigos[col], allow_pickle=False)
+                np.save(tmp / f"{nome}.valores.npy", self.valores[col], allow_pickle=False)
+                if col in self.indices:
+                    self.indices[col].salvar(tmp, f"{nome}.idx")
+        meta = {
+            **self.meta,
+            "versao_formato": VERSAO_FORMATO,
+            "n": self.n,
+            "colunas": self.colunas,
+            "numericas": list(self.numericas),
+            "indexadas": list(self.indices),
+        }
+        (tmp / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+        antigo = destino.with_name(f".{destino.name}.{os.getpid()}.old")
+        if destino.exists():
+            os.replace(destino, antigo)
+        os.replace(tmp, destino)
+        # mapeamentos já abertos do antigo continuam válidos (arquivo só some ao fechar)
+        shutil.rmtree(antigo, ignore_errors=True)
+
+    @classmethod
+    def abrir(cls, origem: Path, mmap: bool = True) -> "EstoqueColunar":
+        origem = Path(origem)
+        meta = json.loads((origem / "meta.json").read_text(encoding="utf-8"))
+        if meta.get("versao_formato") != VERSAO_FORMATO:
+            raise ValueError("Formato colunar do estoque desatualizado.")
+        modo = "r" if mmap else None
+        store = cls(n=meta["n"], colunas=meta["colunas"], meta=meta)
+        numericas = set(meta["numericas"])
+        for i, col in enumerate(meta["colunas"]):
+            nome = _arquivo(i, col)
+            if col in numericas:
+                store.numericas[col] = np.load(origem / f"{nome}.npy", mmap_mode=modo, allow_pickle=False)
+            else:
+                store.codigos[col] = np.load(origem / f"{nome}.codigos.npy", mmap_mode=modo, allow_pickle=False)
+                # o dicionário é pequeno: fica em memória (lower/argsort precisam dele inteiro)
+                store.valores[col] = np.load(origem / f"{nome}.valores.npy", allow_pickle=False)
+                if col in meta["indexadas"]:
+                    store.indices[col] = IndiceTexto.abrir(origem, f"{nome}.idx")
+        return store
+
+    # ---------- leitura ----------
+    def __len__(self):
+        return self.n
+
+    def __contains__(self, col) -> bool:
+        return col in self.numericas or col in self.codigos
+
+    def coluna(self, col: str, idx: Optional[np.ndarray] = None) -> np.ndarray:
+        """Valores da coluna (texto como object com None nos vazios), opcionalmente só das linhas ``idx``."""
+        if col in self.numericas:
+            arr = self.numericas[col]
+            return np.asarray(arr if idx is None else arr[idx])
+        cod = self.codigos[col] if idx is None else self.codigos[col][idx]
+        cod = np.asarray(cod)
+        dicionario = np.append(np.asarray(self.valores[col], dtype=object), None)
+        return dicionario[cod]  # -1 cai no None do fim
+
+    def contem(self, col: str, termo: str) -> np.ndarray:
+        """Máscara das linhas cujo texto contém ``termo`` (sem distinção de maiúsculas)."""
+        if col not in self.codigos:
+            return np.zeros(self.n, dtype=bool)
+        if col not in self._minusculas:
+            self._minusculas[col] = np.char.lower(np.asarray(self.valores[col]))
+        casa = np.char.find(self._minusculas[col], termo.lower()) >= 0
+        casa = np.append(casa, False)  # código -1 (vazio) nunca casa
+        return casa[np.asarray(self.codigos[col])]
+
+    def linhas_com(self, col: str, termo: str) -> np.ndarray:
+        """Linhas (ordenadas) cujo texto contém ``termo``; usa o índice se a coluna tiver."""
+        if col in self.indices:
+            return self.indices[col].linhas_com(termo)
+        return np.flatnonzero(self.contem(col, termo))
+
+    def ordem(self, col: str, idx: np.ndarray, decrescente: bool = False) -> np.ndarray:
+        """``idx`` ordenado pela coluna; vazios sempre no fim (como o sort_values do pandas)."""
+        if col in self.numericas:
+            chave = np.asarray(self.numericas[col])[idx]
+            vazio = np.isnan(chave)
+        else:
+            # posição de cada valor distinto na ordem alfabética
+            rank = np.empty(len(self.valores[col]), dtype=np.int64)
+            rank[np.argsort(np.asarray(self.valores[col]), kind="stable")] = np.arange(len(rank))
+            cod = np.asarray(self.codigos[col])[idx]
+            vazio = cod < 0
+            chave = np.where(vazio, 0, rank[np.maximum(cod, 0)]).astype(np.float64)
+        if decrescente:
+            chave = -chave
+        ordem = np.lexsort((chave, vazio))  # vazio é a chave primária
+        return idx[ordem]
+
+    def registros(self, idx: np.ndarray, colunas: List[str]) -> List[dict]:
+        """Linhas ``idx`` como dicts prontos para JSON (vazio -> "")."""
+        dados = {}
+        for col in colunas:
+            valores = self.coluna(col, idx)
+            if col in self.numericas:
+                dados[col] = ["" if v != v else float(v) for v in valores.tolist()]
+            else:
+                dados[col] = ["" if v is None else v for v in valores.tolist()]
+        return [dict(zip(colunas, linha)) for linha in zip(*(dados[c] for c in colunas))] if colunas else []
+
+
+def _arquivo(i: int, col: str) -> str:
+    # colunas vindas da planilha podem ter espaços/acentos: o índice evita colisões
+    limpo = "".join(ch if ch.isascii() and (ch.isalnum() or ch == "_") else "_" for ch in col)
+    return f"{i:03d}_{limpo[:40]}"
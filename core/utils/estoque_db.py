@@ -0,0 +1,104 @@
+# core/utils/estoque_db.py
+"""
+Aplicação do estoque do upload em ``Produto.estoque``, por conjunto e só
+no que mudou.
+
+``EstoqueAplicado`` guarda as somas por peça do último upload aplicado. O
+arquivo inteiro vai para a tabela temporária (inserida em lotes, dois
+parâmetros por linha: não esbarra no limite de variáveis do SQLite, ao
+contrário de ``codigo__in=[...]``) e o banco faz o resto com junções nela:
+  - UPDATE dos componentes cujo estoque difere do arquivo: peças cuja soma
+    mudou, que entraram no arquivo ou cujo componente diverge do que foi
+    aplicado (editado à mão ou cadastrado depois do último upload);
+  - ``EstoqueAplicado`` passa a ser o arquivo: apaga as peças que saíram,
+    corrige as que mudaram e insere as novas;
+  - se pedido, um UPDATE que zera os componentes que não vieram no arquivo.
+Nada da ``EstoqueAplicado`` é lido no Python. Os ids alterados voltam (o
+MRP re-liquida só eles) e ganham o registro de histórico em lote na mesma
+transação, já que o UPDATE direto não passa pelos sinais do simple_history.
+"""
+from __future__ import annotations
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+from django.db import connection, transaction
+
+from ..models import EstoqueAplicado, Produto
+from . import historico_resumo
+
+TABELA = "estoque_upload_tmp"
+LOTE = 5000
+LOTE_HISTORICO = 500
+MOTIVO_HISTORICO = "Upload de estoque"
+
+
+def _ids(cur, sql: str) -> List:
+    cur.execute(sql)
+    return [r[0] for r in cur.fetchall()]
+
+
+def _historico(ids: List[int]) -> None:
+    for i in range(0, len(ids), LOTE_HISTORICO):
+        objs = list(Produto.objects.filter(pk__in=ids[i:i + LOTE_HISTORICO]))
+        registros = Produto.history.bulk_history_create(objs, update=True, default_change_reason=MOTIVO_HISTORICO)
+        historico_resumo.registrar(registros)  # bulk_history_create não emite o sinal
+
+
+def aplicar(
+    somas: Dict[str, Decimal], zerar_nao_encontrados: bool = False
+) -> Tuple[List[int], List[int]]:
+    """
+    Grava ``somas`` em ``Produto.estoque`` (só componentes). Devolve
+    (ids atualizados, ids zerados), apenas dos que tinham valor diferente.
+    """
+    produto = connection.ops.quote_name(Produto._meta.db_table)
+    aplicado = connection.ops.quote_name(EstoqueAplicado._meta.db_table)
+    # mesma escala que o campo devolve na leitura: 2,567 gravado volta 2,57
+    escala = Decimal(1).scaleb(-Produto._meta.get_field("estoque").decimal_places)
+    linhas = [(codigo, str(qtd.quantize(escala))) for codigo, qtd in somas.items()]
+
+    componente = f"LOWER({produto}.tipo) = 'componente'"
+    mudou = (
+        f"{componente} AND EXISTS (SELECT 1 FROM {TABELA} t WHERE t.codigo = {produto}.codigo "
+        f"AND t.qtd <> {produto}.estoque)"
+    )
+    sobra = (
+        f"{componente} AND {produto}.estoque <> 0 "
+        f"AND NOT EXISTS (SELECT 1 FROM {aplicado} e WHERE e.pieza = {produto}.codigo)"
+    )
+
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {TABELA}")
+        cur.execute(f"CREATE TEMP TABLE {TABELA} (codigo VARCHAR(50) PRIMARY KEY, qtd DECIMAL(14, 2) NOT NULL)")
+        try:
+            for i in range(0, len(linhas), LOTE):
+                cur.executemany(f"INSERT INTO {TABELA} (codigo, qtd) VALUES (%s, %s)", linhas[i:i + LOTE])
+
+            atualizados = _ids(cur, f"SELECT id FROM {produto} WHERE {mudou}")
+            if atualizados:
+                cur.execute(
+                    f"UPDATE {produto} SET estoque = "
+                    f"(SELECT t.qtd FROM {TABELA} t WHERE t.codigo = {produto}.codigo) WHERE {mudou}"
+                )
+
+            # EstoqueAplicado passa a ser o arquivo novo: saíram, mudaram, entraram
+            cur.execute(f"DELETE FROM {aplicado} WHERE NOT EXISTS (SELECT 1 FROM {TABELA} t WHERE t.codigo = pieza)")
+            cur.execute(
+                f"UPDATE {aplicado} SET quantidade = (SELECT t.qtd FROM {TABELA} t WHERE t.codigo = pieza) "
+                f"WHERE EXISTS (SELECT 1 FROM {TABELA} t WHERE t.codigo = pieza AND t.qtd <> quantidade)"
+            )
+            cur.execute(
+                f"INSERT INTO {aplicado} (pieza, quantidade) SELECT t.codigo, t.qtd FROM {TABELA} t "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {aplicado} e WHERE e.pieza = t.codigo)"
+            )
+
+            zerados = []
+            if zerar_nao_encontrados:
+                zerados = _ids(cur, f"SELECT id FROM {produto} WHERE {sobra}")
+                if zerados:
+                    cur.execute(f"UPDATE {produto} SET estoque = 0 WHERE {sobra}")
+        finally:
+            cur.execute(f"DROP TABLE IF EXISTS {TABELA}")
+
+        _historico(atualizados + zerados)
+    return atualizados, zerados
@@ -1,25 +1,61 @@
 from __future__ import annotations
-import time
+import os
+import shutil
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, List, Dict, Any
 
+import numpy as np
 import pandas as pd
 from pandas import NA
 from django.conf import settings
 
+from .estoque_colunar import EstoqueColunar
+from .planilha_leitura import ler_planilha
+from .trava_arquivo import trava_arquivo
+
 # --- Config ---
 ESTOQUE_PATH: Path = getattr(settings, "ESTOQUE_PATH", settings.MEDIA_ROOT / "estoque" / "posicao_estoque.xlsx")
-CACHE_TTL_SECONDS = 300  # recarrega no máximo a cada 60s, e tbm quando o arquivo muda
 
-PKL_PATH = ESTOQUE_PATH.with_suffix(".pkl")
+RENOMEAR = {
+    "Almacen / Warehouse": "warehouse",
+    "Descripción": "descricao",
+    "REPARABLE": "reparable",
+    "USO": "uso",
+    "PAR_UDFCHAR30": "bloqueio_compras",
+    "CODIGOCOMUM_PAR_UDFCHAR16": "codigo_comum",
+    "CODIGOCLIENTE_PAR_UDFCHAR01": "codigo_cliente",
+    "Lead Time": "lead_time_dias",
+    "FORNECEDORAUTOMATIC": "fornecedor_automatico",
+    "Preço Médio": "preco_medio",
+    "TOTAL Valor almacen": "total_valor_almacen",
+    "NIVEL_IMAX": "nivel_imax",
+    "NIVEL_ROL": "nivel_rol",
+    "NIVEL_QTDOC": "nivel_qtdoc",
+    "NIVEL_IMIN": "nivel_imin",
+    "Classificação": "classificacao",
+    "FAMILIA": "familia",
+    "BIS_BIN": "bis_bin",
+    "BIS_QTY": "bis_qty",
+    "PAR_CODE_EXPLICIT": "par_code_explicit",
+    "PAR_ORG_EXPLICIT": "par_org_explicit",
+    "EMPRESTIMO?": "emprestimo",
+    "BLOQUEIO_REPOSICAO": "bloqueio_reposicao",
+    "BLOQUEIO_REPOSICAO_OLD": "bloqueio_reposicao_old",
+}
+
+# únicas colunas lidas da planilha
+COLUNAS_LIDAS = {"ORG", "PIEZA", *RENOMEAR}
+
+# colunas com índice de trigramas (filtros e ?search=)
+COLUNAS_BUSCA = ["pieza", "org", "warehouse", "descricao", "familia", "codigo_cliente"]
 
 
 @dataclass
 class _Cache:
-    df: Optional[pd.DataFrame] = None
+    store: Optional[EstoqueColunar] = None
+    geracao: int = -1
     mtime: float = 0.0
-    loaded_at: float = 0.0
 
 _cache = _Cache()
 
@@ -32,41 +68,66 @@ def _file_mtime(path: Path) -> float:
 import pandas as pd
 from pandas import NA
 
+# texto booleano -> 1/0 (o que não estiver aqui vira vazio)
+BOOLEANOS = {
+    **dict.fromkeys(["+", "1", "true", "sim", "s", "y", "yes"], 1.0),
+    **dict.fromkeys(["-", "0", "false", "nao", "não", "n", "no"], 0.0),
+}
+COLUNAS_BOOL = ["reparable", "emprestimo"]
+COLUNAS_NUM = [
+    "preco_medio", "total_valor_almacen", "nivel_imax", "nivel_rol",
+    "nivel_qtdoc", "nivel_imin", "bis_qty", "lead_time_dias",
+]
+
+
+def _booleano(s: pd.Series) -> pd.Series:
+    """
+    Tabela de consulta sobre os valores distintos: a coluna tem poucos
+    ("+", "-", "Sim"...), então só eles passam por strip/lower e as
+    linhas pegam o resultado pelo código.
+    """
+    if pd.api.types.is_numeric_dtype(s):
+        return s.where(s.isin([0, 1])).astype("float64")
+    codigos, valores = pd.factorize(s, use_na_sentinel=True)
+    tabela = pd.Index(valores).astype(str).str.strip().str.lower().map(BOOLEANOS).to_numpy("float64", na_value=np.nan)
+    return pd.Series(np.append(tabela, np.nan)[codigos], index=s.index)  # código -1 (vazio) -> último = NaN
+
+
+def _numero(s: pd.Series) -> pd.Series:
+    """
+    Numérico (float) pela mesma tabela de consulta: cada valor distinto é
+    convertido uma vez só (vírgula decimal -> ponto, espaços nas pontas e
+    brancos tratados pelo ``to_numeric``) e as linhas pegam pelo código.
+    """
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return s.astype("float64")
+    codigos, valores = pd.factorize(s, use_na_sentinel=True)
+    texto = pd.Series(np.asarray(valores, dtype=object))
+    virgula = texto.str.contains(",", regex=False).eq(True).to_numpy()  # não-texto -> False
+    if virgula.any():
+        texto[virgula] = texto[virgula].str.replace(",", ".", regex=False)
+    tabela = pd.to_numeric(texto, errors="coerce").to_numpy("float64", na_value=np.nan)
+    return pd.Series(np.append(tabela, np.nan)[codigos], index=s.index)
+
+
+def _sem_brancos(s: pd.Series) -> pd.Series:
+    """Texto vazio ou só espaços -> NA (só em colunas de texto)."""
+    branco = s.str.isspace().eq(True) | s.eq("")
+    return s.mask(branco, NA) if branco.any() else s
+
+
 def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    """
+    Padroniza o DF lido da planilha. Coluna a coluna e sem cópia do frame
+    inteiro: ``df`` vem do ``_ler_planilha`` e é alterado no lugar.
+    """
     df.columns = [str(c).strip() for c in df.columns]
 
     for required in ["ORG", "PIEZA"]:
         if required not in df.columns:
             raise ValueError(f"Coluna obrigatória ausente no arquivo: {required}")
 
-    rename_map = {
-        "Almacen / Warehouse": "warehouse",
-        "Descripción": "descricao",
-        "REPARABLE": "reparable",
-        "USO": "uso",
-        "PAR_UDFCHAR30": "bloqueio_compras",
-        "CODIGOCOMUM_PAR_UDFCHAR16": "codigo_comum",
-        "CODIGOCLIENTE_PAR_UDFCHAR01": "codigo_cliente",
-        "Lead Time": "lead_time_dias",
-        "FORNECEDORAUTOMATIC": "fornecedor_automatico",
-        "Preço Médio": "preco_medio",
-        "TOTAL Valor almacen": "total_valor_almacen",
-        "NIVEL_IMAX": "nivel_imax",
-        "NIVEL_ROL": "nivel_rol",
-        "NIVEL_QTDOC": "nivel_qtdoc",
-        "NIVEL_IMIN": "nivel_imin",
-        "Classificação": "classificacao",
-        "FAMILIA": "familia",
-        "BIS_BIN": "bis_bin",
-        "BIS_QTY": "bis_qty",
-        "PAR_CODE_EXPLICIT": "par_code_explicit",
-        "PAR_ORG_EXPLICIT": "par_org_explicit",
-        "EMPRESTIMO?": "emprestimo",
-        "BLOQUEIO_REPOSICAO": "bloqueio_reposicao",
-        "BLOQUEIO_REPOSICAO_OLD": "bloqueio_reposicao_old",
-    }
-    df = df.rename(columns=rename_map)
+    df.columns = [RENOMEAR.get(c, c) for c in df.columns]  # rename() devolveria outro frame
 
     # chaves padronizadas
     df["org"] = df["ORG"].astype(str).str.strip()
@@ -74,137 +135,162 @@ def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     if "warehouse" not in df.columns:
         df["warehouse"] = None
 
-    # 1) converte strings vazias/espaços em NA no dataframe todo
-    df = df.replace({r"^\s*$": NA}, regex=True)
+    for col in df.columns:
+        if col in COLUNAS_BOOL:
+            df[col] = _booleano(df[col])            # texto booleano -> 1/0
+        elif col in COLUNAS_NUM:
+            df[col] = _numero(df[col])              # floats (lead_time_dias também, com NaN)
+        elif col not in ("org", "pieza") and (df[col].dtype == object or pd.api.types.is_string_dtype(df[col])):
+            df[col] = _sem_brancos(df[col])         # strings vazias/espaços -> NA
 
-    # 2) normaliza booleanos texto -> 1/0
-    def norm_bool(x):
-        s = str(x).strip().lower() if pd.notna(x) else ""
-        if s in {"+", "1", "true", "sim", "s", "y", "yes"}:
-            return 1
-        if s in {"-", "0", "false", "nao", "não", "n", "no"}:
-            return 0
-        return None
-
-    if "reparable" in df.columns:
-        df["reparable"] = df["reparable"].map(norm_bool)
-    if "emprestimo" in df.columns:
-        df["emprestimo"] = df["emprestimo"].map(norm_bool)
-
-    # 3) numéricos em geral (floats)
-    for col in ["preco_medio", "total_valor_almacen", "nivel_imax", "nivel_rol", "nivel_qtdoc", "nivel_imin", "bis_qty"]:
-        if col in df.columns:
-            # troca vírgula por ponto, depois coerce
-            df[col] = (
-                df[col]
-                .astype(str)
-                .str.replace(",", ".", regex=False)
-                .replace({"": NA})
-            )
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-    # 4) lead_time_dias: cast seguro para Int64 (nullable)
-    if "lead_time_dias" in df.columns:
-        s = (
-            df["lead_time_dias"]
-            .astype(str)
-            .str.replace(",", ".", regex=False)  # "30,0" -> "30.0"
-            .replace({"": NA, "nan": NA, "None": NA})  # strings comuns de vazio
-        )
-        # coerce: vira float com NaN onde não for número
-        s = pd.to_numeric(s, errors="coerce")
-        # arredonda e faz cast para Int64 (aceita NA)
-        # df["lead_time_dias"] = s.round().astype("Int64")
-        df["lead_time_dias"] = pd.to_numeric(s, errors="coerce")  # mantém como float com NaN
-
-    # 5) remove linhas sem chave
-    df = df[
+    # remove linhas sem chave
+    ok = (
         df["org"].notna() & (df["org"] != "") &
         df["pieza"].notna() & (df["pieza"] != "")
-    ]
+    )
+    return df if ok.all() else df[ok]
+
+
+# Versão compartilhada entre processos: ``posicao_estoque.geracao`` guarda o
+# número da geração publicada e cada geração tem sua pasta em
+# ``posicao_estoque.colunas/``. Quem reconstrói (sob a trava) grava a pasta
+# nova e só então troca o número; os outros workers veem o número mudar na
+# próxima consulta e apenas mapeiam a pasta, sem reler a planilha.
+def _store_path(geracao: int) -> Path:
+    return ESTOQUE_PATH.with_suffix(".colunas") / f"{geracao:06d}"
+
+
+def _geracao_path() -> Path:
+    return ESTOQUE_PATH.with_suffix(".geracao")
+
+
+def ler_geracao() -> int:
+    try:
+        return int(_geracao_path().read_text().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
 
-    return df
 
+def _publicar(geracao: int) -> None:
+    tmp = _geracao_path().with_name(f".{_geracao_path().name}.{os.getpid()}.tmp")
+    tmp.write_text(str(geracao))
+    os.replace(tmp, _geracao_path())
+    # gerações antigas: a anterior fica para quem ainda a tem mapeada
+    for pasta in ESTOQUE_PATH.with_suffix(".colunas").glob("[0-9]*"):
+        if pasta.name.isdigit() and int(pasta.name) < geracao - 1:
+            shutil.rmtree(pasta, ignore_errors=True)
 
-def _load_from_disk() -> pd.DataFrame:
-    # Se existir pickle mais novo, usa ele (muito mais rápido que XLSX)
-    if PKL_PATH.exists():
-        try:
-            if PKL_PATH.stat().st_mtime >= ESTOQUE_PATH.stat().st_mtime:
-                return pd.read_pickle(PKL_PATH)
-        except FileNotFoundError:
-            pass
 
-    # Caso contrário, lê o arquivo “bruto”
+def _ler_planilha() -> tuple[pd.DataFrame, dict]:
     if not ESTOQUE_PATH.exists():
         raise FileNotFoundError(f"Arquivo de estoque não encontrado em: {ESTOQUE_PATH}")
 
-    if ESTOQUE_PATH.suffix.lower() == ".csv":
-        df = pd.read_csv(ESTOQUE_PATH)
-    else:
-        xls = pd.ExcelFile(ESTOQUE_PATH)
-        df = pd.read_excel(ESTOQUE_PATH, sheet_name=xls.sheet_names[0])
+    # uma abertura só, em modo streaming, e apenas as colunas conhecidas
+    df, leitura = ler_planilha(ESTOQUE_PATH, colunas=COLUNAS_LIDAS.__contains__)
+    return _normalize_columns(df), leitura
 
-    df = _normalize_columns(df)
 
-    # Salva a versão pronta para carregamentos futuros super rápidos
+def _abrir_publicado(geracao: int, mtime: float) -> Optional[EstoqueColunar]:
+    """Store da geração publicada, se existir e corresponder ao arquivo atual."""
+    if not geracao:
+        return None
     try:
-        df.to_pickle(PKL_PATH)
-    except Exception:
-        pass
-
-    return df
-
-def get_df(force: bool = False) -> pd.DataFrame:
-    """Retorna o DataFrame do estoque com cache por TTL + invalidado se o arquivo mudou."""
-    now = time.time()
+        store = EstoqueColunar.abrir(_store_path(geracao))
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    return store if store.meta.get("mtime_origem") == mtime else None
+
+
+def _load_from_disk(reconstruir: bool = False) -> tuple[int, EstoqueColunar]:
+    with trava_arquivo(ESTOQUE_PATH.with_suffix(".lock")):
+        # relido sob a trava: outro worker pode ter acabado de publicar
+        geracao = ler_geracao()
+        mtime = _file_mtime(ESTOQUE_PATH)
+        store = None if reconstruir else _abrir_publicado(geracao, mtime)
+        if store is not None:
+            return geracao, store
+
+        # lê o arquivo “bruto” uma vez e publica a nova geração para os outros processos
+        geracao += 1
+        df, leitura = _ler_planilha()
+        store = EstoqueColunar.de_dataframe(df, meta={"mtime_origem": mtime, "geracao": geracao, "leitura": leitura})
+        store.indexar(COLUNAS_BUSCA)
+        store.salvar(_store_path(geracao))
+        _publicar(geracao)
+        return geracao, EstoqueColunar.abrir(_store_path(geracao))
+
+
+def get_store(force: bool = False) -> EstoqueColunar:
+    """
+    Retorna o estoque colunar. A validação por consulta é só ler o número da
+    geração e o mtime do arquivo; muda um dos dois -> reabre (ou reconstrói).
+    """
+    geracao = ler_geracao()
     mtime = _file_mtime(ESTOQUE_PATH)
-    # recarrega se: forçado, arquivo mudou, TTL expirou, cache vazio
     if (
         force
-        or _cache.df is None
+        or _cache.store is None
+        or geracao != _cache.geracao
         or mtime != _cache.mtime
-        or (now - _cache.loaded_at) > CACHE_TTL_SECONDS
     ):
-        df = _load_from_disk()
-        _cache.df = df
-        _cache.mtime = mtime
-        _cache.loaded_at = now
-    return _cache.df
+        _cache.geracao, _cache.store = _load_from_disk(reconstruir=force)
+        _cache.mtime = _cache.store.meta.get("mtime_origem", mtime)
+    return _cache.store
+
+
+def get_df(force: bool = False) -> pd.DataFrame:
+    """Compat: o estoque como DataFrame (montado a partir do store colunar)."""
+    return get_store(force).para_dataframe()
+
 
 def clear_cache():
-    _cache.df = None
+    """Esquece o store deste processo (os outros seguem o número da geração)."""
+    _cache.store = None
+    _cache.geracao = -1
     _cache.mtime = 0.0
-    _cache.loaded_at = 0.0
+
 
 def query(pieza=None, org=None, warehouse=None, search=None,
           limit=100, offset=0, sort_by=None, sort_dir="asc"):
-    df = get_df()
-
-    q = df
-    if org:
-        q = q[q["org"].str.contains(org, case=False, na=False)]
-    if pieza:
-        q = q[q["pieza"].str.contains(pieza, case=False, na=False)]
-    if warehouse:
-        q = q[q["warehouse"].astype(str).str.contains(warehouse, case=False, na=False)]
+    """
+    Filtros por substring sem distinção de maiúsculas (texto literal), respondidos
+    pelo índice de trigramas: cada filtro vira um conjunto de linhas e os
+    conjuntos são intersectados; só a página pedida é materializada.
+    """
+    store = get_store()
+
+    idx = None
+    for col, termo in (("org", org), ("pieza", pieza), ("warehouse", warehouse)):
+        if termo:
+            linhas = store.linhas_com(col, termo)
+            idx = linhas if idx is None else np.intersect1d(idx, linhas, assume_unique=True)
     if search:
-        s = search.lower()
-        cols = [c for c in ["pieza", "org", "warehouse", "descricao", "familia", "codigo_cliente"] if c in q.columns]
-        mask = False
-        for c in cols:
-            mask = mask | q[c].astype(str).str.lower().str.contains(s, na=False)
-        q = q[mask]
+        alguma = np.array([], dtype=np.int64)
+        for c in [c for c in COLUNAS_BUSCA if c in store]:
+            alguma = np.union1d(alguma, store.linhas_com(c, search))
+        idx = alguma if idx is None else np.intersect1d(idx, alguma, assume_unique=True)
+    if idx is None:
+        idx = np.arange(len(store))
 
-    if sort_by in q.columns:
-        q = q.sort_values(sort_by, ascending=(str(sort_dir).lower() != "desc"))
+    if sort_by in store:
+        idx = store.ordem(sort_by, idx, decrescente=(str(sort_dir).lower() == "desc"))
 
-    total = len(q)
+    total = len(idx)
 
     base_cols = ["org", "warehouse", "pieza", "descricao", "bis_qty", "preco_medio", "nivel_qtdoc", "lead_time_dias"]
-    extra_cols = [c for c in ["uso", "classificacao", "familia", "reparable"] if c in q.columns]
-    cols = [c for c in base_cols + extra_cols if c in q.columns]
+    extra_cols = [c for c in ["uso", "classificacao", "familia", "reparable"] if c in store]
+    cols = [c for c in base_cols + extra_cols if c in store]
 
-    data = q[cols].iloc[offset: offset + int(limit)].fillna("").to_dict(orient="records")
+    data = store.registros(idx[offset: offset + int(limit)], cols)
     return total, data
 
+
+def somas_por_pieza(store: EstoqueColunar) -> Dict[str, float]:
+    """Soma de bis_qty por pieza (como o groupby().sum(): NaN conta 0), direto sobre os códigos."""
+    cod = np.asarray(store.codigos["pieza"])
+    qtd = np.nan_to_num(np.asarray(store.numericas["bis_qty"]), nan=0.0)
+    ok = cod >= 0
+    valores = store.valores["pieza"]
+    somas = np.bincount(cod[ok], weights=qtd[ok], minlength=len(valores))
+    presentes = np.bincount(cod[ok], minlength=len(valores)) > 0
+    return {str(valores[i]): float(somas[i]) for i in np.flatnonzero(presentes)}
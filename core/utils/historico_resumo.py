@@ -0,0 +1,35 @@
+# core/utils/historico_resumo.py
+"""
+Resumo "última alteração por produto" (``UltimaAlteracaoProduto``).
+
+Cada registro novo do HistoricalProduto atualiza a linha do produto: os
+gravados pelo ``save`` chegam pelo sinal do simple_history
+(core/signals.py) e os em lote (``bulk_history_create``, que não emite
+sinal) são passados aqui por quem os cria (utils/estoque_db.py). Assim
+/api/historico-todos/ é uma consulta só, paginável, sem varrer o histórico.
+"""
+from __future__ import annotations
+from typing import Iterable
+
+from ..models import UltimaAlteracaoProduto
+
+ACOES = {"+": "Criado", "~": "Alterado", "-": "Excluído"}
+
+
+def registrar(registros: Iterable) -> None:
+    """Upsert da última alteração a partir de registros do HistoricalProduto."""
+    ultimos = {}
+    for h in registros:
+        if h.history_type == "-":
+            continue  # produto excluído: a linha do resumo sai junto (CASCADE)
+        atual = ultimos.get(h.id)
+        if atual is None or h.history_date >= atual.history_date:
+            ultimos[h.id] = h
+    if not ultimos:
+        return
+    UltimaAlteracaoProduto.objects.bulk_create(
+        [UltimaAlteracaoProduto(produto_id=pk, acao=h.history_type, data=h.history_date) for pk, h in ultimos.items()],
+        update_conflicts=True,
+        unique_fields=["produto"],
+        update_fields=["acao", "data"],
+    )
@@ -0,0 +1,130 @@
+# core/utils/indice_texto.py
+"""
+Índice de trigramas para filtros "contém" (sem distinção de maiúsculas).
+
+Montado uma vez por coluna sobre o dicionário de valores distintos
+(códigos int32 por linha + valores), em duas partes:
+  - ``chaves``/``inicio``/``ids``: lista invertida trigrama -> ids de valor;
+  - ``linhas``/``linhas_inicio``: linhas de cada valor (códigos ordenados).
+Uma busca intersecta as listas dos trigramas do termo, confirma os
+candidatos no dicionário e devolve as linhas já ordenadas, prontas para
+intersecção/união com os outros filtros. Termos com menos de 3
+caracteres varrem o dicionário (que é bem menor que a tabela).
+
+Tudo é ``np.ndarray`` simples: grava/abre como .npy (mmap) junto dos dados.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+PARTES = ("chaves", "inicio", "ids", "linhas", "linhas_inicio")
+_BITS = 21  # maior code point unicode (0x10FFFF) cabe em 21 bits: 3 chars -> int64
+_MUITOS_VALORES = 1024  # acima disso as linhas saem por máscara, não por fatias
+
+
+def _minusculas(valores: np.ndarray) -> np.ndarray:
+    return np.char.lower(np.asarray(valores, dtype=str)) if len(valores) else np.array([], dtype="<U1")
+
+
+def _trigramas(textos) -> tuple[np.ndarray, np.ndarray]:
+    """(chave int64 do trigrama, índice do texto) para cada posição de cada texto."""
+    lens = np.fromiter((len(t) for t in textos), dtype=np.int64, count=len(textos))
+    cps = np.frombuffer("".join(textos).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    dono = np.repeat(np.arange(len(textos), dtype=np.int64), lens)
+    pos = np.arange(len(cps), dtype=np.int64) - np.repeat(np.cumsum(lens) - lens, lens)
+    ok = pos <= np.repeat(lens, lens) - 3
+    i = np.flatnonzero(ok)
+    chave = (cps[i] << (2 * _BITS)) | (cps[i + 1] << _BITS) | cps[i + 2]
+    return chave, dono[i]
+
+
+@dataclass
+class IndiceTexto:
+    chaves: np.ndarray         # trigramas distintos, ordenados (int64)
+    inicio: np.ndarray         # fatia de ``ids`` de cada trigrama (len(chaves) + 1)
+    ids: np.ndarray            # ids de valor (int32)
+    linhas: np.ndarray         # linhas ordenadas por código (int64)
+    linhas_inicio: np.ndarray  # fatia de ``linhas`` de cada valor (n_valores + 1)
+    _valores: Optional[np.ndarray] = None
+
+    @classmethod
+    def montar(cls, codigos: np.ndarray, valores: np.ndarray) -> "IndiceTexto":
+        codigos = np.asarray(codigos)
+        minus = _minusculas(valores)
+        chave, dono = _trigramas(minus.tolist())
+        ordem = np.lexsort((dono, chave))
+        chave, dono = chave[ordem], dono[ordem]
+        unico = np.ones(len(chave), dtype=bool)
+        unico[1:] = (chave[1:] != chave[:-1]) | (dono[1:] != dono[:-1])
+        chave, dono = chave[unico], dono[unico]
+        chaves, inicio = np.unique(chave, return_index=True)
+
+        linhas = np.argsort(codigos, kind="stable").astype(np.int64)
+        linhas_inicio = np.searchsorted(codigos[linhas], np.arange(len(valores) + 1))
+        indice = cls(
+            chaves=chaves,
+            inicio=np.append(inicio, len(chave)).astype(np.int64),
+            ids=dono.astype(np.int32),
+            linhas=linhas,
+            linhas_inicio=linhas_inicio.astype(np.int64),
+        )
+        indice._valores = minus
+        return indice
+
+    @classmethod
+    def de_serie(cls, serie: pd.Series) -> "IndiceTexto":
+        """Índice de uma coluna de DataFrame (vazios nunca casam)."""
+        vazio = serie.isna().to_numpy()
+        codigos, valores = pd.factorize(serie.astype(str).where(~vazio, None), use_na_sentinel=True)
+        return cls.montar(codigos.astype(np.int32), np.asarray(valores, dtype=str))
+
+    # ---------- persistência ----------
+    def salvar(self, pasta: Path, nome: str) -> None:
+        for parte in PARTES:
+            np.save(Path(pasta) / f"{nome}.{parte}.npy", getattr(self, parte), allow_pickle=False)
+        np.save(Path(pasta) / f"{nome}.valores.npy", self._valores, allow_pickle=False)
+
+    @classmethod
+    def abrir(cls, pasta: Path, nome: str) -> "IndiceTexto":
+        partes = {p: np.load(Path(pasta) / f"{nome}.{p}.npy", mmap_mode="r", allow_pickle=False) for p in PARTES}
+        indice = cls(**partes)
+        indice._valores = np.load(Path(pasta) / f"{nome}.valores.npy", allow_pickle=False)
+        return indice
+
+    # ---------- busca ----------
+    def valores_com(self, termo: str) -> np.ndarray:
+        """Ids dos valores que contêm ``termo``."""
+        termo = termo.lower()
+        if len(termo) < 3:
+            return np.flatnonzero(np.char.find(self._valores, termo) >= 0)
+        candidatos = None
+        for chave in np.unique(_trigramas([termo])[0]):
+            p = np.searchsorted(self.chaves, chave)
+            if p >= len(self.chaves) or self.chaves[p] != chave:
+                return np.array([], dtype=np.int64)
+            ids = np.asarray(self.ids[self.inicio[p]:self.inicio[p + 1]])
+            candidatos = ids if candidatos is None else np.intersect1d(candidatos, ids, assume_unique=True)
+            if not len(candidatos):
+                return candidatos
+        # trigramas batem mas a ordem pode não: confirma no texto
+        return candidatos[np.char.find(self._valores[candidatos], termo) >= 0]
+
+    def linhas_com(self, termo: str) -> np.ndarray:
+        """Linhas (ordenadas) cujo valor contém ``termo``."""
+        ids = self.valores_com(termo)
+        if len(ids) > _MUITOS_VALORES:
+            casa = np.zeros(len(self._valores), dtype=bool)
+            casa[ids] = True
+            # linhas vazias (código -1) vêm antes de linhas_inicio[0] e ficam de fora
+            por_posicao = np.repeat(casa, np.diff(self.linhas_inicio))
+            mascara = np.zeros(len(self.linhas), dtype=bool)
+            mascara[self.linhas[self.linhas_inicio[0]:][por_posicao]] = True
+            return np.flatnonzero(mascara)
+        if not len(ids):
+            return np.array([], dtype=np.int64)
+        fatias = [self.linhas[self.linhas_inicio[i]:self.linhas_inicio[i + 1]] for i in ids]
+        return np.sort(np.concatenate(fatias))
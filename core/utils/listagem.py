@@ -0,0 +1,132 @@
+# core/utils/listagem.py
+"""
+Listagens das ViewSets do core (produtos, componentes, listas técnicas,
+BOM, ordens):
+
+  - paginação por cursor, opcional: só entra com ``?page_size=`` ou
+    ``?cursor=``; sem eles a resposta continua sendo a lista inteira, como
+    as telas atuais esperam. A ordem da página é por id (chave primária:
+    única e indexada), então a página seguinte não repete nem pula linhas
+    quando a tabela muda. ``?ordering=-id`` inverte; outros ``?ordering``
+    valem só sem paginação;
+  - ``?fields=a,b``: o serializer devolve só esses campos e a ViewSet
+    carrega só as colunas deles (``.only()`` + ``select_related`` apenas das
+    relações usadas). Campos calculados (SerializerMethodField) declaram as
+    colunas que leem em ``Meta.colunas_metodos``.
+"""
+from __future__ import annotations
+from typing import Iterable, List, Optional, Set
+from urllib.parse import parse_qs, urlparse
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+PARAM_CAMPOS = "fields"
+
+
+def campos_pedidos(request) -> Optional[List[str]]:
+    """Campos de ``?fields=`` (só em leitura); None = todos."""
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    bruto = request.query_params.get(PARAM_CAMPOS)
+    if not bruto:
+        return None
+    return [c.strip() for c in bruto.split(",") if c.strip()]
+
+
+# =========================
+# Paginação
+# =========================
+class PaginacaoCursor(CursorPagination):
+    page_size = 500
+    max_page_size = 5000
+    page_size_query_param = "page_size"
+    ordering = "id"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if not (params.get(self.cursor_query_param) or params.get(self.page_size_query_param)):
+            return None  # sem pedir página: lista inteira
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        # só chaves únicas: id ou -id
+        pedida = request.query_params.get("ordering")
+        return (pedida if pedida in ("id", "-id") else getattr(view, "ordering_cursor", self.ordering),)
+
+    def get_paginated_response(self, data):
+        proximo = self.get_next_link()
+        return Response({
+            "results": data,
+            "next_cursor": parse_qs(urlparse(proximo).query)[self.cursor_query_param][0] if proximo else None,
+            "next": proximo,
+            "previous": self.get_previous_link(),
+        })
+
+
+# =========================
+# ?fields=
+# =========================
+class CamposEsparsosMixin:
+    """Serializer: com ``?fields=`` no request, descarta os outros campos."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        campos = campos_pedidos(self.context.get("request"))
+        if campos:
+            for nome in set(self.fields) - set(campos):
+                self.fields.pop(nome)
+
+
+def _caminho_valido(model, caminho: str) -> bool:
+    """Coluna concreta, alcançada só por FK/one-to-one diretas (o que o select_related aceita)."""
+    *relacoes, final = caminho.split("__")
+    try:
+        for parte in relacoes:
+            campo = model._meta.get_field(parte)
+            if not (campo.concrete and (campo.many_to_one or campo.one_to_one)):
+                return False
+            model = campo.related_model
+        campo = model._meta.get_field(final)
+    except FieldDoesNotExist:
+        return False
+    return campo.concrete and not campo.many_to_many
+
+
+def colunas(serializer_class, campos: Iterable[str]) -> Optional[Set[str]]:
+    """Colunas (no formato do ``.only()``) lidas pelos ``campos``; None = não dá para restringir."""
+    fields = serializer_class().fields
+    metodos = getattr(serializer_class.Meta, "colunas_metodos", {})
+    model = serializer_class.Meta.model
+    saida = set()
+    for nome in campos:
+        campo = fields.get(nome)
+        if campo is None or campo.write_only:
+            continue
+        if campo.source == "*":
+            if nome not in metodos:
+                return None
+            saida.update(metodos[nome])
+        else:
+            saida.add(campo.source.replace(".", "__"))
+    if not all(_caminho_valido(model, c) for c in saida):
+        return None
+    return saida
+
+
+class ListagemMixin:
+    """ViewSet: paginação por cursor opcional + ``?fields=`` levado ao ``.only()``."""
+    pagination_class = PaginacaoCursor
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        campos = campos_pedidos(self.request)
+        if not campos:
+            return qs
+        cols = colunas(self.get_serializer_class(), campos)
+        if not cols:
+            return qs
+        relacoes = {c.rsplit("__", 1)[0] for c in cols if "__" in c}
+        return qs.select_related(None).select_related(*relacoes).only(*cols, *relacoes)
@@ -0,0 +1,257 @@
+# core/utils/mrp_fases.py
+"""
+MRP em fases de tempo (time-phased).
+
+A necessidade bruta de cada OP cai no período da sua ``data_entrega``
+(um período por data, ou por semana). Tudo roda sobre uma matriz
+[produto x período] ordenada por data:
+  - estoque projetado = (estoque + em pedido) - bruto acumulado;
+  - necessidade líquida do período = quanto a falta acumulada cresceu nele;
+  - liberação (data de compra) = início do período - ``Produto.lead_time``.
+
+O netting usa as mesmas primitivas (índice denso, ponto fixo) de
+mrp_netting.py, então o modo "exato" continua batendo com Decimal.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .necessidade_unitaria import carregar_tabela
+from .mrp_netting import (
+    MODOS,
+    IndiceDenso,
+    LIMITE_INT64,
+    para_inteiro,
+    em_pedido_por_codigo,
+    necessidade_bruta,
+    para_float,
+    valores_produto,
+)
+
+PERIODOS = ("dia", "semana")
+
+
+def inicio_periodo(d: date, periodo: str = "dia") -> date:
+    if periodo == "semana":
+        return d - timedelta(days=d.weekday())  # segunda-feira
+    return d
+
+
+@dataclass
+class PlanoMRP:
+    modo: str
+    indice: IndiceDenso
+    produtos: Dict[int, dict]
+    # nível/lista de origem exibidos no front (último caminho explodido)
+    meta: Dict[int, tuple]
+    datas: List[date]
+    bruto: np.ndarray           # [produto, período]
+    estoque: np.ndarray         # [produto]
+    em_pedido: np.ndarray       # [produto]
+    lead_time: np.ndarray       # [produto] em dias
+
+    def __post_init__(self):
+        disponivel = self.estoque + self.em_pedido
+        self.acumulado = np.cumsum(self.bruto, axis=1)
+        # estoque projetado ao fim de cada período, sem ordens planejadas
+        self.projetado = disponivel[:, None] - self.acumulado
+        falta_acumulada = np.maximum(-self.projetado, 0)
+        self.liquido = np.diff(
+            falta_acumulada, axis=1, prepend=np.zeros((len(self.indice), 1), dtype=falta_acumulada.dtype)
+        )
+        self.falta_total = falta_acumulada[:, -1]
+        self.necessario = self.acumulado[:, -1]
+
+        # liberação por período = data do período - lead time
+        datas = np.array(self.datas, dtype="datetime64[D]")
+        self.liberacao = datas[None, :] - self.lead_time.astype("timedelta64[D]")[:, None]
+        self.falta_periodo = np.asarray(self.liquido > 0, dtype=bool)
+        self.tem_falta = self.falta_periodo.any(axis=1)
+        self.primeira_falta = self.falta_periodo.argmax(axis=1)
+
+    def __len__(self):
+        return len(self.indice)
+
+    def data_compra(self, i: int) -> str:
+        """Liberação da primeira necessidade líquida do produto (ISO) ou ""."""
+        if not self.tem_falta[i]:
+            return ""
+        return str(self.liberacao[i, self.primeira_falta[i]])
+
+    def datas_compra(self) -> List[str]:
+        """``data_compra`` de todos os produtos, na ordem do índice."""
+        primeira = self.liberacao[np.arange(len(self)), self.primeira_falta]
+        return _iso(primeira, self.tem_falta, "")
+
+    def liberacoes(self) -> list:
+        """[produto][período]: liberação (ISO) onde há necessidade líquida, senão None."""
+        return _iso(self.liberacao, self.falta_periodo)
+
+
+def _iso(datas: np.ndarray, mostrar: np.ndarray, vazio=None) -> list:
+    """
+    datetime64[D] -> texto ISO onde ``mostrar`` (``vazio`` no resto), em
+    listas do Python. Formata cada dia do intervalo uma vez e indexa.
+    """
+    base = datas.min()
+    desloc = (datas - base).astype(np.int64)
+    dias = base + np.arange(desloc.max() + 1).astype("timedelta64[D]")
+    tabela = np.array(np.datetime_as_string(dias).tolist() + [vazio], dtype=object)
+    return tabela[np.where(mostrar, desloc, len(tabela) - 1)].tolist()
+
+
+def montar_plano(ordens, modo: str = "exato", periodo: str = "dia") -> Optional[PlanoMRP]:
+    """Plano por período a partir das OPs (None se nenhuma OP gera necessidade)."""
+    if modo not in MODOS:
+        raise ValueError(f"Modo de cálculo inválido: {modo}")
+    if periodo not in PERIODOS:
+        raise ValueError(f"Período inválido: {periodo}")
+
+    ordens = list(ordens)
+    tabela = carregar_tabela(op.lista_id for op in ordens)
+
+    datas = sorted({inicio_periodo(op.data_entrega, periodo) for op in ordens})
+    pos_data = {d: j for j, d in enumerate(datas)}
+
+    # OPs da mesma lista no mesmo período somam (qtd * por unidade é distributivo)
+    total: Dict[tuple, int] = {}
+    ultima_op: Dict[int, int] = {}
+    for k, op in enumerate(ordens):
+        chave = (op.lista_id, pos_data[inicio_periodo(op.data_entrega, periodo)])
+        total[chave] = total.get(chave, 0) + int(op.quantidade)
+        ultima_op[op.lista_id] = k
+
+    produtos: Dict[int, dict] = {}
+    for lista_id in ultima_op:
+        for produto_id, _, _, _, prod in tabela.get(lista_id, ()):
+            produtos.setdefault(produto_id, prod)
+    if not produtos:
+        return None
+
+    # nível/origem do último caminho explodido (a última OP vence)
+    meta: Dict[int, tuple] = {}
+    for lista_id in sorted(ultima_op, key=ultima_op.get):
+        for produto_id, _, nivel, codigo_origem, _ in tabela.get(lista_id, ()):
+            meta[produto_id] = (nivel, codigo_origem)
+
+    indice = IndiceDenso(produtos)
+
+    # por lista: posições densas e quantidade por unidade (convertidas uma vez só)
+    if modo == "float":
+        dtype = np.float64
+        por_lista = {
+            lista_id: (indice.posicoes([l[0] for l in linhas]),
+                       np.array([float(l[1]) for l in linhas], dtype=np.float64))
+            for lista_id, linhas in tabela.items()
+        }
+    else:
+        fixos = {lid: [para_inteiro(l[1]) for l in linhas] for lid, linhas in tabela.items()}
+        maior_q = max((abs(v) for q in fixos.values() for v in q), default=0)
+        dtype = np.int64 if maior_q * sum(total.values()) < LIMITE_INT64 else object
+        por_lista = {
+            lista_id: (indice.posicoes([l[0] for l in tabela[lista_id]]), np.array(q, dtype=dtype))
+            for lista_id, q in fixos.items()
+        }
+
+    ops_por_lista: Dict[int, np.ndarray] = {}
+    for (lista_id, j), qtd in total.items():
+        if lista_id not in ops_por_lista:
+            ops_por_lista[lista_id] = np.zeros(len(datas), dtype=dtype)
+        ops_por_lista[lista_id][j] = qtd
+    bruto = necessidade_bruta(indice, por_lista, ops_por_lista, dtype)
+
+    pedidos = em_pedido_por_codigo()
+    estoque = valores_produto(indice, {pid: p["estoque"] for pid, p in produtos.items()}, modo)
+    em_pedido = valores_produto(indice, {pid: pedidos.get(p["codigo"], 0) for pid, p in produtos.items()}, modo)
+    lead_time = np.array([produtos[int(pid)]["lead_time"] for pid in indice.ids], dtype=np.int64)
+
+    return PlanoMRP(
+        modo=modo,
+        indice=indice,
+        produtos=produtos,
+        meta=meta,
+        datas=datas,
+        bruto=bruto,
+        estoque=estoque,
+        em_pedido=em_pedido,
+        lead_time=lead_time,
+    )
+
+
+# =========================
+# Saídas
+# =========================
+
+def necessidades_por_ordens(ordens, modo: str = "exato", periodo: str = "dia") -> Dict[int, dict]:
+    """
+    Necessidade por componente (formato de /api/mrp/). ``data_compra`` é a
+    liberação da primeira necessidade líquida, já descontado o lead time.
+    """
+    plano = montar_plano(ordens, modo=modo, periodo=periodo)
+    if plano is None:
+        return {}
+
+    necessario = para_float(plano.necessario, modo)
+    estoque = para_float(plano.estoque, modo)
+    em_pedido = para_float(plano.em_pedido, modo)
+    faltando = para_float(plano.falta_total, modo)
+    compra = plano.datas_compra()
+    pos = {pid: i for i, pid in enumerate(plano.indice.ids.tolist())}
+
+    necessidades: Dict[int, dict] = {}
+    for produto_id, prod in plano.produtos.items():
+        i = pos[produto_id]
+        nivel, codigo_origem = plano.meta[produto_id]
+        necessidades[produto_id] = {
+            "id": produto_id,
+            "codigo": prod["codigo"],
+            "nome": prod["nome"],
+            "necessario": necessario[i],
+            "em_estoque": estoque[i],
+            "em_pedido": em_pedido[i],
+            "faltando": faltando[i],
+            "lead_time": prod["lead_time"],
+            "data_compra": compra[i],
+            "nivel": nivel,
+            "codigo_pai": codigo_origem,
+            "tipo": prod["tipo"],
+        }
+    return necessidades
+
+
+def fases_por_ordens(ordens, modo: str = "exato", periodo: str = "dia") -> dict:
+    """
+    Plano completo por período (formato de /api/mrp/fases/). As matrizes
+    viram listas de uma vez (não por produto/célula).
+    """
+    plano = montar_plano(ordens, modo=modo, periodo=periodo)
+    if plano is None:
+        return {"periodos": [], "itens": []}
+
+    estoque = para_float(plano.estoque, modo)
+    em_pedido = para_float(plano.em_pedido, modo)
+    bruto = para_float(plano.bruto, modo)
+    projetado = para_float(plano.projetado, modo)
+    liquido = para_float(plano.liquido, modo)
+    liberacao = plano.liberacoes()
+    compra = plano.datas_compra()
+    itens = []
+    for i, pid in enumerate(plano.indice.ids.tolist()):
+        prod = plano.produtos[pid]
+        itens.append({
+            "id": pid,
+            "codigo": prod["codigo"],
+            "nome": prod["nome"],
+            "lead_time": prod["lead_time"],
+            "em_estoque": estoque[i],
+            "em_pedido": em_pedido[i],
+            "bruto": bruto[i],
+            "projetado": projetado[i],
+            "liquido": liquido[i],
+            "liberacao": liberacao[i],
+            "data_compra": compra[i],
+        })
+    return {"periodos": [d.isoformat() for d in plano.datas], "itens": itens}
@@ -0,0 +1,367 @@
+# core/utils/mrp_incremental.py
+"""
+MRP persistido e mantido por deltas.
+
+``NecessidadeBrutaMRP`` guarda a necessidade bruta por (produto, data) e
+``ResultadoMRP`` o resultado liquidado por produto. Em vez de re-explodir
+tudo a cada /api/mrp/:
+  - criar/alterar/excluir uma OP soma/subtrai só a contribuição dela
+    (qtd da OP * NecessidadeUnitaria da lista) e re-liquida esses produtos;
+  - mudar o estoque (ou lead time/código) de um Produto re-liquida só ele;
+  - mudar a BOM aplica (depois - antes) da BOM achatada às OPs das listas
+    reconstruídas.
+Os gatilhos ficam em core/signals.py. ``verificar_consistencia`` compara
+com um recálculo completo.
+"""
+from __future__ import annotations
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from ..models import (
+    EstadoMRP,
+    NecessidadeBrutaMRP,
+    NecessidadeUnitaria,
+    OrdemProducao,
+    Produto,
+    ResultadoMRP,
+)
+from .mrp_fases import PlanoMRP, montar_plano
+from .mrp_netting import IndiceDenso, de_fixo, em_pedido_por_codigo, para_fixo
+
+# diferenças menores que isso são ruído de arredondamento do banco
+EPSILON = Decimal("1e-9")
+
+CAMPOS_RESULTADO = ["necessario", "em_estoque", "em_pedido", "faltando", "data_compra"]
+
+
+# =========================
+# Necessidade bruta
+# =========================
+
+def _somar_brutos(deltas: Dict[Tuple[int, date], Decimal]) -> None:
+    """Aplica {(produto_id, data): delta} em NecessidadeBrutaMRP (zeros são removidos)."""
+    deltas = {k: v for k, v in deltas.items() if abs(v) > EPSILON}
+    if not deltas:
+        return
+
+    produto_ids = {p for p, _ in deltas}
+    datas = {d for _, d in deltas}
+    existentes = {
+        (n.produto_id, n.data): n
+        for n in NecessidadeBrutaMRP.objects.filter(produto_id__in=produto_ids, data__in=datas)
+    }
+
+    novos, alterados, excluir = [], [], []
+    for (produto_id, data), delta in deltas.items():
+        atual = existentes.get((produto_id, data))
+        if atual is None:
+            novos.append(NecessidadeBrutaMRP(produto_id=produto_id, data=data, quantidade=delta))
+            continue
+        atual.quantidade = Decimal(atual.quantidade) + delta
+        if abs(atual.quantidade) <= EPSILON:
+            excluir.append(atual.pk)
+        else:
+            alterados.append(atual)
+
+    if excluir:
+        NecessidadeBrutaMRP.objects.filter(pk__in=excluir).delete()
+    if alterados:
+        NecessidadeBrutaMRP.objects.bulk_update(alterados, ["quantidade"], batch_size=1000)
+    if novos:
+        NecessidadeBrutaMRP.objects.bulk_create(novos, batch_size=1000)
+
+
+def _linhas_lista(lista_id: int):
+    return list(
+        NecessidadeUnitaria.objects.filter(lista_id=lista_id)
+        .order_by("id")
+        .values_list("produto_id", "quantidade", "nivel", "lista_origem__codigo")
+    )
+
+
+def _atualizar_exibicao(produto_ids: Iterable[int]) -> None:
+    """Nível/lista de origem exibidos: os da OP mais recente que usa o produto (mesma regra do recálculo)."""
+    produto_ids = set(produto_ids)
+    rows = list(ResultadoMRP.objects.filter(produto_id__in=produto_ids))
+    if not rows:
+        return
+
+    # só as OPs das listas que contêm esses produtos: a mais recente de cada uma
+    listas = NecessidadeUnitaria.objects.filter(produto_id__in=produto_ids).values("lista_id")
+    ultima_op = dict(
+        OrdemProducao.objects.filter(lista_id__in=listas).order_by()
+        .values("lista_id").annotate(ultima=Max("id")).values_list("lista_id", "ultima")
+    )
+    meta: Dict[int, Tuple[int, str]] = {}
+    rank: Dict[int, int] = {}
+    for produto_id, lista_id, nivel, codigo in NecessidadeUnitaria.objects.filter(
+        produto_id__in=produto_ids, lista_id__in=ultima_op
+    ).values_list("produto_id", "lista_id", "nivel", "lista_origem__codigo"):
+        if ultima_op[lista_id] >= rank.get(produto_id, -1):
+            rank[produto_id] = ultima_op[lista_id]
+            meta[produto_id] = (nivel, codigo or "")
+
+    for r in rows:
+        r.nivel, r.codigo_pai = meta.get(r.produto_id, (0, ""))
+    ResultadoMRP.objects.bulk_update(rows, ["nivel", "codigo_pai"], batch_size=1000)
+
+
+def aplicar_ordem(lista_id: int, data_entrega: date, quantidade, sinal: int = 1) -> List[int]:
+    """
+    Soma (sinal=1) ou subtrai (sinal=-1) a contribuição de uma OP e
+    re-liquida os produtos afetados. Retorna os ids dos produtos.
+    """
+    linhas = _linhas_lista(lista_id)
+    if not linhas or not quantidade:
+        return []
+
+    qtd = Decimal(quantidade) * sinal
+    deltas: Dict[Tuple[int, date], Decimal] = defaultdict(Decimal)
+    for produto_id, qtd_unidade, _, _ in linhas:
+        deltas[(produto_id, data_entrega)] += Decimal(qtd_unidade) * qtd
+
+    with transaction.atomic():
+        _somar_brutos(deltas)
+        produto_ids = [p for p, _, _, _ in linhas]
+        renetar(produto_ids)
+        _atualizar_exibicao(produto_ids)
+    return produto_ids
+
+
+def aplicar_mudanca_listas(antes: Dict[int, Dict[int, Decimal]],
+                           depois: Dict[int, Dict[int, Decimal]]) -> List[int]:
+    """
+    BOM mudou: para cada OP das listas reconstruídas aplica
+    qtd da OP * (por unidade depois - por unidade antes).
+    """
+    diferencas: Dict[int, Dict[int, Decimal]] = {}
+    for lista_id in set(antes) | set(depois):
+        a, d = antes.get(lista_id, {}), depois.get(lista_id, {})
+        dif = {p: Decimal(d.get(p, 0)) - Decimal(a.get(p, 0)) for p in set(a) | set(d)}
+        dif = {p: v for p, v in dif.items() if abs(v) > EPSILON}
+        if dif:
+            diferencas[lista_id] = dif
+    if not diferencas:
+        return []
+
+    deltas: Dict[Tuple[int, date], Decimal] = defaultdict(Decimal)
+    for lista_id, quantidade, data_entrega in OrdemProducao.objects.filter(
+        lista_id__in=diferencas
+    ).values_list("lista_id", "quantidade", "data_entrega"):
+        for produto_id, dif in diferencas[lista_id].items():
+            deltas[(produto_id, data_entrega)] += dif * Decimal(quantidade)
+
+    produto_ids = sorted({p for p, _ in deltas})
+    with transaction.atomic():
+        _somar_brutos(deltas)
+        renetar(produto_ids)
+        _atualizar_exibicao(produto_ids)
+    return produto_ids
+
+
+# =========================
+# Netting persistido
+# =========================
+
+def _plano_persistido(produto_ids: Optional[Iterable[int]] = None) -> Tuple[Optional[PlanoMRP], Dict[int, dict]]:
+    """Monta o PlanoMRP (modo exato, por dia) a partir de NecessidadeBrutaMRP."""
+    brutos = NecessidadeBrutaMRP.objects.all()
+    if produto_ids is not None:
+        brutos = brutos.filter(produto_id__in=set(produto_ids))
+    linhas = list(brutos.values_list("produto_id", "data", "quantidade"))
+    if not linhas:
+        return None, {}
+
+    ids = {p for p, _, _ in linhas}
+    produtos = {
+        pid: {"codigo": codigo or "", "estoque": Decimal(estoque or 0), "lead_time": int(lead_time or 0)}
+        for pid, codigo, estoque, lead_time in Produto.objects.filter(id__in=ids).values_list(
+            "id", "codigo", "estoque", "lead_time"
+        )
+    }
+
+    indice = IndiceDenso(produtos)
+    datas = sorted({d for _, d, _ in linhas})
+    pos_data = {d: j for j, d in enumerate(datas)}
+    linhas = [l for l in linhas if l[0] in produtos]
+    valores = para_fixo([q for _, _, q in linhas])
+
+    bruto = np.zeros((len(indice), len(datas)), dtype=valores.dtype)
+    np.add.at(
+        bruto,
+        (indice.posicoes([p for p, _, _ in linhas]), np.array([pos_data[d] for _, d, _ in linhas], dtype=np.int64)),
+        valores,
+    )
+
+    pedidos = em_pedido_por_codigo()
+    ordem = [produtos[int(pid)] for pid in indice.ids]
+    plano = PlanoMRP(
+        modo="exato",
+        indice=indice,
+        produtos=produtos,
+        meta={},
+        datas=datas,
+        bruto=bruto,
+        estoque=para_fixo([p["estoque"] for p in ordem]),
+        em_pedido=para_fixo([pedidos.get(p["codigo"], 0) for p in ordem]),
+        lead_time=np.array([p["lead_time"] for p in ordem], dtype=np.int64),
+    )
+    return plano, produtos
+
+
+def renetar(produto_ids: Iterable[int]) -> None:
+    """Re-liquida só os produtos informados e grava ResultadoMRP."""
+    produto_ids = set(produto_ids)
+    if not produto_ids:
+        return
+
+    plano, _ = _plano_persistido(produto_ids)
+    with transaction.atomic():
+        com_bruto = set() if plano is None else {int(p) for p in plano.indice.ids}
+        ResultadoMRP.objects.filter(produto_id__in=produto_ids - com_bruto).delete()
+        if plano is None:
+            return
+
+        resultados = []
+        for i, pid in enumerate(plano.indice.ids):
+            compra = plano.data_compra(i)
+            resultados.append(ResultadoMRP(
+                produto_id=int(pid),
+                necessario=de_fixo(plano.necessario[i]),
+                em_estoque=de_fixo(plano.estoque[i]),
+                em_pedido=de_fixo(plano.em_pedido[i]),
+                faltando=de_fixo(plano.falta_total[i]),
+                data_compra=date.fromisoformat(compra) if compra else None,
+            ))
+        ResultadoMRP.objects.bulk_create(
+            resultados,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["produto"],
+            update_fields=CAMPOS_RESULTADO,
+        )
+
+
+def renetar_todos() -> None:
+    """Re-liquida todos os produtos com necessidade (ex.: novo snapshot de pedidos)."""
+    renetar(NecessidadeBrutaMRP.objects.values_list("produto_id", flat=True).distinct())
+
+
+# =========================
+# Recálculo completo / consistência
+# =========================
+
+def recalcular_tudo() -> int:
+    """Refaz NecessidadeBrutaMRP e ResultadoMRP do zero. Retorna nº de produtos."""
+    plano = montar_plano(OrdemProducao.objects.all(), modo="exato", periodo="dia")
+    with transaction.atomic():
+        ResultadoMRP.objects.all().delete()
+        NecessidadeBrutaMRP.objects.all().delete()
+        if plano is None:
+            _marcar_inicializado()
+            return 0
+
+        brutos, resultados = [], []
+        for i, pid in enumerate(plano.indice.ids):
+            pid = int(pid)
+            for j, d in enumerate(plano.datas):
+                if plano.bruto[i, j]:
+                    brutos.append(NecessidadeBrutaMRP(produto_id=pid, data=d, quantidade=de_fixo(plano.bruto[i, j])))
+            compra = plano.data_compra(i)
+            nivel, codigo_pai = plano.meta[pid]
+            resultados.append(ResultadoMRP(
+                produto_id=pid,
+                necessario=de_fixo(plano.necessario[i]),
+                em_estoque=de_fixo(plano.estoque[i]),
+                em_pedido=de_fixo(plano.em_pedido[i]),
+                faltando=de_fixo(plano.falta_total[i]),
+                data_compra=date.fromisoformat(compra) if compra else None,
+                nivel=nivel,
+                codigo_pai=codigo_pai,
+            ))
+        NecessidadeBrutaMRP.objects.bulk_create(brutos, batch_size=1000)
+        ResultadoMRP.objects.bulk_create(resultados, batch_size=1000)
+        _marcar_inicializado()
+    return len(resultados)
+
+
+def _marcar_inicializado() -> None:
+    EstadoMRP.objects.update_or_create(pk=1, defaults={"inicializado_em": timezone.now()})
+
+
+def garantir_inicializado() -> bool:
+    """
+    Primeiro uso (sem a marca em EstadoMRP): faz o recálculo completo.
+    Retorna True se recalculou (o delta em curso já está incluído).
+    """
+    if EstadoMRP.objects.filter(pk=1).exists():
+        return False
+    recalcular_tudo()
+    return True
+
+
+def necessidades_persistidas() -> List[dict]:
+    """ResultadoMRP no formato de /api/mrp/ (mesmas chaves de necessidades_por_ordens)."""
+    garantir_inicializado()
+    return [
+        {
+            "id": r.produto_id,
+            "codigo": r.produto.codigo,
+            "nome": r.produto.nome,
+            "necessario": float(r.necessario),
+            "em_estoque": float(r.em_estoque),
+            "em_pedido": float(r.em_pedido),
+            "faltando": float(r.faltando),
+            "lead_time": r.produto.lead_time,
+            "data_compra": r.data_compra.isoformat() if r.data_compra else "",
+            "nivel": r.nivel,
+            "codigo_pai": r.codigo_pai,
+            "tipo": r.produto.tipo,
+        }
+        for r in ResultadoMRP.objects.select_related("produto").order_by("produto_id")
+    ]
+
+
+def verificar_consistencia(tolerancia: Decimal = Decimal("1e-6")) -> List[dict]:
+    """
+    Compara o ResultadoMRP persistido com um recálculo completo.
+    Retorna as divergências (lista vazia = consistente).
+    """
+    plano = montar_plano(OrdemProducao.objects.all(), modo="exato", periodo="dia")
+    esperado: Dict[int, dict] = {}
+    if plano is not None:
+        for i, pid in enumerate(plano.indice.ids):
+            compra = plano.data_compra(i)
+            esperado[int(pid)] = {
+                "necessario": de_fixo(plano.necessario[i]),
+                "em_estoque": de_fixo(plano.estoque[i]),
+                "em_pedido": de_fixo(plano.em_pedido[i]),
+                "faltando": de_fixo(plano.falta_total[i]),
+                "data_compra": date.fromisoformat(compra) if compra else None,
+            }
+    persistido = {
+        r.produto_id: {campo: getattr(r, campo) for campo in CAMPOS_RESULTADO}
+        for r in ResultadoMRP.objects.all()
+    }
+
+    divergencias = []
+    for pid in sorted(set(esperado) | set(persistido)):
+        e, p = esperado.get(pid), persistido.get(pid)
+        if e is None or p is None:
+            divergencias.append({"produto_id": pid, "esperado": e, "persistido": p})
+            continue
+        campos = [
+            c for c in CAMPOS_RESULTADO
+            if (c == "data_compra" and e[c] != p[c])
+            or (c != "data_compra" and abs(Decimal(e[c]) - Decimal(p[c])) > tolerancia)
+        ]
+        if campos:
+            divergencias.append({"produto_id": pid, "campos": campos, "esperado": e, "persistido": p})
+    return divergencias
@@ -0,0 +1,176 @@
+# core/utils/mrp_netting.py
+"""
+Netting do MRP em lote, sobre arrays NumPy.
+
+Em vez de um dict por componente recalculando ``faltando`` em Decimal a
+cada ocorrência, o cálculo é feito de uma vez:
+  1) cada produto ganha um índice denso (0..n-1);
+  2) a necessidade bruta de todas as OPs entra num array via scatter-add;
+  3) ``faltando = max(0, bruto - estoque - em_pedido)`` numa passada só.
+O /api/mrp/ usa estas etapas por período (ver mrp_fases.py).
+
+Modos:
+  - "exato" (padrão): ponto fixo com CASAS decimais em inteiros. Bate com
+    o resultado em Decimal; usa int64 quando cabe e inteiros Python
+    (dtype=object) quando houver risco de overflow.
+  - "float": float64, mais rápido, com o arredondamento usual de float.
+"""
+from __future__ import annotations
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+from . import pedidos_db
+from .pedidos_loader import get_snapshot_map
+
+CASAS = 12  # mesmas casas de NecessidadeUnitaria.quantidade
+_ESCALA = 10 ** CASAS
+LIMITE_INT64 = 2 ** 62  # folga para somas e subtrações
+
+MODOS = ("exato", "float")
+
+
+class IndiceDenso:
+    """Mapeia ids (esparsos) de produto para posições 0..n-1."""
+
+    def __init__(self, ids: Iterable[int]):
+        self.ids = np.array(sorted(set(ids)), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def posicoes(self, ids) -> np.ndarray:
+        return np.searchsorted(self.ids, np.asarray(ids, dtype=np.int64))
+
+
+# =========================
+# Ponto fixo
+# =========================
+
+def para_inteiro(valor) -> int:
+    if type(valor) is int:
+        return valor * _ESCALA
+    d = valor if isinstance(valor, Decimal) else Decimal(valor or 0)
+    # arredondar já escalado = quantize em CASAS casas, numa operação só
+    return int(d.scaleb(CASAS).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def para_fixo(valores: Sequence) -> np.ndarray:
+    """Decimal/int/float -> inteiros escalados por 10**CASAS."""
+    return _array_inteiro([para_inteiro(v) for v in valores])
+
+
+def de_fixo(valor) -> Decimal:
+    return Decimal(int(valor)).scaleb(-CASAS)
+
+
+def _array_inteiro(inteiros: List[int], limite: int = 0) -> np.ndarray:
+    maior = max((abs(i) for i in inteiros), default=0)
+    if max(maior, limite) < LIMITE_INT64:
+        return np.array(inteiros, dtype=np.int64)
+    return np.array(inteiros, dtype=object)
+
+
+# =========================
+# Etapas
+# =========================
+
+def necessidade_bruta(indice: IndiceDenso, por_lista: Dict[int, Tuple[np.ndarray, np.ndarray]],
+                      ops_por_lista: Dict[int, np.ndarray], dtype=np.int64) -> np.ndarray:
+    """
+    Scatter-add da necessidade bruta [produto x período]: para cada lista,
+    bruto[posições da lista] += qtd por unidade (coluna) * qtd das OPs da
+    lista em cada período (linha), um produto externo por lista.
+    ``por_lista``: {lista_id: (posições densas, qtd por unidade)} e
+    ``ops_por_lista``: {lista_id: qtd das OPs por período}, já no ``dtype``.
+    """
+    n_periodos = len(next(iter(ops_por_lista.values()), ()))
+    bruto = np.zeros((len(indice), n_periodos), dtype=dtype)
+    for lista_id, qtd_ops in ops_por_lista.items():
+        pos, q = por_lista.get(lista_id, (None, None))
+        if pos is None:
+            continue
+        # posições únicas dentro da lista (NecessidadeUnitaria: uma linha por lista/produto)
+        bruto[pos] += np.multiply.outer(q, qtd_ops)
+    return bruto
+
+
+def liquidar(bruto: np.ndarray, estoque: np.ndarray, em_pedido: np.ndarray) -> np.ndarray:
+    """faltando = max(0, bruto - estoque - em_pedido), vetorizado."""
+    return np.maximum(bruto - estoque - em_pedido, 0)
+
+
+def valores_produto(indice: IndiceDenso, por_id: Dict[int, object], modo: str = "exato") -> np.ndarray:
+    """Array denso (na ordem do índice) a partir de {produto_id: valor}."""
+    valores = [por_id.get(int(pid), 0) for pid in indice.ids]
+    if modo == "float":
+        return np.array([float(v or 0) for v in valores], dtype=np.float64)
+    return para_fixo(valores)
+
+
+def _compacto(d: Decimal) -> Decimal:
+    # tira zeros à direita sem cair em notação exponencial (1E+2)
+    return d.quantize(Decimal(1)) if d == d.to_integral() else d.normalize()
+
+
+def para_decimal(arr: np.ndarray, modo: str = "exato") -> List[Decimal]:
+    if modo == "float":
+        return [_compacto(Decimal(repr(float(v)))) for v in arr]
+    return [_compacto(de_fixo(v)) for v in arr]
+
+
+def para_float(arr: np.ndarray, modo: str = "exato") -> list:
+    """Array (1-D ou 2-D) -> floats em listas do Python, convertido de uma vez."""
+    arr = np.asarray(arr)
+    if modo == "float":
+        return arr.astype(np.float64).tolist()
+    if arr.dtype == object:
+        # inteiros Python (fora do int64): conversão exata, elemento a elemento
+        return np.vectorize(lambda v: float(de_fixo(v)), otypes=[np.float64])(arr).tolist()
+    # int64 -> float64 é exato até 2**53 e a divisão por 10**12 arredonda uma vez só,
+    # igual ao float(Decimal) nessa faixa
+    return (arr / _ESCALA).tolist()
+
+
+def em_pedido_por_codigo() -> Dict[str, Decimal]:
+    """
+    Saldo em pedido (compras abertas) por código; vazio se não houve upload.
+    Lê a tabela EmPedidoProduto; sem carga no banco, o snapshot em arquivo.
+    """
+    # a origem é escolhida pela carga, não pelo saldo: carga sem saldo continua vazia
+    if pedidos_db.carregado():
+        return pedidos_db.em_pedido_por_codigo()
+    try:
+        return get_snapshot_map()
+    except FileNotFoundError:
+        return {}
+
+
+# =========================
+# /api/mrp/detalhado/
+# =========================
+
+def liquidar_acumulado(acumulado: Dict[int, dict], modo: str = "exato") -> Dict[int, dict]:
+    """
+    Netting do resultado detalhado (saída de ``adicionar_detalhes``) numa
+    passada só: preenche ``em_pedido`` e ``faltando`` de cada componente.
+    """
+    if not acumulado:
+        return acumulado
+
+    indice = IndiceDenso(acumulado)
+    pedidos = em_pedido_por_codigo()
+    bruto = valores_produto(indice, {pid: c["necessario"] for pid, c in acumulado.items()}, modo)
+    estoque = valores_produto(indice, {pid: c["em_estoque"] for pid, c in acumulado.items()}, modo)
+    em_pedido = valores_produto(
+        indice, {pid: pedidos.get(c["codigo"], 0) for pid, c in acumulado.items()}, modo
+    )
+    faltando = para_decimal(liquidar(bruto, estoque, em_pedido), modo)
+    em_pedido = para_decimal(em_pedido, modo)
+
+    for i, pid in enumerate(indice.ids):
+        comp = acumulado[int(pid)]
+        comp["em_pedido"] = em_pedido[i]
+        comp["faltando"] = faltando[i]
+    return acumulado
@@ -0,0 +1,251 @@
+# core/utils/necessidade_unitaria.py
+"""
+Necessidade por unidade (BOM achatada) de cada Lista Técnica.
+
+Mantém a tabela materializada ``NecessidadeUnitaria``:
+    {lista_id: {produto_id: qtd_por_unidade}}
+onde qtd_por_unidade é a soma, por todos os caminhos via sublista, do
+produto de ``quantidade * ponderacao_operacao / 100``.
+
+Só muda quando uma linha de BOM muda, então é reconstruída (apenas para a
+lista alterada e suas ancestrais) pelos signals de BOM. Com ela o
+/api/mrp/ vira uma multiplicação esparsa por OP, sem caminhar a árvore
+(ver mrp_netting.py).
+"""
+from __future__ import annotations
+import logging
+import threading
+import weakref
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.db import transaction
+from django.dispatch import Signal
+
+from ..models import NecessidadeUnitaria
+from .bom_estrutura import EstruturaBOM, ItemBOM
+from .bom_grafo import CicloBOMError, ordem_topologica
+
+logger = logging.getLogger(__name__)
+
+
+# Enviado após cada reconstrução com as quantidades por unidade antes/depois:
+#   antes / depois: {lista_id: {produto_id: Decimal}} (só listas reconstruídas)
+necessidades_reconstruidas = Signal()
+
+
+@dataclass
+class LinhaAchatada:
+    quantidade: Decimal
+    nivel: int
+    # lista que contém o componente no último caminho percorrido
+    lista_origem_id: int
+
+
+def _sublistas(filhos: Dict[int, List[ItemBOM]], lista_id: int):
+    return [i.sublista_id for i in filhos.get(lista_id, []) if i.sublista_id is not None and i.qpond_unidade != 0]
+
+
+def achatar(filhos: Dict[int, List[ItemBOM]], lista_id: int,
+            memo: Optional[Dict[int, Dict[int, LinhaAchatada]]] = None) -> Dict[int, LinhaAchatada]:
+    """
+    {produto_id: LinhaAchatada} por UNIDADE de ``lista_id``.
+    A ordem das chaves é a ordem em que a explosão encontra cada produto.
+
+    Sem recursão: as sublistas alcançáveis ainda fora de ``memo`` entram em
+    ``ordem_topologica`` e são achatadas na ordem inversa (filhos antes dos
+    pais), cada uma uma vez, a partir das já prontas. Levanta CicloBOMError
+    se a estrutura voltar para uma lista acima.
+    """
+    if memo is None:
+        memo = {}
+    if lista_id in memo:
+        return memo[lista_id]
+
+    sub_de: Dict[int, List[int]] = {}
+    fila = deque([lista_id])
+    while fila:
+        lid = fila.popleft()
+        if lid in sub_de:
+            continue
+        sub_de[lid] = [s for s in _sublistas(filhos, lid) if s not in memo]
+        fila.extend(sub_de[lid])
+
+    for lid in reversed(ordem_topologica(sub_de, sub_de)):
+        memo[lid] = _achatar_lista(filhos, lid, memo)
+    return memo[lista_id]
+
+
+def _achatar_lista(filhos: Dict[int, List[ItemBOM]], lista_id: int,
+                   memo: Dict[int, Dict[int, LinhaAchatada]]) -> Dict[int, LinhaAchatada]:
+    # as sublistas já estão em ``memo`` (ordem topológica inversa)
+    out: Dict[int, LinhaAchatada] = {}
+    for item in filhos.get(lista_id, []):
+        qpond = item.qpond_unidade
+        if qpond == 0:
+            continue
+        if item.componente_id is not None:
+            atual = out.get(item.componente_id)
+            total = qpond if atual is None else atual.quantidade + qpond
+            out[item.componente_id] = LinhaAchatada(total, 0, lista_id)
+        elif item.sublista_id is not None:
+            for produto_id, sub in memo[item.sublista_id].items():
+                atual = out.get(produto_id)
+                parcela = qpond * sub.quantidade
+                total = parcela if atual is None else atual.quantidade + parcela
+                out[produto_id] = LinhaAchatada(total, sub.nivel + 1, sub.lista_origem_id)
+    return out
+
+
+def ancestrais(filhos: Dict[int, List[ItemBOM]], lista_ids: Iterable[int]) -> Set[int]:
+    """As listas informadas + todas que as usam como sublista (direta ou indiretamente)."""
+    pais_de: Dict[int, Set[int]] = defaultdict(set)
+    for pai_id, itens in filhos.items():
+        for item in itens:
+            if item.sublista_id is not None:
+                pais_de[item.sublista_id].add(pai_id)
+
+    vistos: Set[int] = set()
+    fila = deque(lista_ids)
+    while fila:
+        lid = fila.popleft()
+        if lid in vistos:
+            continue
+        vistos.add(lid)
+        fila.extend(pais_de.get(lid, ()))
+    return vistos
+
+
+def reconstruir(lista_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Reconstrói a tabela para ``lista_ids`` e ancestrais (ou para todas se None).
+    Retorna o número de linhas gravadas.
+    """
+    estrutura = EstruturaBOM.carregar()
+    if lista_ids is None:
+        afetadas = set(estrutura.listas)
+    else:
+        afetadas = ancestrais(estrutura.filhos, lista_ids) & set(estrutura.listas)
+
+    memo: Dict[int, Dict[int, LinhaAchatada]] = {}
+    novas = [
+        NecessidadeUnitaria(
+            lista_id=lista_id,
+            produto_id=produto_id,
+            quantidade=linha.quantidade,
+            nivel=linha.nivel,
+            lista_origem_id=linha.lista_origem_id,
+        )
+        for lista_id in sorted(afetadas)
+        for produto_id, linha in achatar(estrutura.filhos, lista_id, memo).items()
+    ]
+
+    with transaction.atomic():
+        qs = NecessidadeUnitaria.objects.all()
+        if lista_ids is not None:
+            qs = qs.filter(lista_id__in=afetadas)
+        antes: Dict[int, Dict[int, Decimal]] = defaultdict(dict)
+        for lista_id, produto_id, quantidade in qs.values_list("lista_id", "produto_id", "quantidade"):
+            antes[lista_id][produto_id] = quantidade
+        qs.delete()
+        NecessidadeUnitaria.objects.bulk_create(novas, batch_size=1000)
+
+        depois = {lista_id: {p: linha.quantidade for p, linha in memo[lista_id].items()} for lista_id in afetadas}
+        necessidades_reconstruidas.send(sender=NecessidadeUnitaria, antes=dict(antes), depois=depois)
+    return len(novas)
+
+
+# --- reconstrução agendada (uma vez por transação) ---
+# Cada agendamento é um callback de on_commit com os próprios ids: se o
+# savepoint ou a transação em que foi feito é desfeito, o Django descarta o
+# callback e os ids vão junto. O lote da transação só guarda referências
+# fracas aos pedidos, então o que sobra nele é exatamente o que vai commitar.
+_local = threading.local()
+
+
+class _Lote:
+    def __init__(self) -> None:
+        self.pedidos: "weakref.WeakSet[_Pedido]" = weakref.WeakSet()
+        self.executado = False
+
+
+class _Pedido:
+    def __init__(self, lote: _Lote, lista_ids: Set[int]) -> None:
+        self.lote = lote
+        self.lista_ids = lista_ids
+
+    def __call__(self) -> None:
+        # o primeiro pedido a rodar reconstrói tudo o que sobreviveu no lote
+        if self.lote.executado:
+            return
+        self.lote.executado = True
+        ids = set().union(*(p.lista_ids for p in list(self.lote.pedidos)))
+        try:
+            reconstruir(ids)
+        except CicloBOMError as e:
+            # gravado sem passar por BOM.clean/BOMSerializer: mantém a tabela anterior
+            logger.error("BOM achatada não reconstruída: %s", e)
+
+
+def _lote_atual() -> _Lote:
+    ref = getattr(_local, "lote", None)
+    lote = ref() if ref is not None else None
+    if lote is None or lote.executado:
+        # sem pedidos vivos (transação commitada ou desfeita): lote novo
+        lote = _Lote()
+        _local.lote = weakref.ref(lote)
+    return lote
+
+
+def agendar_reconstrucao(lista_ids: Iterable[int]) -> None:
+    """
+    Marca listas para reconstruir no commit da transação atual. Várias
+    alterações de BOM na mesma transação geram uma única reconstrução, e
+    exclusões em cascata não regravam linhas de listas que estão sumindo.
+    O que foi agendado num savepoint ou transação desfeita não é reconstruído.
+    """
+    ids = {lid for lid in lista_ids if lid is not None}
+    if not ids:
+        return
+    lote = _lote_atual()
+    pedido = _Pedido(lote, ids)
+    lote.pedidos.add(pedido)
+    transaction.on_commit(pedido)
+
+
+# =========================
+# Uso no MRP
+# =========================
+
+def carregar_tabela(lista_ids: Iterable[int]):
+    """
+    Lê a tabela para as listas informadas (1 consulta, já com os dados do
+    produto e o código da lista de origem).
+    Retorna {lista_id: [(produto_id, quantidade, nivel, codigo_origem, produto_dict), ...]}.
+    """
+    tabela = defaultdict(list)
+    campos = (
+        "lista_id", "produto_id", "quantidade", "nivel", "lista_origem__codigo",
+        "produto__codigo", "produto__nome", "produto__estoque", "produto__lead_time", "produto__tipo",
+    )
+    qs = (
+        NecessidadeUnitaria.objects
+        .filter(lista_id__in=set(lista_ids))
+        .order_by("id")
+        .values_list(*campos)
+    )
+    for (lista_id, produto_id, quantidade, nivel, codigo_origem,
+         codigo, nome, estoque, lead_time, tipo) in qs:
+        tabela[lista_id].append((
+            produto_id, quantidade, nivel, codigo_origem or "",
+            {
+                "codigo": codigo or "",
+                "nome": nome or "",
+                "estoque": Decimal(estoque or 0),
+                "lead_time": int(lead_time or 0),
+                "tipo": tipo or "componente",
+            },
+        ))
+    return tabela
@@ -0,0 +1,161 @@
+# core/utils/pedidos_db.py
+"""
+Pedidos de compra no banco: ``PedidoCompra`` (uma linha por item do
+arquivo) e ``EmPedidoProduto`` (saldo agregado por peça).
+
+O upload (views_pedidos.UploadPedidosView) chama ``carregar`` com o DF
+já normalizado pelo pedidos_loader; a troca é feita numa transação só,
+então quem consulta vê a carga antiga ou a nova inteira. Enquanto não
+houver carga no banco (instalações antigas), o netting e a tela seguem
+lendo os arquivos do pedidos_loader.
+
+O id de cada PedidoCompra é a posição da linha no DF + 1, então os
+filtros de texto da consulta saem dos índices de trigramas que o
+pedidos_loader grava com o DF (sem varrer a tabela com ``icontains``) e
+viram uma lista de ids; o banco só aplica datas, ordenação e a página.
+"""
+from __future__ import annotations
+import json
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from django.db import connection, transaction
+from django.db.models import F, Q, Sum
+from django.db.models.expressions import RawSQL
+
+from ..models import EmPedidoProduto, PedidoCompra
+from . import pedidos_loader
+
+LOTE = 5000
+
+ORDENACOES = {"pedido_num", "pieza", "qty", "data_prevista", "org", "fornecedor", "ord_qty", "recv_qty"}
+
+
+def _texto(v) -> str:
+    return "" if v is None or (isinstance(v, float) and v != v) else str(v).strip()
+
+
+def _decimal(v) -> Decimal:
+    return Decimal("0") if v is None or v != v else Decimal(str(round(float(v), 6)))
+
+
+def _apagar_tudo(model) -> None:
+    # um DELETE só, sem carregar as linhas (não há sinais nem cascata nessas tabelas)
+    with connection.cursor() as cur:
+        cur.execute(f"DELETE FROM {connection.ops.quote_name(model._meta.db_table)}")
+
+
+def carregar(df: pd.DataFrame) -> int:
+    """Substitui os pedidos do banco pelas linhas de ``df``; devolve quantas gravou."""
+    datas = pd.to_datetime(df["data_prevista"], errors="coerce")
+    colunas = zip(
+        df["pedido_num"].tolist(), df["pieza"].tolist(), df["qty"].tolist(), df["ord_qty"].tolist(),
+        df["recv_qty"].tolist(), df["fornecedor"].tolist(), df["org"].tolist(),
+        [d.date() if pd.notna(d) else None for d in datas],
+    )
+    objs = [
+        PedidoCompra(
+            id=posicao + 1, pedido_num=_texto(num), pieza=_texto(pieza), qty=_decimal(qty), ord_qty=_decimal(ordq),
+            recv_qty=_decimal(recv), fornecedor=_texto(forn), org=_texto(org), data_prevista=data,
+        )
+        for posicao, (num, pieza, qty, ordq, recv, forn, org, data) in enumerate(colunas)
+        if _texto(pieza)
+    ]
+    with transaction.atomic():
+        _apagar_tudo(PedidoCompra)
+        PedidoCompra.objects.bulk_create(objs, batch_size=LOTE)
+        materializar()
+    return len(objs)
+
+
+def materializar() -> None:
+    """Refaz ``EmPedidoProduto`` a partir de ``PedidoCompra`` (GROUP BY pieza)."""
+    somas = PedidoCompra.objects.values("pieza").annotate(total=Sum("qty")).order_by()
+    _apagar_tudo(EmPedidoProduto)
+    EmPedidoProduto.objects.bulk_create(
+        [EmPedidoProduto(pieza=s["pieza"], quantidade=s["total"] or 0) for s in somas],
+        batch_size=LOTE,
+    )
+
+
+def carregado() -> bool:
+    return PedidoCompra.objects.exists()
+
+
+def em_pedido_por_codigo() -> Dict[str, Decimal]:
+    return dict(EmPedidoProduto.objects.values_list("pieza", "quantidade"))
+
+
+def _por_ids(qs, ids: np.ndarray):
+    if connection.vendor == "sqlite":
+        # a lista vai num parâmetro só (JSON): não esbarra no limite de variáveis
+        return qs.filter(pk__in=RawSQL("SELECT value FROM json_each(%s)", [json.dumps(ids.tolist())]))
+    return qs.filter(pk__in=ids.tolist())
+
+
+def _filtrar_icontains(qs, pieza, org, fornecedor, search):
+    if pieza:
+        qs = qs.filter(pieza__icontains=pieza)
+    if org:
+        qs = qs.filter(org__icontains=org)
+    if fornecedor:
+        qs = qs.filter(fornecedor__icontains=fornecedor)
+    if search:
+        qs = qs.filter(Q(pedido_num__icontains=search) | Q(pieza__icontains=search) | Q(fornecedor__icontains=search))
+    return qs
+
+
+def _filtrar_texto(qs, pieza, org, fornecedor, search):
+    try:
+        linhas = pedidos_loader.linhas_filtradas(pieza, org, fornecedor, search)
+    except FileNotFoundError:
+        # sem o DF no disco (nem para refazer os índices): varre no banco
+        return _filtrar_icontains(qs, pieza, org, fornecedor, search)
+    return qs if linhas is None else _por_ids(qs, linhas + 1)
+
+
+def _consulta(
+    pieza: str | None = None,
+    org: str | None = None,
+    fornecedor: str | None = None,
+    search: str | None = None,
+    prazo_ini: str | None = None,
+    prazo_fim: str | None = None,
+    limit: int = 50,
+    offset: int = 0,
+    sort_by: str | None = None,
+    sort_dir: str = "asc",
+) -> Tuple[int, pd.DataFrame]:
+    """Mesmos filtros do ``pedidos_loader.query``; (total, página em colunas)."""
+    qs = _filtrar_texto(PedidoCompra.objects.all(), pieza, org, fornecedor, search)
+    if prazo_ini:
+        ini = pd.to_datetime(prazo_ini, errors="coerce")
+        qs = qs.filter(data_prevista__gte=ini.date()) if pd.notna(ini) else qs.none()
+    if prazo_fim:
+        fim = pd.to_datetime(prazo_fim, errors="coerce")
+        qs = qs.filter(data_prevista__lte=fim.date()) if pd.notna(fim) else qs.none()
+
+    if sort_by in ORDENACOES:
+        # vazios no fim nos dois sentidos, como o sort_values do DataFrame
+        campo = F(sort_by)
+        qs = qs.order_by(campo.desc(nulls_last=True) if str(sort_dir).lower() == "desc" else campo.asc(nulls_last=True), "id")
+    else:
+        qs = qs.order_by("id")
+
+    total = qs.count()
+    campos = pedidos_loader.CAMPOS
+    pagina = pd.DataFrame.from_records(list(qs.values_list(*campos)[offset: offset + limit]), columns=campos)
+    return total, pedidos_loader.colunas_json(pagina)
+
+
+def query(**filtros) -> Tuple[int, List[Dict[str, Any]]]:
+    """Mesmos filtros/saída do ``pedidos_loader.query``, no banco."""
+    total, pagina = _consulta(**filtros)
+    return total, pagina.to_dict("records")
+
+
+def query_json(**filtros) -> bytes:
+    """Como ``pedidos_loader.query_json``: a resposta inteira em bytes."""
+    return pedidos_loader.resposta_json(*_consulta(**filtros))
@@ -1,11 +1,73 @@
 from __future__ import annotations
+import os
+from dataclasses import dataclass
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import pickle
+import shutil
 from decimal import Decimal
-from typing import Tuple, List, Dict, Any
+from typing import Tuple, List, Dict, Any, Callable, Optional
 from django.conf import settings
 
+from .indice_texto import IndiceTexto
+from .planilha_leitura import ler_planilha
+
+# colunas com índice de trigramas (filtros e ?search=), gravado ao lado do .pkl
+COLUNAS_INDICE = ("pieza", "org", "fornecedor", "pedido_num")
+_indices: Dict[str, Tuple[float, Dict[str, IndiceTexto]]] = {}
+
+
+# =========================
+# Cache por processo (DF e snapshot)
+# =========================
+# O valor em memória vale enquanto o arquivo no disco tiver o mesmo carimbo
+# (mtime_ns, tamanho). Upload em qualquer worker troca o arquivo (os.replace)
+# e os outros recarregam na próxima chamada; o worker do upload já fica quente.
+@dataclass
+class _Entrada:
+    caminho: Optional[str] = None
+    carimbo: Optional[tuple] = None
+    valor: Any = None
+    hits: int = 0
+    misses: int = 0
+
+_cache: Dict[str, _Entrada] = {"df": _Entrada(), "snapshot": _Entrada()}
+
+def _carimbo(path: Path) -> Optional[tuple]:
+    try:
+        st = Path(path).stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _em_cache(nome: str, path: Path, carregar: Callable[[], Any]) -> Any:
+    ent = _cache[nome]
+    carimbo = _carimbo(path)
+    if carimbo is not None and ent.caminho == str(path) and ent.carimbo == carimbo:
+        ent.hits += 1
+        return ent.valor
+    ent.misses += 1
+    valor = carregar()
+    _guardar(nome, path, valor)
+    return valor
+
+def _guardar(nome: str, path: Path, valor: Any) -> None:
+    ent = _cache[nome]
+    ent.caminho, ent.carimbo, ent.valor = str(path), _carimbo(path), valor
+
+def _gravar_atomico(path: Path, escrever: Callable[[Path], None]) -> None:
+    """Grava num temporário e troca: quem lê nunca pega o arquivo pela metade."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    escrever(tmp)
+    os.replace(tmp, path)
+
+def estatisticas_cache() -> Dict[str, Dict[str, int]]:
+    """Hits/misses do cache em memória deste processo."""
+    return {nome: {"hits": e.hits, "misses": e.misses} for nome, e in _cache.items()}
+
 def _paths():
     base = Path(getattr(settings, "PEDIDOS_PATH", settings.BASE_DIR / "data" / "pedidos.xlsx"))
     # Se base é .xlsx mas existir .csv/.xls ao lado, preferimos o que existir
@@ -29,6 +91,79 @@ def clear_cache():
     for p in (pkl_df, snap):
         try: Path(p).unlink()
         except FileNotFoundError: pass
+    shutil.rmtree(_indice_path(pkl_df), ignore_errors=True)
+    _indices.clear()
+    for ent in _cache.values():
+        ent.caminho = ent.carimbo = ent.valor = None
+
+def _indice_path(pkl_df: Path) -> Path:
+    return Path(pkl_df).with_suffix(".indice")
+
+def _salvar_indices(df: pd.DataFrame, pkl_df: Path) -> None:
+    pasta = _indice_path(pkl_df)
+    shutil.rmtree(pasta, ignore_errors=True)
+    pasta.mkdir(parents=True)
+    for col in COLUNAS_INDICE:
+        IndiceTexto.de_serie(df[col]).salvar(pasta, col)
+
+def _get_indices(df: pd.DataFrame | None = None) -> Dict[str, IndiceTexto]:
+    """Índices do DF atual (mmap); refeitos se estiverem mais velhos que o .pkl."""
+    _, pkl_df, _ = _paths()
+    pasta = _indice_path(pkl_df)
+    versao = Path(pkl_df).stat().st_mtime if Path(pkl_df).exists() else 0.0
+    atual = _indices.get(str(pasta))
+    if atual and atual[0] == versao:
+        return atual[1]
+    try:
+        if (pasta / "pieza.chaves.npy").stat().st_mtime < versao:
+            raise FileNotFoundError
+        abertos = {col: IndiceTexto.abrir(pasta, col) for col in COLUNAS_INDICE}
+    except FileNotFoundError:
+        _salvar_indices(get_df(force=False) if df is None else df, pkl_df)
+        abertos = {col: IndiceTexto.abrir(pasta, col) for col in COLUNAS_INDICE}
+    _indices[str(pasta)] = (versao, abertos)
+    return abertos
+
+def linhas_filtradas(
+    pieza: str | None = None,
+    org: str | None = None,
+    fornecedor: str | None = None,
+    search: str | None = None,
+    df: pd.DataFrame | None = None,
+) -> Optional[np.ndarray]:
+    """
+    Posições (ordenadas) do DF atual que passam nos filtros de texto, só
+    pelos índices; None = nenhum filtro de texto. Também usado pela
+    consulta no banco (pedidos_db), onde a posição é o id - 1.
+    """
+    if not (pieza or org or fornecedor or search):
+        return None
+    indices = _get_indices(df)
+    linhas = None
+    for col, termo in (("pieza", pieza), ("org", org), ("fornecedor", fornecedor)):
+        if termo:
+            achadas = indices[col].linhas_com(str(termo))
+            linhas = achadas if linhas is None else np.intersect1d(linhas, achadas, assume_unique=True)
+    if search:
+        s = str(search)
+        alguma = np.union1d(
+            np.union1d(indices["pedido_num"].linhas_com(s), indices["pieza"].linhas_com(s)),
+            indices["fornecedor"].linhas_com(s),
+        )
+        linhas = alguma if linhas is None else np.intersect1d(linhas, alguma, assume_unique=True)
+    return linhas
+
+# nomes aceitos para cada coluna (sem distinção de maiúsculas); só estes são lidos
+CANDIDATAS = {
+    "part": ("ORL_PART", "PART", "PIEZA", "PAR_CODE"),
+    "ord":  ("ORL_ORDQTY", "ORD_QTY", "ORDER_QTY", "QTY"),
+    "recv": ("ORL_RECVQTY", "RECV_QTY", "RECEIVED_QTY"),
+    "date": ("ORL_UDFDATE01", "DATA_PREVISTA", "DT_PREVISTA", "PROMISED_DATE"),
+    "forn": ("ORL_SUPPLIER", "FORNECEDOR", "VENDOR"),
+    "org":  ("ORL_ORDER_ORG", "ORL_PART_ORG", "ORG"),
+    "pnum": ("ORL_ORDER", "PEDIDO", "PO_NUMBER"),
+}
+_LIDAS = {n.lower() for nomes in CANDIDATAS.values() for n in nomes}
 
 def _find_col(df: pd.DataFrame, *options: str) -> str | None:
     """Procura coluna por nomes possíveis (case-insensitive)."""
@@ -41,13 +176,13 @@ def _find_col(df: pd.DataFrame, *options: str) -> str | None:
 
 def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     # Localiza colunas com tolerância a variações
-    col_part = _find_col(df, "ORL_PART", "PART", "PIEZA", "PAR_CODE")
-    col_ord  = _find_col(df, "ORL_ORDQTY", "ORD_QTY", "ORDER_QTY", "QTY")
-    col_recv = _find_col(df, "ORL_RECVQTY", "RECV_QTY", "RECEIVED_QTY")
-    col_date = _find_col(df, "ORL_UDFDATE01", "DATA_PREVISTA", "DT_PREVISTA", "PROMISED_DATE")
-    col_forn = _find_col(df, "ORL_SUPPLIER", "FORNECEDOR", "VENDOR")
-    col_org  = _find_col(df, "ORL_ORDER_ORG", "ORL_PART_ORG", "ORG")
-    col_pnum = _find_col(df, "ORL_ORDER", "PEDIDO", "PO_NUMBER")
+    col_part = _find_col(df, *CANDIDATAS["part"])
+    col_ord  = _find_col(df, *CANDIDATAS["ord"])
+    col_recv = _find_col(df, *CANDIDATAS["recv"])
+    col_date = _find_col(df, *CANDIDATAS["date"])
+    col_forn = _find_col(df, *CANDIDATAS["forn"])
+    col_org  = _find_col(df, *CANDIDATAS["org"])
+    col_pnum = _find_col(df, *CANDIDATAS["pnum"])
 
     if not col_part:
         raise ValueError("Coluna de código da peça não encontrada (ex.: ORL_PART / PIEZA).")
@@ -95,42 +230,49 @@ def _normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 def get_df(force: bool = False) -> pd.DataFrame:
+    """DF normalizado (compartilhado: não alterar in-place)."""
     src, pkl_df, _ = _paths()
     if not force and Path(pkl_df).exists():
-        return pd.read_pickle(pkl_df)
+        return _em_cache("df", pkl_df, lambda: pd.read_pickle(pkl_df))
     if not Path(src).exists():
         raise FileNotFoundError(f"Arquivo de pedidos não encontrado em: {src}")
-    # leitura conforme extensão
-    if src.suffix.lower() in (".xlsx", ".xls"):
-        df = pd.read_excel(src)
-    else:
-        df = pd.read_csv(src)
+    # leitura conforme extensão (xlsx em streaming, só as colunas usadas)
+    df, leitura = ler_planilha(src, colunas=lambda nome: nome.lower() in _LIDAS)
     df = _normalize_columns(df)
-    Path(pkl_df).parent.mkdir(parents=True, exist_ok=True)
-    df.to_pickle(pkl_df)
+    df.attrs["leitura"] = leitura
+    _gravar_atomico(pkl_df, df.to_pickle)
+    _guardar("df", pkl_df, df)
+    _salvar_indices(df, pkl_df)  # uma vez por upload; as consultas só abrem os .npy
     return df
 
-def build_snapshot(force: bool = False) -> Dict[str, Decimal]:
+def _ler_snapshot(snap: Path) -> Dict[str, Decimal]:
+    with open(snap, "rb") as fh:
+        return pickle.load(fh)
+
+def build_snapshot(force: bool = False, df: pd.DataFrame | None = None) -> Dict[str, Decimal]:
     _, _, snap = _paths()
     if not force and Path(snap).exists():
-        with open(snap, "rb") as fh:
-            return pickle.load(fh)
-    df = get_df(force=force)
+        return _em_cache("snapshot", snap, lambda: _ler_snapshot(snap))
+    if df is None:
+        df = get_df(force=force)
     serie = df.groupby("pieza", dropna=True)["qty"].sum()
     out = { str(k).strip(): Decimal(str(v)) for k, v in serie.items() if str(k).strip() }
-    Path(snap).parent.mkdir(parents=True, exist_ok=True)
-    with open(snap, "wb") as fh:
-        pickle.dump(out, fh)
+
+    def escrever(tmp: Path):
+        with open(tmp, "wb") as fh:
+            pickle.dump(out, fh)
+    _gravar_atomico(snap, escrever)
+    _guardar("snapshot", snap, out)
     return out
 
 def get_snapshot_map() -> Dict[str, Decimal]:
-    _, _, snap = _paths()
-    if Path(snap).exists():
-        with open(snap, "rb") as fh:
-            return pickle.load(fh)
+    """{pieza: Decimal} em pedido (compartilhado: não alterar in-place)."""
     return build_snapshot(force=False)
 
-def query(
+CAMPOS = ["pedido_num", "pieza", "qty", "ord_qty", "recv_qty", "fornecedor", "org", "data_prevista"]
+
+
+def _pagina(
     pieza: str | None = None,
     org: str | None = None,
     fornecedor: str | None = None,
@@ -141,23 +283,14 @@ def query(
     offset: int = 0,
     sort_by: str | None = None,
     sort_dir: str = "asc",
-) -> Tuple[int, List[Dict[str, Any]]]:
+) -> Tuple[int, pd.DataFrame]:
+    """(total filtrado, página já convertida coluna a coluna para JSON)."""
     df = get_df(force=False)
 
-    if pieza:
-        df = df[df["pieza"].astype(str).str.contains(str(pieza), case=False, na=False)]
-    if org:
-        df = df[df["org"].astype(str).str.contains(str(org), case=False, na=False)]
-    if fornecedor:
-        df = df[df["fornecedor"].astype(str).str.contains(str(fornecedor), case=False, na=False)]
-    if search:
-        s = str(search)
-        mask = (
-            df["pedido_num"].astype(str).str.contains(s, case=False, na=False) |
-            df["pieza"].astype(str).str.contains(s, case=False, na=False) |
-            df["fornecedor"].astype(str).str.contains(s, case=False, na=False)
-        )
-        df = df[mask]
+    # filtros de texto: conjuntos de linhas do índice, intersectados
+    linhas = linhas_filtradas(pieza, org, fornecedor, search, df=df)
+    if linhas is not None:
+        df = df.iloc[linhas]
 
     if "data_prevista" in df.columns:
         if prazo_ini:
@@ -171,19 +304,45 @@ def query(
         df = df.sort_values(by=sort_by, ascending=ascending)
 
     total = len(df)
-    df = df.iloc[offset: offset + limit]
-
-    rows = []
-    for _, r in df.iterrows():
-        rows.append({
-            "pedido_num": str(r.get("pedido_num", "")),
-            "pieza": str(r.get("pieza", "")),
-            "qty": float(r.get("qty", 0)),
-            "ord_qty": float(r.get("ord_qty", 0)),
-            "recv_qty": float(r.get("recv_qty", 0)),
-            "fornecedor": str(r.get("fornecedor", "")),
-            "org": str(r.get("org", "")),
-            "data_prevista": (pd.to_datetime(r["data_prevista"]).date().isoformat()
-                              if "data_prevista" in r and pd.notnull(r["data_prevista"]) else None),
-        })
-    return total, rows
+    return total, colunas_json(df.iloc[offset: offset + limit])
+
+
+def colunas_json(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Página com os ``CAMPOS`` já no tipo do JSON, uma conversão por coluna
+    (vazios: "" no texto, null na data).
+    """
+    pagina = pd.DataFrame(index=range(len(df)))
+    for c in CAMPOS:
+        col = df[c].to_numpy() if c in df.columns else np.full(len(df), None)
+        if c in ("qty", "ord_qty", "recv_qty"):
+            pagina[c] = pd.to_numeric(pd.Series(col), errors="coerce").fillna(0).astype("float64").to_numpy()
+        elif c == "data_prevista":
+            datas = pd.to_datetime(pd.Series(col), errors="coerce")
+            iso = datas.dt.strftime("%Y-%m-%d").to_numpy(dtype=object, na_value=None)
+            pagina[c] = pd.Series(iso, dtype=object)  # object: mantém None (vira null)
+        else:
+            texto = pd.Series(col, dtype=object)
+            pagina[c] = texto.where(texto.notna(), "").astype(str).astype(object).to_numpy()
+    return pagina
+
+
+def resposta_json(total: int, pagina: pd.DataFrame) -> bytes:
+    """``{"count": ..., "results": [...]}`` em bytes, escrito pelo ``to_json`` (C)."""
+    resultados = pagina.to_json(orient="records", force_ascii=False, double_precision=15)
+    return b'{"count": %d, "results": %s}' % (total, resultados.encode("utf-8"))
+
+
+def query(**filtros) -> Tuple[int, List[Dict[str, Any]]]:
+    """Filtros de ``_pagina``; devolve (total, linhas como dicts)."""
+    total, pagina = _pagina(**filtros)
+    return total, pagina.to_dict("records")
+
+
+def query_json(**filtros) -> bytes:
+    """
+    Caminho rápido do GET /api/pedidos/: a resposta inteira
+    ``{"count": ..., "results": [...]}`` já em bytes, escrita pelo
+    ``to_json`` (C) a partir das colunas da página.
+    """
+    return resposta_json(*_pagina(**filtros))
@@ -0,0 +1,217 @@
+# core/utils/planilha_leitura.py
+"""
+Leitura das planilhas de upload (estoque, pedidos) numa passada só.
+
+  - .xlsx: o XML da primeira aba é lido direto do zip, em blocos, pelo
+    parser expat (C) da biblioteca padrão; só as células das colunas
+    pedidas são convertidas (strings compartilhadas, números, datas pelo
+    formato do estilo). É o que consome o tempo no openpyxl, que monta
+    um objeto por célula de todas as colunas;
+  - .csv: ``read_csv`` com ``usecols``;
+  - .xls (formato antigo): ``read_excel``, que depende do xlrd.
+
+O resultado passa pelo mesmo ``TextParser`` que o ``read_excel`` usa, então
+os tipos das colunas saem iguais. Devolve também quantas linhas foram lidas
+e em quanto tempo, para o upload informar linhas/segundo.
+"""
+from __future__ import annotations
+import posixpath
+import time
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+from xml.parsers import expat
+
+import pandas as pd
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel
+from pandas.io.parsers import TextParser
+
+Seletor = Optional[Callable[[str], bool]]
+
+BLOCO = 1 << 20
+_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def _coluna(ref: str, cache: Dict[str, int]) -> int:
+    letras = ref.rstrip("0123456789")
+    idx = cache.get(letras)
+    if idx is None:
+        idx = 0
+        for ch in letras:
+            idx = idx * 26 + ord(ch) - 64
+        idx = cache[letras] = idx - 1
+    return idx
+
+
+def _caminho_primeira_aba(zf: zipfile.ZipFile) -> Tuple[str, bool]:
+    wb = ElementTree.fromstring(zf.read("xl/workbook.xml"))
+    pr = wb.find(f"{_NS}workbookPr")
+    data1904 = pr is not None and pr.get("date1904") in ("1", "true")
+    aba = wb.find(f"{_NS}sheets/{_NS}sheet")
+    rid = aba.get(f"{_NS_REL}id")
+    rels = ElementTree.fromstring(zf.read("xl/_rels/workbook.xml.rels"))
+    for rel in rels.iter(f"{_NS_PKG}Relationship"):
+        if rel.get("Id") == rid:
+            alvo = rel.get("Target")
+            caminho = alvo.lstrip("/") if alvo.startswith("/") else posixpath.normpath(posixpath.join("xl", alvo))
+            return caminho, data1904
+    return "xl/worksheets/sheet1.xml", data1904
+
+
+def _strings(zf: zipfile.ZipFile) -> List[str]:
+    try:
+        fh = zf.open("xl/sharedStrings.xml")
+    except KeyError:
+        return []
+    out = []
+    with fh:
+        for _, el in ElementTree.iterparse(fh):
+            if el.tag == f"{_NS}si":
+                # <t> direto ou vários <r><t> (texto formatado); <rPh> é fonética e fica de fora
+                partes = el.findall(f"{_NS}t") + el.findall(f"{_NS}r/{_NS}t")
+                out.append("".join(t.text or "" for t in partes))
+                el.clear()
+    return out
+
+
+def _estilos_data(zf: zipfile.ZipFile) -> set:
+    """Índices de estilo (atributo ``s`` da célula) cujo formato é de data."""
+    try:
+        st = ElementTree.fromstring(zf.read("xl/styles.xml"))
+    except KeyError:
+        return set()
+    formatos = dict(BUILTIN_FORMATS)
+    for nf in st.iter(f"{_NS}numFmt"):
+        formatos[int(nf.get("numFmtId"))] = nf.get("formatCode", "")
+    xfs = st.find(f"{_NS}cellXfs")
+    if xfs is None:
+        return set()
+    datas = set()
+    for i, xf in enumerate(xfs.findall(f"{_NS}xf")):
+        fmt = formatos.get(int(xf.get("numFmtId", 0)))
+        if fmt and is_date_format(fmt):
+            datas.add(str(i))
+    return datas
+
+
+def _numero(texto: str):
+    if "." in texto or "E" in texto or "e" in texto:
+        v = float(texto)
+        return int(v) if v.is_integer() else v  # igual ao read_excel
+    return int(texto)
+
+
+def _ler_xlsx(caminho: Path, colunas: Seletor) -> pd.DataFrame:
+    with zipfile.ZipFile(caminho) as zf:
+        aba, data1904 = _caminho_primeira_aba(zf)
+        strings = _strings(zf)
+        datas = _estilos_data(zf)
+        epoca = CALENDAR_MAC_1904 if data1904 else CALENDAR_WINDOWS_1900
+
+        cache_ref: Dict[str, int] = {}
+        linhas: List[list] = []
+        cabecalho: Optional[List[str]] = None
+        quer: Optional[Dict[int, int]] = None  # coluna da aba -> posição no DataFrame
+        linha: Dict[int, object] = {}
+        col, tipo, estilo, bruto, guardar, em_texto = -1, None, None, None, False, False
+
+        def inicio(nome, attrs):
+            nonlocal col, tipo, estilo, bruto, guardar, em_texto, linha
+            if nome == "c":
+                ref = attrs.get("r")
+                col = _coluna(ref, cache_ref) if ref else col + 1
+                guardar = quer is None or col in quer
+                tipo, estilo, bruto = attrs.get("t"), attrs.get("s"), None
+            elif nome == "v" or nome == "t":
+                em_texto = guardar
+                if guardar and bruto is None:
+                    bruto = ""
+            elif nome == "row":
+                linha = {}
+                col = -1
+
+        def texto(dados):
+            nonlocal bruto
+            if em_texto:
+                bruto += dados
+
+        def fim(nome):
+            nonlocal em_texto, quer, cabecalho
+            if nome == "c":
+                if bruto is None:
+                    return
+                if tipo == "s":
+                    valor = strings[int(bruto)]
+                elif tipo in ("str", "inlineStr"):
+                    valor = bruto
+                elif tipo == "e":
+                    valor = None  # #DIV/0!, #N/A...: vazio, como no read_excel
+                elif tipo == "b":
+                    valor = bruto == "1"
+                elif tipo == "d":
+                    valor = pd.Timestamp(bruto).to_pydatetime()
+                else:
+                    valor = _numero(bruto)
+                    if estilo in datas:
+                        valor = from_excel(valor, epoca)
+                linha[col] = valor
+            elif nome == "v" or nome == "t":
+                em_texto = False
+            elif nome == "row":
+                if quer is None:
+                    # cabeçalho: decide quais colunas interessam
+                    n = max(linha) + 1 if linha else 0
+                    nomes = [str(linha[i]).strip() if linha.get(i) is not None else f"Unnamed: {i}" for i in range(n)]
+                    pos = [i for i, nome_col in enumerate(nomes) if colunas is None or colunas(nome_col)]
+                    quer = {i: k for k, i in enumerate(pos)}
+                    cabecalho = [nomes[i] for i in pos]
+                elif linha:
+                    valores = [None] * len(quer)
+                    for c, v in linha.items():
+                        valores[quer[c]] = v
+                    linhas.append(valores)
+
+        p = expat.ParserCreate()
+        p.buffer_text = True
+        p.StartElementHandler = inicio
+        p.CharacterDataHandler = texto
+        p.EndElementHandler = fim
+        with zf.open(aba) as fh:
+            while True:
+                bloco = fh.read(BLOCO)
+                if not bloco:
+                    break
+                p.Parse(bloco, False)
+            p.Parse(b"", True)
+
+    if not cabecalho:
+        return pd.DataFrame()
+    # mesmo parser que o read_excel usa por baixo: converte texto numérico, NA etc.
+    return TextParser([cabecalho, *linhas], header=0).read()
+
+
+def ler_planilha(caminho: Path, colunas: Seletor = None) -> Tuple[pd.DataFrame, dict]:
+    """
+    Lê a primeira aba de ``caminho``. ``colunas(nome)`` diz se a coluna
+    (nome já sem espaços nas pontas) interessa; None = todas.
+    """
+    caminho = Path(caminho)
+    inicio = time.perf_counter()
+    sufixo = caminho.suffix.lower()
+    usecols = (lambda c: colunas(str(c).strip())) if colunas else None
+    if sufixo == ".csv":
+        df = pd.read_csv(caminho, usecols=usecols)
+    elif sufixo in (".xlsx", ".xlsm"):
+        df = _ler_xlsx(caminho, colunas)
+    else:
+        df = pd.read_excel(caminho, usecols=usecols)
+    segundos = time.perf_counter() - inicio
+    return df, {
+        "linhas": len(df),
+        "segundos": round(segundos, 3),
+        "linhas_por_segundo": round(len(df) / segundos) if segundos > 0 else None,
+    }
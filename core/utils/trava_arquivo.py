@@ -0,0 +1,40 @@
+# core/utils/trava_arquivo.py
+"""
+Trava exclusiva entre processos (workers do gunicorn etc.) usando um
+arquivo: ``fcntl.flock`` no Linux/macOS e ``msvcrt.locking`` no Windows.
+A trava some junto com o processo, então não sobra arquivo "preso".
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def trava_arquivo(caminho: Path):
+    caminho = Path(caminho)
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    with open(caminho, "a+b") as fh:
+        if fcntl:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        else:
+            fh.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK desiste após ~10 s; continua esperando
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+            else:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
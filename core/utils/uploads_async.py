@@ -0,0 +1,198 @@
+# core/utils/uploads_async.py
+"""
+Uploads de planilha em segundo plano.
+
+O POST só grava o arquivo recebido numa pasta de espera, cria um
+``UploadJob`` e devolve o id; o processamento (ler, normalizar, aplicar
+no banco) roda numa thread. Um executor de uma thread por tipo enfileira
+os uploads do mesmo tipo dentro do processo, e uma trava de arquivo por
+tipo faz o mesmo entre os workers do gunicorn. O estado fica no banco,
+então qualquer worker responde o GET de status.
+
+Enquanto o job está na fila ou rodando, uma thread de batimento do
+processo dono renova ``atualizado_em`` a cada ``BATIMENTO`` segundos. Se
+o worker morrer (reinício, deploy), o batimento para e o GET de status,
+passado ``LIMITE_SEM_SINAL``, marca o job como ``erro``.
+"""
+from __future__ import annotations
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+from ..models import UploadJob
+from .trava_arquivo import trava_arquivo
+
+logger = logging.getLogger(__name__)
+
+_executores: Dict[str, ThreadPoolExecutor] = {}
+
+BATIMENTO = 10  # segundos
+LIMITE_SEM_SINAL = 6 * BATIMENTO
+EM_ANDAMENTO = ("na_fila", "lendo", "aplicando")
+
+_ativos: Set = set()
+_trava_ativos = threading.Lock()
+_batimento: Optional[threading.Thread] = None
+
+
+class ErroUpload(Exception):
+    """Erro esperado do processamento (vira ``erro`` do job / resposta com ``status``)."""
+
+    def __init__(self, detail: str, status: int = 400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status = status
+
+
+def _pasta() -> Path:
+    return Path(settings.MEDIA_ROOT) / "uploads"
+
+
+def receber(arquivo, tipo: str) -> UploadJob:
+    """Grava o arquivo enviado na pasta de espera e cria o job (fase ``na_fila``)."""
+    job_id = uuid.uuid4()
+    ext = Path(arquivo.name).suffix.lower() or ".xlsx"
+    destino = _pasta() / f"{job_id}{ext}"
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    with open(destino, "wb") as dst:
+        for chunk in arquivo.chunks():
+            dst.write(chunk)
+    return UploadJob.objects.create(id=job_id, tipo=tipo, arquivo=str(destino))
+
+
+def _atualizar(job: UploadJob, **campos) -> None:
+    for campo, valor in campos.items():
+        setattr(job, campo, valor)
+    UploadJob.objects.filter(pk=job.pk).update(atualizado_em=timezone.now(), **campos)
+
+
+def progresso(job: UploadJob, fase: Optional[str] = None, linhas: Optional[int] = None) -> None:
+    campos = {}
+    if fase is not None:
+        campos["fase"] = fase
+    if linhas is not None:
+        campos["linhas_processadas"] = linhas
+    if campos:
+        _atualizar(job, **campos)
+
+
+# =========================
+# Batimento
+# =========================
+def _bater() -> None:
+    global _batimento
+    while True:
+        time.sleep(BATIMENTO)
+        with _trava_ativos:
+            ids = list(_ativos)
+            if not ids:
+                _batimento = None
+                return
+        try:
+            UploadJob.objects.filter(pk__in=ids, fase__in=EM_ANDAMENTO).update(atualizado_em=timezone.now())
+        except Exception:
+            logger.exception("Batimento dos uploads %s falhou", ids)
+        finally:
+            connections.close_all()  # só as conexões desta thread
+
+
+def _registrar(job_id) -> None:
+    global _batimento
+    with _trava_ativos:
+        _ativos.add(job_id)
+        if _batimento is None:
+            _batimento = threading.Thread(target=_bater, name="upload-batimento", daemon=True)
+            _batimento.start()
+
+
+def _liberar(job_id) -> None:
+    with _trava_ativos:
+        _ativos.discard(job_id)
+
+
+def verificar_parado(job: UploadJob) -> None:
+    """Job em andamento sem batimento há mais de LIMITE_SEM_SINAL: o worker caiu, marca ``erro``."""
+    if job.fase not in EM_ANDAMENTO or job.atualizado_em is None:
+        return
+    if timezone.now() - job.atualizado_em <= timedelta(seconds=LIMITE_SEM_SINAL):
+        return
+    erro = "Processamento interrompido (o servidor reiniciou?). Envie o arquivo de novo."
+    # só se ninguém mexeu no job desde a leitura
+    if UploadJob.objects.filter(pk=job.pk, fase=job.fase, atualizado_em=job.atualizado_em).update(
+        fase="erro", erro=erro, atualizado_em=timezone.now()
+    ):
+        logger.warning("Upload %s (%s) sem batimento desde %s: marcado como erro", job.pk, job.tipo, job.atualizado_em)
+        job.fase, job.erro = "erro", erro
+        Path(job.arquivo).unlink(missing_ok=True)
+
+
+# =========================
+# Execução
+# =========================
+def executar(job: UploadJob, processar: Callable[[UploadJob], dict]) -> dict:
+    """
+    Roda ``processar(job)`` sob a trava do tipo e grava o resultado/erro no job.
+    Devolve o resultado; repassa ``ErroUpload`` e outros erros a quem chamou.
+    """
+    _registrar(job.pk)
+    try:
+        with trava_arquivo(_pasta() / f"{job.tipo}.lock"):
+            progresso(job, fase="lendo")
+            resultado = processar(job)
+    except ErroUpload as e:
+        _atualizar(job, fase="erro", erro=e.detail)
+        raise
+    except Exception as e:
+        logger.exception("Upload %s (%s) falhou", job.pk, job.tipo)
+        _atualizar(job, fase="erro", erro=str(e))
+        raise
+    finally:
+        _liberar(job.pk)
+        Path(job.arquivo).unlink(missing_ok=True)
+    _atualizar(job, fase="concluido", resultado=resultado)
+    return resultado
+
+
+def _em_thread(job_id, processar: Callable[[UploadJob], dict]) -> None:
+    close_old_connections()
+    try:
+        executar(UploadJob.objects.get(pk=job_id), processar)
+    except ErroUpload as e:
+        logger.info("Upload %s recusado: %s", job_id, e.detail)
+    except Exception:
+        # erros do processamento já foram registrados no job por ``executar``
+        logger.exception("Upload %s falhou em segundo plano", job_id)
+    finally:
+        _liberar(job_id)
+        connections.close_all()
+
+
+def despachar(job: UploadJob, processar: Callable[[UploadJob], dict]) -> None:
+    """Enfileira o job no executor do tipo (uma thread: uploads do mesmo tipo em série)."""
+    executor = _executores.get(job.tipo)
+    if executor is None:
+        executor = _executores[job.tipo] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"upload-{job.tipo}")
+    _registrar(job.pk)  # na fila também bate: a espera atrás de outro upload não é parada
+    executor.submit(_em_thread, job.pk, processar)
+
+
+def status(job: UploadJob) -> dict:
+    return {
+        "job": str(job.pk),
+        "tipo": job.tipo,
+        "fase": job.fase,
+        "linhas_processadas": job.linhas_processadas,
+        "erro": job.erro or None,
+        "resultado": job.resultado,
+        "criado_em": job.criado_em.isoformat() if job.criado_em else None,
+        "atualizado_em": job.atualizado_em.isoformat() if job.atualizado_em else None,
+    }
@@ -0,0 +1,164 @@
+# core/utils/xlsx_stream.py
+"""
+XLSX gerado em fluxo (uma aba, sem estilos), para exportações grandes.
+
+Equivale ao modo write-only do openpyxl, mas sem montar o arquivo inteiro
+antes de responder:
+  - as linhas viram XML num arquivo temporário (SpooledTemporaryFile) à
+    medida que chegam, e a largura de cada coluna é atualizada na hora;
+  - o .zip é escrito num buffer que é esvaziado a cada bloco, então o
+    ``StreamingHttpResponse`` manda os bytes sem guardar o arquivo todo.
+As larguras precisam vir antes de ``<sheetData>`` no XML; por isso as
+linhas passam pelo temporário antes de entrar no zip.
+"""
+from __future__ import annotations
+import re
+import tempfile
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Sequence, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl.utils import get_column_letter
+
+CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+BLOCO = 64 * 1024
+LARGURA_MAX = 100
+_ZIP64_A_PARTIR = 1 << 31  # bytes de XML da aba
+
+# caracteres de controle não são válidos em XML 1.0
+_INVALIDOS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+
+def _workbook(titulo: str) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<workbook xmlns="{_NS_MAIN}" xmlns:r="{_NS_REL}">'
+        f'<sheets><sheet name={quoteattr(titulo[:31])} sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+def _celula(ref: str, valor) -> Tuple[str, int]:
+    """XML da célula e o comprimento do texto exibido (para a largura)."""
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        texto = str(valor)
+        return f'<c r="{ref}"><v>{texto}</v></c>', len(texto)
+    texto = valor.strftime("%d/%m/%Y") if isinstance(valor, (date, datetime)) else str(valor)
+    t = escape(_INVALIDOS.sub("", texto))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{t}</t></is></c>', len(texto)
+
+
+class _Saida:
+    """Destino não-seekable do ZipFile: guarda os bytes até o próximo ``esvaziar``."""
+
+    def __init__(self):
+        self._partes: List[bytes] = []
+
+    def write(self, b) -> int:
+        self._partes.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self) -> Iterator[bytes]:
+        if self._partes:
+            dados = b"".join(self._partes)
+            self._partes.clear()
+            yield dados
+
+
+def gerar_xlsx(cabecalho: Sequence[str], linhas: Iterable[Sequence], titulo: str = "Planilha") -> Iterator[bytes]:
+    """
+    Gera o .xlsx em blocos de bytes. ``linhas`` é consumido de forma
+    preguiçosa (pode ser um gerador); células vazias vão como None.
+    """
+    saida = _Saida()
+    larguras: List[int] = []
+
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as sheet_data, \
+            zipfile.ZipFile(saida, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        # partes fixas saem primeiro (o cliente já começa a receber)
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _RELS)
+        zf.writestr("xl/workbook.xml", _workbook(titulo))
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        yield from saida.esvaziar()
+
+        letras: List[str] = []
+        n_linhas = 0
+        for r, valores in enumerate(_com_cabecalho(cabecalho, linhas), start=1):
+            n_linhas = r
+            celulas = []
+            for c, valor in enumerate(valores):
+                if valor is None:
+                    continue
+                if c >= len(letras):
+                    larguras.extend([0] * (c + 1 - len(larguras)))
+                    letras.extend(get_column_letter(i + 1) for i in range(len(letras), c + 1))
+                xml, largura = _celula(f"{letras[c]}{r}", valor)
+                if largura > larguras[c]:
+                    larguras[c] = largura
+                celulas.append(xml)
+            sheet_data.write(f'<row r="{r}">{"".join(celulas)}</row>'.encode("utf-8"))
+
+        tamanho = sheet_data.tell()
+        sheet_data.seek(0)
+        cols = "".join(
+            f'<col min="{c}" max="{c}" width="{min(w, LARGURA_MAX) + 2}" customWidth="1"/>'
+            for c, w in enumerate(larguras, start=1) if w
+        )
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=tamanho >= _ZIP64_A_PARTIR) as fh:
+            fh.write(
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                f'<worksheet xmlns="{_NS_MAIN}" xmlns:r="{_NS_REL}">'
+                f'<dimension ref="A1:{get_column_letter(max(len(larguras), 1))}{max(n_linhas, 1)}"/>'
+                f'{"<cols>" + cols + "</cols>" if cols else ""}<sheetData>'.encode("utf-8")
+            )
+            while True:
+                bloco = sheet_data.read(BLOCO)
+                if not bloco:
+                    break
+                fh.write(bloco)
+                yield from saida.esvaziar()
+            fh.write(b"</sheetData></worksheet>")
+        yield from saida.esvaziar()
+    yield from saida.esvaziar()
+
+
+def _com_cabecalho(cabecalho, linhas):
+    if cabecalho:
+        yield cabecalho
+    yield from linhas
@@ -1,12 +1,14 @@
 # core/views.py
-from datetime import date, timedelta
+from datetime import date, datetime, time, timedelta
+import base64
+import json
 from io import BytesIO
 import csv
 from decimal import Decimal
-from django.db.models import Prefetch, Q
+from django.db.models import F, Prefetch, Q
 import logging
 
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets, filters, status
 from rest_framework.views import APIView
 
@@ -20,7 +22,17 @@ from .serializers import (
     OrdemProducaoSerializer,
     ListaTecnicaSerializer,
 )
-
+from .utils.bom_estrutura import EstruturaBOM, NoLista, adicionar_detalhes, percorrer
+from .utils.bom_grafo import CicloBOMError, descrever_ciclo, ordem_topologica, sublistas_por_lista
+from .utils.mrp_netting import MODOS, liquidar_acumulado
+from .utils.mrp_fases import PERIODOS, necessidades_por_ordens, fases_por_ordens
+from .utils import bom_busca, historico_resumo, mrp_incremental
+from .utils.bom_busca import BuscaBOMFilter
+from .utils.listagem import ListagemMixin, PaginacaoCursor
+from .utils.xlsx_stream import CONTENT_TYPE as XLSX_CONTENT_TYPE, gerar_xlsx
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.functional import cached_property
 
 from openpyxl import Workbook
@@ -30,8 +42,9 @@ logger = logging.getLogger(__name__)
 # =========================
 # ViewSets
 # =========================
+# Listagens: ?page_size=/&cursor= (paginação opcional) e ?fields= (utils/listagem.py)
 
-class ComponenteViewSet(viewsets.ModelViewSet):
+class ComponenteViewSet(ListagemMixin, viewsets.ModelViewSet):
     # choices agora são minúsculos; usar iexact por segurança
     queryset = Produto.objects.filter(tipo__iexact="componente")
     serializer_class = ProdutoSerializer
@@ -40,7 +53,7 @@ class ComponenteViewSet(viewsets.ModelViewSet):
     ordering_fields = ["codigo", "nome", "estoque", "lead_time"]
 
 
-class ListaTecnicaViewSet(viewsets.ModelViewSet):
+class ListaTecnicaViewSet(ListagemMixin, viewsets.ModelViewSet):
     queryset = ListaTecnica.objects.all()
     serializer_class = ListaTecnicaSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -48,7 +61,7 @@ class ListaTecnicaViewSet(viewsets.ModelViewSet):
     ordering_fields = ["codigo", "nome", "tipo", "criado_em"]
 
 
-class ProdutoViewSet(viewsets.ModelViewSet):
+class ProdutoViewSet(ListagemMixin, viewsets.ModelViewSet):
     queryset = Produto.objects.all()
     serializer_class = ProdutoSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -57,25 +70,23 @@ class ProdutoViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         # garante que "lista" legado não apareça mais como produto
-        return Produto.objects.exclude(tipo__iexact="lista")
+        return super().get_queryset().exclude(tipo__iexact="lista")
 
 
-class BOMViewSet(viewsets.ModelViewSet):
+class BOMViewSet(ListagemMixin, viewsets.ModelViewSet):
     queryset = BOM.objects.select_related("lista_pai", "componente").all()
     serializer_class = BOMSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
-    search_fields = [
-        "lista_pai__codigo",
-        "lista_pai__nome",
-        "componente__codigo",
-        "componente__nome",
-    ]
+    # ?search= resolvido pelo índice de busca da BOM (utils/bom_busca.py); os
+    # campos são os que o índice cobre, também usados no fallback icontains
+    filter_backends = [BuscaBOMFilter, filters.OrderingFilter]
+    search_fields = list(bom_busca.CAMPOS_ICONTAINS)
     ordering_fields = ["lista_pai__codigo", "componente__codigo", "quantidade"]
 
 
-class OrdemProducaoViewSet(viewsets.ModelViewSet):
+class OrdemProducaoViewSet(ListagemMixin, viewsets.ModelViewSet):
     queryset = OrdemProducao.objects.all().order_by('-id')
     serializer_class = OrdemProducaoSerializer
+    ordering_cursor = "-id"
 
 
 # =========================
@@ -161,156 +172,195 @@ def calcular_mrp_recursivo():
     return list(necessidades.values())
 
 
+def _parametros_mrp(request):
+    """Lê ?modo= e ?periodo= (ou devolve a Response de erro)."""
+    modo = request.GET.get("modo") or "exato"
+    periodo = request.GET.get("periodo") or "dia"
+    if modo not in MODOS:
+        return None, None, Response({"detail": f"modo deve ser um de: {', '.join(MODOS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    if periodo not in PERIODOS:
+        return None, None, Response({"detail": f"periodo deve ser um de: {', '.join(PERIODOS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    return modo, periodo, None
+
+
 @api_view(['GET'])
 def executar_mrp(request):
-    necessidades = {}
-    for op in OrdemProducao.objects.select_related("lista"):
-        explodir_lista(op.lista, Decimal(op.quantidade), necessidades, nivel=0, codigo_pai=op.lista.codigo)
+    # BOM já achatada por lista (NecessidadeUnitaria) + netting vetorizado por período
+    modo, periodo, erro = _parametros_mrp(request)
+    if erro:
+        return erro
+    if (modo, periodo) == ("exato", "dia"):
+        # padrão: resultado persistido, mantido por deltas (utils/mrp_incremental.py)
+        return Response(mrp_incremental.necessidades_persistidas())
+    necessidades = necessidades_por_ordens(OrdemProducao.objects.all(), modo=modo, periodo=periodo)
     return Response(list(necessidades.values()))
 
 
-@api_view(["GET"])
-def exportar_mrp_csv(request):
-    resultado = {}
-    for ordem in OrdemProducao.objects.select_related("lista"):
-        lista = _resolver_lista_da_ordem(ordem)
-        if not lista:
-            continue
-        adicionar_detalhes_recursivo(
-            lista_id=lista.id,
-            multiplicador=ordem.quantidade,
-            acumulado=resultado,
-            vistos=set(),
-            ordem_id=ordem.id,
-            lista_final_nome=lista.nome,
-        )
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="resultado_mrp.csv"'
-    writer = csv.writer(response)
-    writer.writerow(["Produto", "Necessidade"])
-    for comp in resultado.values():
-        writer.writerow([comp["nome"], comp["necessario"]])
-    return response
+@api_view(['GET'])
+def mrp_verificar(request):
+    """
+    GET /api/mrp/verificar/[?corrigir=1]
+    Compara o MRP persistido com um recálculo completo; com corrigir=1
+    refaz o persistido quando houver divergência.
+    """
+    divergencias = mrp_incremental.verificar_consistencia()
+    corrigido = False
+    if divergencias and request.GET.get("corrigir") in ("1", "true"):
+        mrp_incremental.recalcular_tudo()
+        corrigido = True
+    return Response({
+        "consistente": not divergencias,
+        "divergencias": len(divergencias),
+        "corrigido": corrigido,
+        "amostra": [
+            {"produto_id": d["produto_id"], "campos": d.get("campos", [])}
+            for d in divergencias[:50]
+        ],
+    })
 
 
+@api_view(['GET'])
+def mrp_fases(request):
+    """
+    GET /api/mrp/fases/?periodo=dia|semana&modo=exato|float
+    Necessidade bruta, estoque projetado, necessidade líquida e liberação
+    (data - lead time) por componente e período.
+    """
+    modo, periodo, erro = _parametros_mrp(request)
+    if erro:
+        return erro
+    return Response(fases_por_ordens(OrdemProducao.objects.all(), modo=modo, periodo=periodo))
 
-@api_view(["GET"])
-def exportar_mrp_excel(request):
-    from openpyxl import Workbook
-    from openpyxl.utils import get_column_letter
 
-    print("⚙️ Iniciando exportação MRP detalhado...")
-    resultado = {}
-    ordens = OrdemProducao.objects.all()
-    print(f"🧾 Total de ordens de produção encontradas: {ordens.count()}")
+class _Eco:
+    """Buffer do csv.writer que só devolve a linha escrita (para StreamingHttpResponse)."""
 
-    for ordem in ordens:
-        lista = _resolver_lista_da_ordem(ordem)
-        print(f"🔁 Processando OP #{ordem.id} com lista {getattr(lista, 'codigo', '?')}")
+    def write(self, value):
+        return value
 
-        if not lista:
-            print(f"⚠️ OP #{ordem.id} não possui lista associada.")
-            continue
 
-        adicionar_detalhes_recursivo(
-            lista_id=lista.id,
-            multiplicador=ordem.quantidade,
-            acumulado=resultado,
-            vistos=set(),
-            ordem_id=ordem.id,
-            lista_final_nome=lista.nome,
-        )
+def _erro_ciclo(estrutura: EstruturaBOM):
+    """
+    400 se a BOM tiver ciclo (linha gravada sem BOM.clean/BOMSerializer:
+    em lote, importada ou anterior à validação); None se estiver ok.
+    Checado antes de começar uma resposta em fluxo, que não tem como
+    virar erro no meio do arquivo.
+    """
+    try:
+        ordem_topologica(sublistas_por_lista(estrutura.filhos), estrutura.listas)
+    except CicloBOMError as e:
+        return Response({"detail": descrever_ciclo(e.caminho)}, status=status.HTTP_400_BAD_REQUEST)
+    return None
 
-    print(f"📦 Total de componentes encontrados no resultado: {len(resultado)}")
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "MRP Detalhado"
-
-    headers = [
-        "OP",
-        "Produto Final",
-        "Qtd OP",
-        "Qtd por Unidade",
-        "Qtd Necessária",
-        "Componente",
-        "Data Necessidade",
-        "Em Estoque",
-        "Faltando",
-        "Saldo Estoque",
-    ]
-    ws.append(headers)
-
-    for comp in resultado.values():
-        estoque_disponivel = comp["em_estoque"]
-        for d in comp["detalhes"]:
-            faltando = max(0, d["qtd_necessaria"] - estoque_disponivel)
-            saldo = estoque_disponivel - d["qtd_necessaria"]
-            try:
-                data = (
-                    
-                    OrdemProducao.objects.get(id=int(d.get("ordem_producao")))
-                    .data_entrega.strftime("%d/%m/%Y")
-                )
-            except:
-                data = "—"
-
-            ws.append(
-                [
-                    d.get("ordem_producao", "—"),
-                    d["produto_final"] if "produto_final" in d else "—",
-                    d.get("qtd_produto", "—"),
-                    d.get("qtd_componente_por_unidade", "—"),
-                    d["qtd_necessaria"],
-                    f"{comp.get('codigo', '—')} - {comp.get('nome', '—')}",
-                    data,
-                    estoque_disponivel,
-                    faltando,
-                    saldo,
-                ]
-            )
 
-            estoque_disponivel = max(0, saldo)
+@api_view(["GET"])
+def exportar_mrp_csv(request):
+    """
+    CSV do MRP detalhado em fluxo, com as mesmas colunas da planilha
+    (/api/mrp/excel/): cada linha é formatada e enviada ao ser gerada.
+    """
+    estrutura = EstruturaBOM.carregar()
+    erro = _erro_ciclo(estrutura)
+    if erro:
+        return erro
+    writer = csv.writer(_Eco())
+
+    def linhas():
+        yield writer.writerow(CABECALHO_MRP_DETALHADO)
+        for linha in _linhas_mrp_detalhado(estrutura):
+            yield writer.writerow(linha)
+
+    response = StreamingHttpResponse(linhas(), content_type="text/csv")
+    response["Content-Disposition"] = 'attachment; filename="resultado_mrp.csv"'
+    return response
 
-    # Largura automática
-    for col in ws.columns:
-        max_length = max(len(str(cell.value)) if cell.value else 0 for cell in col)
-        col_letter = get_column_letter(col[0].column)
-        ws.column_dimensions[col_letter].width = max_length + 2
 
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+@api_view(["GET"])
+def exportar_mrp_excel(request):
+    """
+    Planilha do MRP detalhado em fluxo (StreamingHttpResponse): linhas
+    escritas à medida que são geradas, larguras calculadas na mesma passada.
+    """
+    estrutura = EstruturaBOM.carregar()
+    erro = _erro_ciclo(estrutura)
+    if erro:
+        return erro
+    response = StreamingHttpResponse(
+        gerar_xlsx(CABECALHO_MRP_DETALHADO, _linhas_mrp_detalhado(estrutura), titulo="MRP Detalhado"),
+        content_type=XLSX_CONTENT_TYPE,
     )
     response["Content-Disposition"] = 'attachment; filename="mrp_detalhado.xlsx"'
-    wb.save(response)
+    return response
 
-    logger.info("✅ Arquivo Excel gerado com sucesso!")
 
-    return response
+CABECALHO_MRP_DETALHADO = [
+    "OP",
+    "Produto Final",
+    "Qtd OP",
+    "Qtd por Unidade",
+    "Qtd Necessária",
+    "Componente",
+    "Data Necessidade",
+    "Em Estoque",
+    "Faltando",
+    "Saldo Estoque",
+]
+
+
+def _linhas_mrp_detalhado(estrutura: EstruturaBOM):
+    """
+    Uma linha por detalhe de OP, gerada enquanto a estrutura é percorrida
+    (OP a OP, sem consulta por linha). Em memória fica só o saldo de
+    estoque corrente de cada componente.
+    """
+    saldos = {}
+    for ordem in OrdemProducao.objects.select_related("lista").iterator():
+        lista = _resolver_lista_da_ordem(ordem)
+        if not lista:
+            continue
+        data = ordem.data_entrega.strftime("%d/%m/%Y") if ordem.data_entrega else "—"
+        for comp, mult, qpond_unidade, qtd in percorrer(estrutura, lista.id, ordem.quantidade):
+            estoque_disponivel = saldos.get(comp.id, comp.estoque)
+            saldo = estoque_disponivel - qtd
+            saldos[comp.id] = max(0, saldo)
+            yield [
+                ordem.id,
+                lista.nome,
+                mult,
+                qpond_unidade,
+                qtd,
+                f"{comp.codigo} - {comp.nome}",
+                data,
+                estoque_disponivel,
+                max(0, qtd - estoque_disponivel),
+                saldo,
+            ]
 
 
 @api_view(["GET"])
 def mrp_detalhado(request):
+    estrutura = EstruturaBOM.carregar()
     resultado = {}
-    ordens = OrdemProducao.objects.all()
+    ordens = OrdemProducao.objects.select_related("lista")
 
     for ordem in ordens:
         lista = _resolver_lista_da_ordem(ordem)
         if not lista:
             continue
 
-        # Inicializa estrutura para evitar repetição do mesmo componente
-        vistos = set()
-
-        adicionar_detalhes_recursivo(
-            lista_id=lista.id,
-            multiplicador=ordem.quantidade,
-            acumulado=resultado,
-            vistos=set(),
-            ordem_id=ordem.id,
-            lista_final_nome=lista.nome,
-        )
+        try:
+            adicionar_detalhes(
+                estrutura,
+                lista.id,
+                multiplicador=ordem.quantidade,
+                acumulado=resultado,
+                ordem_id=ordem.id,
+                lista_final_nome=lista.nome,
+            )
+        except CicloBOMError as e:
+            return Response({"detail": descrever_ciclo(e.caminho)}, status=status.HTTP_400_BAD_REQUEST)
 
+    liquidar_acumulado(resultado)
 
     # Fallback: cria detalhe genérico se houver necessidade sem detalhes
     for item in resultado.values():
@@ -336,74 +386,6 @@ def mrp_detalhado(request):
     return Response(list(resultado.values()), status=status.HTTP_200_OK)
 
 
-def adicionar_detalhes_recursivo(
-    lista_id, multiplicador, acumulado, vistos, ordem_id, lista_final_nome, nivel=0
-):
-    relacoes = (
-        BOM.objects
-        .filter(lista_pai_id=lista_id)
-        .select_related("componente", "sublista")
-    )
-
-    for rel in relacoes:
-        comp = rel.componente
-        sublista = rel.sublista
-
-        # aplica ponderação por UNIDADE (None -> 100, 0 -> 0)
-        p_raw = rel.ponderacao_operacao
-        p = Decimal(100 if p_raw is None else p_raw)
-        qpond_unidade = (Decimal(rel.quantidade or 0) * p) / Decimal(100)
-
-        # se 0%, não propaga e não gera linha
-        if qpond_unidade == 0:
-            continue
-
-        qtd_total = qpond_unidade * (Decimal(multiplicador or 1))
-
-        if comp:
-            comp_id = comp.id  # CHAVE ÚNICA, SEMPRE POR ID
-
-            if comp_id not in acumulado:
-                acumulado[comp_id] = {
-                    "id": comp_id,                                # 👈 adicionado
-                    "produto_id": comp_id,
-                    "codigo": (getattr(comp, "codigo", "") or ""),
-                    "nome": (getattr(comp, "nome", "") or ""),
-                    "necessario": Decimal(0),
-                    "em_estoque": Decimal(getattr(comp, "estoque", 0) or 0),
-                    "faltando": Decimal(0),
-                    "lead_time": int(getattr(comp, "lead_time", 0) or 0),
-                    "detalhes": [],
-                }
-
-            acumulado[comp_id]["necessario"] += qtd_total
-            acumulado[comp_id]["faltando"] = max(
-                Decimal(0),
-                acumulado[comp_id]["necessario"] - acumulado[comp_id]["em_estoque"],
-            )
-
-            acumulado[comp_id]["detalhes"].append({
-                "ordem_producao": ordem_id,
-                "produto_final": lista_final_nome,
-                "qtd_produto": multiplicador,
-                # quantidade POR UNIDADE já ponderada
-                "qtd_componente_por_unidade": qpond_unidade,
-                "qtd_necessaria": qtd_total,
-            })
-
-
-        elif sublista:
-            # desce usando a QUANTIDADE PONDERADA como multiplicador
-            adicionar_detalhes_recursivo(
-                lista_id=sublista.id,
-                multiplicador=qtd_total,
-                acumulado=acumulado,
-                vistos=vistos,
-                ordem_id=ordem_id,
-                lista_final_nome=lista_final_nome,
-                nivel=nivel + 1,
-            )
-
 @api_view(["POST"])
 def criar_lista_tecnica(request):
     serializer = ListaTecnicaSerializer(data=request.data)
@@ -440,64 +422,59 @@ def historico_produto(request, produto_id: int):
 
 @api_view(["GET"])
 def historico_todos_os_produtos(request):
-    # Última alteração por produto (visão geral)
-    out = []
-    for p in Produto.objects.all().order_by("codigo"):
-        h = p.history.order_by("-history_date").first()
-        out.append({
-            "id": p.id,
-            "codigo": p.codigo,
-            "nome": p.nome,
-            "ultima_acao": ({"+" : "Criado","~":"Alterado","-":"Excluído"}.get(h.history_type, h.history_type) if h else None),
-            "ultima_data": (h.history_date.isoformat() if h else None),
-        })
-    return Response(out, status=status.HTTP_200_OK)
-
-def explodir_lista(lista, quantidade_base, necessidades, nivel=0, codigo_pai=None):
-    for item in BOM.objects.filter(lista_pai=lista).select_related("componente", "sublista"):
-        # Ponderação correta (None→100, 0→0)
-        p_raw = item.ponderacao_operacao
-        ponderacao = Decimal(100 if p_raw is None else p_raw)
-        qpond_unidade = (Decimal(item.quantidade or 0) * ponderacao) / Decimal(100)
-
-        if qpond_unidade == 0:
-            continue
-
-        if item.componente:
-            comp = item.componente
-            comp_id = comp.id                                  # <<<<<<<<<< CHAVE ÚNICA
-            quant_ponderada = qpond_unidade * Decimal(quantidade_base)
-
-            em_estoque = Decimal(comp.estoque or 0)
-            atual = Decimal(necessidades.get(comp_id, {}).get("necessario", 0))
-            novo_necessario = atual + quant_ponderada
-            faltando = max(Decimal(0), novo_necessario - em_estoque)
-
-            necessidades[comp_id] = {
-                "id": comp_id,                                  # <<<<< mande o ID pro front
-                "codigo": comp.codigo or "",                    # pode ser vazio
-                "nome": comp.nome or "",
-                "necessario": float(novo_necessario),
-                "em_estoque": float(em_estoque),
-                "faltando": float(faltando),
-                "lead_time": int(getattr(comp, "lead_time", 0) or 0),
-                "data_compra": "",
-                "nivel": nivel,
-                "codigo_pai": codigo_pai,
-                "tipo": getattr(comp, "tipo", "componente"),
-            }
-
-        elif item.sublista:
-            explodir_lista(
-                item.sublista,
-                Decimal(quantidade_base) * qpond_unidade,
-                necessidades,
-                nivel + 1,
-                codigo_pai=lista.codigo,
-            )
-
-
+    """
+    Última alteração por produto (visão geral), lida de UltimaAlteracaoProduto
+    numa consulta só. Filtros: ?desde=AAAA-MM-DD&ate=AAAA-MM-DD (data da
+    última alteração, no fuso do projeto). Ordem: (codigo, id), vazios
+    primeiro. Paginação opcional por essa mesma chave: ?page_size=N[&cursor=...]
+    devolve {"results": [...], "next_cursor": "..." | null}.
+    """
+    qs = Produto.objects.order_by(F("codigo").asc(nulls_first=True), "id").values(
+        "id", "codigo", "nome", "ultima_alteracao__acao", "ultima_alteracao__data"
+    )
+    # intervalo [início do dia, início do dia seguinte): usa o índice de ``data``
+    for param, lookup, dias in (("desde", "gte", 0), ("ate", "lt", 1)):
+        valor = request.query_params.get(param)
+        if valor:
+            try:
+                dia = parse_date(valor)
+            except ValueError:
+                dia = None
+            if dia is None:
+                return Response({"detail": f"Data inválida em '{param}' (use AAAA-MM-DD)."}, status=status.HTTP_400_BAD_REQUEST)
+            limite = timezone.make_aware(datetime.combine(dia + timedelta(days=dias), time.min))
+            qs = qs.filter(**{f"ultima_alteracao__data__{lookup}": limite})
+
+    def linha(p):
+        data = p["ultima_alteracao__data"]
+        return {
+            "id": p["id"],
+            "codigo": p["codigo"],
+            "nome": p["nome"],
+            "ultima_acao": historico_resumo.ACOES.get(p["ultima_alteracao__acao"], p["ultima_alteracao__acao"]),
+            "ultima_data": data.isoformat() if data else None,
+        }
+
+    cursor = request.query_params.get("cursor")
+    page_size = request.query_params.get("page_size")
+    if not (cursor or page_size):
+        return Response([linha(p) for p in qs], status=status.HTTP_200_OK)
 
+    try:
+        page_size = min(PaginacaoCursor.max_page_size, max(1, int(page_size or PaginacaoCursor.page_size)))
+        if cursor:
+            codigo, ultimo_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            depois = Q(codigo__isnull=False) if codigo is None else Q(codigo__gt=str(codigo))
+            qs = qs.filter(depois | Q(codigo=codigo, id__gt=int(ultimo_id)))
+    except (ValueError, TypeError):
+        return Response({"detail": "cursor/page_size inválido."}, status=status.HTTP_400_BAD_REQUEST)
+
+    itens = list(qs[:page_size + 1])
+    proximo = None
+    if len(itens) > page_size:
+        itens = itens[:page_size]
+        proximo = base64.urlsafe_b64encode(json.dumps([itens[-1]["codigo"], itens[-1]["id"]]).encode()).decode()
+    return Response({"results": [linha(p) for p in itens], "next_cursor": proximo}, status=status.HTTP_200_OK)
 
 # --- helper para montar "[CODIGO] NOME" com segurança ---
 def _fmt_codigo_nome(obj):
@@ -512,26 +489,24 @@ def _fmt_codigo_nome(obj):
     return f"[{codigo}] {nome}".strip() if codigo else nome
 
 
-def _cadeia_desde_raiz(no):
+def _mapa_listas():
+    """{id: NoLista} de todas as Listas Técnicas (1 consulta), para resolver ``caminho``."""
+    return {
+        lid: NoLista(id=lid, codigo=codigo or "", nome=nome or "")
+        for lid, codigo, nome in ListaTecnica.objects.values_list("id", "codigo", "nome")
+    }
+
+
+def _cadeia_desde_raiz(no, listas):
     """
-    Retorna a cadeia de nós da RAIZ até 'no' (incluindo 'no').
-    Usa o atributo 'parent' se existir em ListaTecnica. Se não existir,
-    a cadeia terá apenas o próprio nó.
+    Retorna a cadeia de nós da RAIZ até 'no' (incluindo 'no'), pelo caminho
+    materializado (``ListaTecnica.caminho``) e o mapa de ``_mapa_listas``:
+    nenhuma consulta por nível.
     """
     if not no:
         return []
-
-    cadeia = []
-    atual = no
-    safety = 0
-    # sobe enquanto houver parent, protegendo contra ciclos
-    while atual and safety < 20:
-        cadeia.append(atual)
-        atual = getattr(atual, "parent", None)  # funciona mesmo se 'parent' não existir
-        safety += 1
-
-    # cadeia está do nó atual para cima; invertendo fica raiz -> ... -> nó
-    return list(reversed(cadeia))
+    cadeia = [listas[i] for i in no.ids_caminho() if i in listas]
+    return cadeia or [no]
 
 # --- helper para obter cadeia hierárquica a partir de uma lista (se existir parent) ---
 def _hierarquia(lista):
@@ -567,12 +542,86 @@ def _codigo_nome(obj):
         return "", ""
     return (getattr(obj, "codigo", "") or "").strip(), (getattr(obj, "nome", "") or "").strip()
 
+def _linha_bom_flat(item, listas):
+    """Uma linha do /api/bom-flat/ (campos de BOMFlatRowSerializer)."""
+    # nó de referência (como você já fazia)
+    no_ref = item.sublista or item.lista_pai
+
+    # raiz -> ... -> nó, pelo caminho materializado
+    cadeia = _cadeia_desde_raiz(no_ref, listas)
+
+    # Preenche listas paralelas de códigos/nomes por nível
+    cods = ["", "", "", "", ""]
+    nomes = ["", "", "", "", ""]
+    for i, nodo in enumerate(cadeia[:5]):
+        cods[i], nomes[i] = _codigo_nome(nodo)
+
+    serie_cod, sistema_cod, conjunto_cod, subconj_cod, item_cod = cods
+    serie_nom, sistema_nom, conjunto_nom, subconj_nom, item_nom = nomes
+
+    # nível atual (0..4)
+    nivel = min(len(cadeia) - 1, 4) if cadeia else 0
+
+    raw = getattr(item, "ponderacao_operacao", None)
+    ponderacao = 100 if raw is None else float(raw)
+    q = float(item.quantidade or 0)
+    if hasattr(item, "quant_ponderada") and item.quant_ponderada is not None:
+        quant_pond = float(item.quant_ponderada)
+    else:
+        quant_pond = q * float(ponderacao) / 100.0
+
+    comp_cod, comp_nom = _codigo_nome(item.componente)
+
+    return {
+        # níveis separados (sem colchetes)
+        "serie_codigo": serie_cod,
+        "serie_nome":   serie_nom,
+        "sistema_codigo": sistema_cod,
+        "sistema_nome":   sistema_nom,
+        "conjunto_codigo": conjunto_cod,
+        "conjunto_nome":   conjunto_nom,
+        "subconjunto_codigo": subconj_cod,
+        "subconjunto_nome":   subconj_nom,
+        # Item só quando o nó é realmente item
+        "item_codigo": item_cod if nivel == 4 else "",
+        "item_nome":   item_nom if nivel == 4 else "",
+        "nivel": int(nivel),
+
+        # componente separado
+        "componente_codigo": comp_cod,
+        "componente_nome":   comp_nom,
+
+        # quantitativos
+        "quantidade": q,
+        "ponderacao": float(ponderacao),
+        "quant_ponderada": float(quant_pond),
+
+        # observações
+        "comentarios": getattr(item, "comentarios", "") or "",
+    }
+
+
+def _cursor_bom_flat(codigo, item_id):
+    return base64.urlsafe_b64encode(json.dumps([codigo, item_id]).encode()).decode()
+
+
+def _ler_cursor_bom_flat(cursor):
+    codigo, item_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return str(codigo), int(item_id)
+
+
 class BOMFlatView(APIView):
     """
     GET /api/bom-flat/?lista_id=...&search=...&incluir_grupos=1
     Retorna linhas em formato de planilha, agora com campos SEPARADOS:
     <nivel>_codigo, <nivel>_nome, e componente_codigo / componente_nome.
+
+    Ordem: (lista_pai__codigo, id). Variantes que não montam a tabela inteira:
+      - &page_size=N[&cursor=...]: paginação por chave (keyset), devolve
+        {"results": [...], "next_cursor": "..." | null};
+      - &formato=ndjson: uma linha JSON por registro, em fluxo.
     """
+    PAGE_SIZE_MAX = 5000
 
     def get(self, request, *args, **kwargs):
         lista_id = request.GET.get("lista_id")
@@ -588,90 +637,42 @@ class BOMFlatView(APIView):
             qs = qs.filter(lista_pai_id=lista_id)
 
         if search:
-            qs = qs.filter(
-                Q(lista_pai__codigo__icontains=search)
-                | Q(lista_pai__nome__icontains=search)
-                | Q(sublista__codigo__icontains=search)
-                | Q(sublista__nome__icontains=search)
-                | Q(componente__codigo__icontains=search)
-                | Q(componente__nome__icontains=search)
-                | Q(comentarios__icontains=search)
-            )
-
-        linhas = []
-        for item in qs.order_by("lista_pai__codigo", "id"):
-            # nó de referência (como você já fazia)
-            no_ref = item.sublista or item.lista_pai
-
-            # sobe árvore até a raiz (você já tem helper pra isso)
-            cadeia = _cadeia_desde_raiz(no_ref)
-
-            # Preenche listas paralelas de códigos/nomes por nível
-            cods = ["", "", "", "", ""]
-            nomes = ["", "", "", "", ""]
-            for i, nodo in enumerate(cadeia[:5]):
-                cods[i], nomes[i] = _codigo_nome(nodo)
+            qs = bom_busca.filtrar(qs, search)  # índice trigram (utils/bom_busca.py)
 
-            serie_cod, sistema_cod, conjunto_cod, subconj_cod, item_cod = cods
-            serie_nom, sistema_nom, conjunto_nom, subconj_nom, item_nom = nomes
+        qs = qs.order_by("lista_pai__codigo", "id")
+        listas = _mapa_listas()
 
-            # nível atual (0..4)
-            nivel = min(len(cadeia) - 1, 4) if cadeia else 0
-
-            raw = getattr(item, "ponderacao_operacao", None)
-            ponderacao = 100 if raw is None else float(raw)
-            q = float(item.quantidade or 0)
-            if hasattr(item, "quant_ponderada") and item.quant_ponderada is not None:
-                quant_pond = float(item.quant_ponderada)
-            else:
-                q = float(item.quantidade or 0)
-                quant_pond = q * float(ponderacao) / 100.0
-
-            comp_cod, comp_nom = _codigo_nome(item.componente)
-
-            linha = {
-                # níveis separados (sem colchetes)
-                "serie_codigo": serie_cod,
-                "serie_nome":   serie_nom,
-                "sistema_codigo": sistema_cod,
-                "sistema_nome":   sistema_nom,
-                "conjunto_codigo": conjunto_cod,
-                "conjunto_nome":   conjunto_nom,
-                "subconjunto_codigo": subconj_cod,
-                "subconjunto_nome":   subconj_nom,
-                # Item só quando o nó é realmente item
-                "item_codigo": item_cod if nivel == 4 else "",
-                "item_nome":   item_nom if nivel == 4 else "",
-                "nivel": int(nivel),
-
-                # componente separado
-                "componente_codigo": comp_cod,
-                "componente_nome":   comp_nom,
-
-                # quantitativos
-                "quantidade": q,
-                "ponderacao": float(ponderacao),
-                "quant_ponderada": float(quant_pond),
-
-                # observações
-                "comentarios": getattr(item, "comentarios", "") or "",
-            }
-
-            # (opcional) manter legacy, se quiser compat com telas antigas:
-            # linha["serie"] = serie_nom
-            # linha["sistema"] = sistema_nom
-            # linha["conjunto"] = conjunto_nom
-            # linha["subconjunto"] = subconj_nom
-            # linha["item_nivel"] = item_nom if nivel == 4 else ""
-            # linha["componente"] = f"[{comp_cod}] {comp_nom}".strip() if comp_cod else comp_nom
-
-            linhas.append(linha)
-
-        # Se você já criou o BOMFlatRowSerializer, pode validar antes de responder:
-        # from .serializers import BOMFlatRowSerializer
-        # data = BOMFlatRowSerializer(linhas, many=True).data
-        # return Response(data, status=200)
+        if (request.GET.get("formato") or "").lower() == "ndjson":
+            linhas = (
+                json.dumps(_linha_bom_flat(item, listas), ensure_ascii=False) + "\n"
+                for item in qs.iterator(chunk_size=2000)
+            )
+            return StreamingHttpResponse(linhas, content_type="application/x-ndjson")
 
+        cursor = request.GET.get("cursor")
+        page_size = request.GET.get("page_size")
+        if cursor or page_size:
+            try:
+                page_size = min(self.PAGE_SIZE_MAX, max(1, int(page_size or 500)))
+                if cursor:
+                    codigo, ultimo_id = _ler_cursor_bom_flat(cursor)
+                    qs = qs.filter(
+                        Q(lista_pai__codigo__gt=codigo) | Q(lista_pai__codigo=codigo, id__gt=ultimo_id)
+                    )
+            except (ValueError, TypeError):
+                return Response({"detail": "cursor/page_size inválido."}, status=400)
+
+            itens = list(qs[:page_size + 1])
+            proximo = None
+            if len(itens) > page_size:
+                itens = itens[:page_size]
+                proximo = _cursor_bom_flat(itens[-1].lista_pai.codigo, itens[-1].id)
+            return Response({
+                "results": [_linha_bom_flat(item, listas) for item in itens],
+                "next_cursor": proximo,
+            }, status=200)
+
+        linhas = [_linha_bom_flat(item, listas) for item in qs]
         return Response(linhas, status=200)
 
 
@@ -688,15 +689,7 @@ class BOMFlatXLSXView(APIView):
         if lista_id:
             qs = qs.filter(lista_pai_id=lista_id)
         if search:
-            qs = qs.filter(
-                Q(lista_pai__codigo__icontains=search) |
-                Q(lista_pai__nome__icontains=search) |
-                Q(sublista__codigo__icontains=search) |
-                Q(sublista__nome__icontains=search) |
-                Q(componente__codigo__icontains=search) |
-                Q(componente__nome__icontains=search) |
-                Q(comentarios__icontains=search)
-            )
+            qs = bom_busca.filtrar(qs, search)
 
         wb = Workbook()
         ws = wb.active
@@ -709,9 +702,10 @@ class BOMFlatXLSXView(APIView):
         header += ["Código","Componente","Quantidade","Ponderação","Quant. Ponderada","Comentários"]
         ws.append(header)
 
+        listas = _mapa_listas()
         for item in qs.order_by("lista_pai__codigo", "id"):
             no_ref = item.sublista or item.lista_pai
-            cadeia = _cadeia_desde_raiz(no_ref)  # RAIZ -> ... -> nó
+            cadeia = _cadeia_desde_raiz(no_ref, listas)  # RAIZ -> ... -> nó
 
             # Extrai NOMES (sem colchetes) para os níveis
             nomes = ["", "", "", "", ""]
@@ -1,4 +1,6 @@
 from __future__ import annotations
+import shutil
+from functools import partial
 from pathlib import Path
 from decimal import Decimal
 
@@ -12,21 +14,95 @@ from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 
 # utils do estoque (já existentes)
-from .utils.estoque_loader import query, clear_cache, get_df
+from .utils.estoque_loader import query, clear_cache, get_store, somas_por_pieza
 
 # >>> imports para atualizar Produtos
-from .models import Produto
+from .models import UploadJob
+from .utils import estoque_db, mrp_incremental, uploads_async
+from .utils.uploads_async import ErroUpload
+
+
+def _processar_estoque(job: UploadJob, zerar_nao_encontrados: bool = False) -> dict:
+    """Etapas do upload de estoque (roda no job, sob a trava do tipo)."""
+    # move o arquivo recebido para a pasta configurada
+    ext = Path(job.arquivo).suffix.lower() or ".xlsx"
+    dest_path: Path = settings.ESTOQUE_PATH.with_suffix(ext)
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(job.arquivo, dest_path)
+
+    # invalida cache e regrava o store colunar normalizado
+    clear_cache()
+    try:
+        store = get_store(force=True)  # ← sua rotina já normaliza nomes/formatos
+    except Exception as e:
+        raise ErroUpload(f"Erro ao normalizar arquivo: {e}", status=500)
+    uploads_async.progresso(job, fase="aplicando", linhas=len(store))
+
+    # --- Soma Bis Qty por Pieza e aplica em Produto.estoque ---
+    if "pieza" not in store or "bis_qty" not in store:
+        raise ErroUpload("Colunas obrigatórias não encontradas (pieza, bis_qty).", status=400)
+    try:
+        # soma por código -> dicionário {codigo: Decimal}
+        somas_por_codigo = {
+            cod.strip(): Decimal(str(qtd))
+            for cod, qtd in somas_por_pieza(store).items() if cod.strip()
+        }
+
+        # aplica por conjunto (tabela temporária + UPDATE); só voltam os ids alterados
+        with transaction.atomic():
+            atualizados, zerados = estoque_db.aplicar(somas_por_codigo, zerar_nao_encontrados)
+            # UPDATE direto não dispara sinais: re-liquida o MRP no fim
+            mrp_incremental.renetar(atualizados + zerados)
+    except Exception as e:
+        raise ErroUpload(f"Erro ao aplicar estoque em Produtos: {e}", status=500)
+
+    return {
+        "ok": True,
+        "path": str(dest_path),
+        "encontrados_no_arquivo": len(somas_por_codigo),
+        "leitura": store.meta.get("leitura"),
+        "produtos_atualizados": len(atualizados),
+        "produtos_zerados": len(zerados),
+    }
+
+
+def responder_upload(request, job: UploadJob, processar) -> JsonResponse:
+    """
+    Padrão: 202 com o id do job (processa em segundo plano).
+    ``?aguardar=1``: processa na própria requisição e devolve o resultado.
+    """
+    if _verdadeiro(request.GET.get("aguardar")):
+        try:
+            resultado = uploads_async.executar(job, processar)
+        except ErroUpload as e:
+            return JsonResponse({"detail": e.detail, "job": str(job.pk)}, status=e.status)
+        except Exception as e:
+            return JsonResponse({"detail": f"Erro ao processar arquivo: {e}", "job": str(job.pk)}, status=500)
+        return JsonResponse({**resultado, "job": str(job.pk)})
+
+    uploads_async.despachar(job, processar)
+    return JsonResponse(
+        {**uploads_async.status(job), "status_url": request.build_absolute_uri(f"{request.path}{job.pk}/")},
+        status=202,
+    )
+
+
+def _verdadeiro(valor) -> bool:
+    return str(valor or "0").lower() in ("1", "true", "t", "yes", "y")
 
 
 @method_decorator(csrf_exempt, name="dispatch")
 class UploadEstoqueView(APIView):
     """
-    POST /api/estoque/upload/?zerar_nao_encontrados=1
-      - Salva o arquivo (xlsx/csv) em settings.ESTOQUE_PATH
-      - Recarrega cache
-      - Soma Bis Qty por Pieza
-      - Atualiza Produto.estoque (Componentes)
-      - (opcional) zera estoque de componentes que não vieram no arquivo
+    POST /api/estoque/upload/?zerar_nao_encontrados=1[&aguardar=1]
+      - Recebe o arquivo (xlsx/csv) e devolve 202 + id do job
+      - Em segundo plano (um upload de estoque por vez):
+          - Salva o arquivo em settings.ESTOQUE_PATH
+          - Recarrega cache
+          - Soma Bis Qty por Pieza
+          - Atualiza Produto.estoque (Componentes)
+          - (opcional) zera estoque de componentes que não vieram no arquivo
+      - Acompanhar em GET /api/estoque/upload/<job>/
     """
     permission_classes = [AllowAny]
     parser_classes = [MultiPartParser, FormParser]
@@ -37,77 +113,29 @@ class UploadEstoqueView(APIView):
             return JsonResponse({"detail": "Arquivo 'file' não enviado."}, status=400)
 
         # parâmetro opcional para zerar quem não veio no upload
-        zerar_nao_encontrados = str(request.GET.get("zerar_nao_encontrados", "0")).lower() in ("1","true","t","yes","y")
-
-        # salva o arquivo na pasta configurada
-        ext = Path(f.name).suffix.lower() or ".xlsx"
-        dest_path: Path = settings.ESTOQUE_PATH.with_suffix(ext)
-        dest_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(dest_path, "wb") as dst:
-            for chunk in f.chunks():
-                dst.write(chunk)
-
-        # invalida cache e pré-carrega o DF normalizado
-        clear_cache()
-        try:
-            df = get_df(force=True)  # ← sua rotina já normaliza nomes/formatos
-        except Exception as e:
-            return JsonResponse({"detail": f"Erro ao normalizar arquivo: {e}"}, status=500)
+        zerar_nao_encontrados = _verdadeiro(request.GET.get("zerar_nao_encontrados"))
 
-        # --- Soma Bis Qty por Pieza e aplica em Produto.estoque ---
-        try:
-            if "pieza" not in df.columns or "bis_qty" not in df.columns:
-                return JsonResponse({"detail": "Colunas obrigatórias não encontradas (pieza, bis_qty)."}, status=400)
-
-            # soma por código
-            serie = df.groupby("pieza", dropna=True)["bis_qty"].sum()
-
-            # dicionário {codigo: Decimal}
-            somas_por_codigo = {
-                str(cod).strip(): Decimal(str(qtd))
-                for cod, qtd in serie.items() if str(cod).strip()
-            }
-            codigos_no_arquivo = list(somas_por_codigo.keys())
-
-            # busca apenas componentes cujo código está no arquivo
-            componentes = list(
-                Produto.objects.filter(tipo__iexact="componente", codigo__in=codigos_no_arquivo)
-            )
-
-            atualizados = 0
-            for comp in componentes:
-                novo = somas_por_codigo.get(comp.codigo, Decimal("0"))
-                if comp.estoque != novo:
-                    comp.estoque = novo
-                    atualizados += 1
-
-            zerados = 0
-            with transaction.atomic():
-                if componentes:
-                    Produto.objects.bulk_update(componentes, ["estoque"], batch_size=1000)
-
-                if zerar_nao_encontrados:
-                    outros = list(
-                        Produto.objects.filter(tipo__iexact="componente")
-                        .exclude(codigo__in=codigos_no_arquivo)
-                    )
-                    for comp in outros:
-                        if comp.estoque != 0:
-                            comp.estoque = Decimal("0")
-                            zerados += 1
-                    if outros:
-                        Produto.objects.bulk_update(outros, ["estoque"], batch_size=1000)
+        job = uploads_async.receber(f, "estoque")
+        return responder_upload(
+            request, job, partial(_processar_estoque, zerar_nao_encontrados=zerar_nao_encontrados)
+        )
 
-            return JsonResponse({
-                "ok": True,
-                "path": str(dest_path),
-                "encontrados_no_arquivo": len(codigos_no_arquivo),
-                "produtos_atualizados": atualizados,
-                "produtos_zerados": zerados if zerar_nao_encontrados else 0,
-            })
 
-        except Exception as e:
-            return JsonResponse({"detail": f"Erro ao aplicar estoque em Produtos: {e}"}, status=500)
+class StatusUploadView(APIView):
+    """
+    GET /api/estoque/upload/<job>/ (e /api/pedidos/upload/<job>/)
+      { job, tipo, fase, linhas_processadas, erro, resultado, ... }
+      Job em andamento sem batimento (worker caiu) passa a ``erro`` aqui.
+    """
+    permission_classes = [AllowAny]
+    tipo = "estoque"
+
+    def get(self, request, job, *args, **kwargs):
+        upload = UploadJob.objects.filter(pk=job, tipo=self.tipo).first()
+        if upload is None:
+            return JsonResponse({"detail": "Upload não encontrado."}, status=404)
+        uploads_async.verificar_parado(upload)
+        return JsonResponse(uploads_async.status(upload))
 
 
 class ConsultaEstoqueView(APIView):
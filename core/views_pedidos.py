@@ -1,25 +1,65 @@
 # core/views_pedidos.py
 from __future__ import annotations
+import shutil
 from pathlib import Path
 
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 
-from .utils.pedidos_loader import clear_cache, get_df, query, build_snapshot
+from .utils.pedidos_loader import clear_cache, get_df, query_json, build_snapshot
+from .models import UploadJob
+from .utils import mrp_incremental, pedidos_db, uploads_async
+from .utils.uploads_async import ErroUpload
+from .views_estoque import responder_upload
+
+
+def _processar_pedidos(job: UploadJob) -> dict:
+    """Etapas do upload de pedidos (roda no job, sob a trava do tipo)."""
+    # move o arquivo recebido mantendo a extensão do upload
+    ext = Path(job.arquivo).suffix.lower() or ".xlsx"
+    base = Path(getattr(settings, "PEDIDOS_PATH", settings.BASE_DIR / "data" / "pedidos.xlsx"))
+    dest_path = base.with_suffix(ext)
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(job.arquivo, dest_path)
+
+    # rebuild caches (e já deixa o cache em memória deste processo quente)
+    clear_cache()
+    try:
+        df = get_df(force=True)                    # normaliza e grava .pkl do DF
+        uploads_async.progresso(job, fase="aplicando", linhas=len(df))
+        snap = build_snapshot(force=True, df=df)   # snapshot agregado {codigo: qty}
+        linhas = pedidos_db.carregar(df)           # tabelas usadas pelo MRP e pela consulta
+    except Exception as e:
+        raise ErroUpload(f"Erro ao processar arquivo: {e}", status=500)
+
+    # "em pedido" mudou para todos: re-liquida o MRP persistido
+    mrp_incremental.renetar_todos()
+
+    return {
+        "ok": True,
+        "path": str(dest_path),
+        "codigos_no_snapshot": len(snap),
+        "linhas_no_banco": linhas,
+        "leitura": df.attrs.get("leitura"),
+    }
 
 
 @method_decorator(csrf_exempt, name="dispatch")
 class UploadPedidosView(APIView):
     """
-    POST /api/pedidos/upload/
-      - Salva o arquivo enviado (xlsx/xls/csv) em settings.PEDIDOS_PATH
-      - Limpa caches
-      - Normaliza o DF e gera snapshot agregado por 'pieza' (qty = ord - recv >= 0)
+    POST /api/pedidos/upload/[?aguardar=1]
+      - Recebe o arquivo (xlsx/xls/csv) e devolve 202 + id do job
+      - Em segundo plano (um upload de pedidos por vez):
+          - Salva o arquivo em settings.PEDIDOS_PATH
+          - Limpa caches
+          - Normaliza o DF e gera snapshot agregado por 'pieza' (qty = ord - recv >= 0)
+          - Carrega as linhas em PedidoCompra e o saldo por peça em EmPedidoProduto
+      - Acompanhar em GET /api/pedidos/upload/<job>/
     """
     permission_classes = [AllowAny]
     parser_classes = [MultiPartParser, FormParser]
@@ -29,25 +69,8 @@ class UploadPedidosView(APIView):
         if not f:
             return JsonResponse({"detail": "Arquivo 'file' não enviado."}, status=400)
 
-        # salva com a mesma extensão do upload
-        ext = Path(f.name).suffix.lower() or ".xlsx"
-        base = Path(getattr(settings, "PEDIDOS_PATH", settings.BASE_DIR / "data" / "pedidos.xlsx"))
-        dest_path = base.with_suffix(ext)
-        dest_path.parent.mkdir(parents=True, exist_ok=True)
-
-        with open(dest_path, "wb") as dst:
-            for chunk in f.chunks():
-                dst.write(chunk)
-
-        # rebuild caches
-        clear_cache()
-        try:
-            _ = get_df(force=True)            # normaliza e grava .pkl do DF
-            snap = build_snapshot(force=True) # snapshot agregado {codigo: qty}
-        except Exception as e:
-            return JsonResponse({"detail": f"Erro ao processar arquivo: {e}"}, status=500)
-
-        return JsonResponse({"ok": True, "path": str(dest_path), "codigos_no_snapshot": len(snap)})
+        job = uploads_async.receber(f, "pedidos")
+        return responder_upload(request, job, _processar_pedidos)
 
 
 class ConsultaPedidosView(APIView):
@@ -87,20 +110,24 @@ class ConsultaPedidosView(APIView):
         sort_by = request.GET.get("sort_by") or None
         sort_dir = request.GET.get("sort_dir") or "asc"
 
+        filtros = dict(
+            pieza=pieza,
+            org=org,
+            fornecedor=fornecedor,
+            search=search,
+            prazo_ini=prazo_ini,
+            prazo_fim=prazo_fim,
+            limit=page_size,
+            offset=offset,
+            sort_by=sort_by,
+            sort_dir=sort_dir,
+        )
         try:
-            total, rows = query(
-                pieza=pieza,
-                org=org,
-                fornecedor=fornecedor,
-                search=search,
-                prazo_ini=prazo_ini,
-                prazo_fim=prazo_fim,
-                limit=page_size,
-                offset=offset,
-                sort_by=sort_by,
-                sort_dir=sort_dir,
-            )
-            return JsonResponse({"count": total, "results": rows})
+            # com pedidos no banco a consulta é SQL (texto pelos índices do DF);
+            # antes da primeira carga, os arquivos. A página sai em bytes pelo pandas
+            if pedidos_db.carregado():
+                return HttpResponse(pedidos_db.query_json(**filtros), content_type="application/json")
+            return HttpResponse(query_json(**filtros), content_type="application/json")
         except FileNotFoundError:
             # ainda não foi feito upload
             return JsonResponse({"count": 0, "results": []})
@@ -1,11 +1,16 @@
 import { useEffect, useMemo, useState } from "react";
-import { BOMAPI } from "../services/api";
+import { BOMAPI, listarPaginado } from "../services/api";
 import type { BOMItem } from "../services/api";
 import CadastrarBOMItem from "../components/CadastrarBOMItem";
 
 
 type Option = { value: number; label: string };
 
+// colunas da tabela + o que o modal de edição lê
+const CAMPOS_BOM =
+  "id,lista_pai,sublista,componente,quantidade,ponderacao_operacao,quant_ponderada,comentarios," +
+  "lista_pai_nome,sublista_nome,componente_codigo,componente_nome";
+
 export default function BOMPage() {
   const [items, setItems] = useState<BOMItem[]>([]);
   const [listas, setListas] = useState<Option[]>([]);
@@ -18,8 +23,7 @@ export default function BOMPage() {
   const [selComponente, setSelComponente] = useState<number>(0);
 
   const carregar = async () => {
-    const resp = await BOMAPI.list();
-    setItems(resp.data || []);
+    setItems(await listarPaginado<BOMItem>(BOMAPI.list, CAMPOS_BOM));
   };
 
   useEffect(() => {
@@ -1,5 +1,5 @@
 // src/pages/BOMPlanilha.tsx
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { BOMFlatAPI } from "../services/api";
 
 type LinhaFlat = {
@@ -32,21 +32,35 @@ export default function BOMPlanilha() {
   const [listaId, setListaId] = useState<string>("");
   const [detalhado, setDetalhado] = useState<boolean>(false); // controla inclusão de grupos
 
+  // cada "Aplicar" invalida as páginas ainda em carregamento da busca anterior
+  const buscaAtual = useRef(0);
+
   const fetchData = async () => {
+    const busca = ++buscaAtual.current;
     try {
       setLoading(true);
       setErrorMsg(null);
-      const { data } = await BOMFlatAPI.list({
-        search: search || undefined,
-        lista_id: listaId || undefined,
-        incluir_grupos: detalhado ? "1" : undefined, // inclui grupos no modo detalhado
-      });
-      setLinhas(data);
+      setLinhas([]);
+      // paginação por cursor: a 1ª página aparece logo, as demais vão sendo anexadas
+      let cursor: string | undefined = undefined;
+      do {
+        const { data } = await BOMFlatAPI.list({
+          search: search || undefined,
+          lista_id: listaId || undefined,
+          incluir_grupos: detalhado ? "1" : undefined, // inclui grupos no modo detalhado
+          page_size: 500,
+          cursor,
+        });
+        if (busca !== buscaAtual.current) return;
+        setLinhas((prev) => [...prev, ...data.results]);
+        setLoading(false);
+        cursor = data.next_cursor ?? undefined;
+      } while (cursor);
     } catch (e: any) {
       console.error("Erro ao carregar BOM flat:", e);
       setErrorMsg("Não foi possível carregar os dados. Verifique a API /api/bom-flat/.");
     } finally {
-      setLoading(false);
+      if (busca === buscaAtual.current) setLoading(false);
     }
   };
 
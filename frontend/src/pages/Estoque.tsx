@@ -4,6 +4,8 @@ import { useEffect, useMemo, useState } from "react";
 const API_BASE =
   (import.meta as any).env?.VITE_API_URL?.replace(/\/$/, "") || "";
 
+const MAX_ESPERA_UPLOAD_MS = 30 * 60 * 1000; // tempo máximo acompanhando o upload
+
 type EstoqueRow = {
   org: string;
   warehouse?: string;
@@ -101,12 +103,25 @@ export default function Estoque() {
         method: "POST",
         body: form,
       });
+      const data = await res.json().catch(() => ({}));
       if (!res.ok) {
-        const data = await res.json().catch(() => ({}));
         throw new Error(
           data?.detail || `Falha no upload (HTTP ${res.status})`
         );
       }
+      // processamento roda em segundo plano: acompanha o job até terminar
+      let job = data;
+      const limite = Date.now() + MAX_ESPERA_UPLOAD_MS;
+      while (res.status === 202 && job?.fase !== "concluido") {
+        if (job?.fase === "erro") throw new Error(job.erro || "Erro no upload");
+        if (Date.now() > limite) {
+          throw new Error("O upload não terminou no tempo esperado. Confira mais tarde se os dados foram atualizados.");
+        }
+        await new Promise((r) => setTimeout(r, 1000));
+        const st = await fetch(`${API_BASE}/estoque/upload/${data.job}/`);
+        job = await st.json().catch(() => ({}));
+        if (!st.ok) throw new Error(job?.detail || `Falha no upload (HTTP ${st.status})`);
+      }
       // recarrega lista após upload
       await queryAndLoad();
     } catch (err: any) {
@@ -1,6 +1,6 @@
 // src/pages/ListasTecnicas.tsx
 import { useEffect, useMemo, useState } from "react";
-import { ListaTecnicaAPI } from "../services/api";
+import { ListaTecnicaAPI, listarPaginado } from "../services/api";
 
 type LT = {
   id: number;
@@ -21,6 +21,9 @@ const TIPOS = [
   { value: "ITEM", label: "Item" },
 ] as const;
 
+// colunas da tabela + o que o formulário de edição lê
+const CAMPOS_LISTA = "id,codigo,nome,tipo,observacoes,parent";
+
 const ORDEM = ["SERIE", "SISTEMA", "CONJUNTO", "SUBCONJUNTO", "ITEM"] as const;
 
 export default function ListasTecnicas() {
@@ -36,8 +39,7 @@ export default function ListasTecnicas() {
   const [loading, setLoading] = useState(false);
 
   const carregar = async () => {
-    const r = await ListaTecnicaAPI.list();
-    setItens(r.data);
+    setItens(await listarPaginado<LT>(ListaTecnicaAPI.list, CAMPOS_LISTA));
   };
 
   useEffect(() => {
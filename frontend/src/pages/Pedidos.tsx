@@ -17,6 +17,7 @@ type ApiResp = { count: number; results: LinhaPedido[] };
 
 const CLIENT_PAGE = 50;               // itens por página (no cliente)
 const LIMIT_OPTS = [50, 100, 200, 500];
+const MAX_ESPERA_UPLOAD_MS = 30 * 60 * 1000; // tempo máximo acompanhando o upload
 
 export default function Pedidos() {
   console.log("🧭 Pedidos page mounted");
@@ -96,7 +97,18 @@ export default function Pedidos() {
     try {
       const fd = new FormData();
       fd.append("file", file);
-      await api.post(`/pedidos/upload/`, fd, { headers: { "Content-Type": "multipart/form-data" } });
+      const res = await api.post(`/pedidos/upload/`, fd, { headers: { "Content-Type": "multipart/form-data" } });
+      // processamento roda em segundo plano: acompanha o job até terminar
+      let job = res.data;
+      const limite = Date.now() + MAX_ESPERA_UPLOAD_MS;
+      while (res.status === 202 && job?.fase !== "concluido") {
+        if (job?.fase === "erro") throw new Error(job.erro || "Erro no upload");
+        if (Date.now() > limite) {
+          throw new Error("O upload não terminou no tempo esperado. Confira mais tarde se os dados foram atualizados.");
+        }
+        await new Promise((r) => setTimeout(r, 1000));
+        job = (await api.get(`/pedidos/upload/${res.data.job}/`)).data;
+      }
       await fetchData();
     } catch (e: any) {
       setErr(e?.response?.data?.detail || e?.message || "Erro no upload");
@@ -1,5 +1,5 @@
 import { useEffect, useState } from "react";
-import { ComponenteAPI } from "../services/api";
+import { ComponenteAPI, listarPaginado } from "../services/api";
 import CadastrarComponente from "../components/CadastrarComponente";
 
 interface Produto {
@@ -14,6 +14,9 @@ interface Produto {
   tipo: string; // "componente"
 }
 
+// colunas da tabela + o que o modal de edição lê
+const CAMPOS_PRODUTO = "id,codigo,nome,fabricante,codigo_fabricante,unidade,estoque,lead_time,tipo";
+
 export default function Produtos() {
   const [produtos, setProdutos] = useState<Produto[]>([]);
   const [showModal, setShowModal] = useState(false);
@@ -24,8 +27,7 @@ export default function Produtos() {
   const fetchProdutos = async () => {
     try {
       setCarregando(true);
-      const { data } = await ComponenteAPI.list(); // /componentes/
-      setProdutos(data ?? []);
+      setProdutos(await listarPaginado<Produto>(ComponenteAPI.list, CAMPOS_PRODUTO)); // /componentes/
     } catch (e) {
       console.error("Erro ao buscar componentes:", e);
     } finally {
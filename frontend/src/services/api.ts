@@ -9,15 +9,37 @@ import api from "./http";
 // };
 
 
+// listagens aceitam ?fields=a,b (só esses campos) e ?page_size=&cursor=
+// (página por cursor: { results, next_cursor }); sem eles, a tabela inteira
+export type ListagemParams = { fields?: string; page_size?: number; cursor?: string; search?: string };
+
+export const PAGINA_LISTAGEM = 1000;
+
+// percorre a listagem página a página (cursor) até o fim, só com os ``fields``
+export async function listarPaginado<T>(
+  listar: (params?: ListagemParams) => Promise<{ data: any }>,
+  fields: string,
+  pageSize: number = PAGINA_LISTAGEM
+): Promise<T[]> {
+  const todos: T[] = [];
+  let cursor: string | undefined;
+  do {
+    const { data } = await listar({ fields, page_size: pageSize, cursor });
+    todos.push(...((data?.results ?? []) as T[]));
+    cursor = data?.next_cursor ?? undefined;
+  } while (cursor);
+  return todos;
+}
+
 export const ComponenteAPI = {
-  list:   () => api.get("/componentes/"),
+  list:   (params?: ListagemParams) => api.get("/componentes/", { params }),
   create: (data: any) => api.post("/componentes/", { ...data, tipo: "componente" }),
   update: (id: number, data: any) => api.put(`/componentes/${id}/`, { ...data, tipo: "componente" }),
   remove: (id: number) => api.delete(`/componentes/${id}/`),
 };
 
 export const ListaTecnicaAPI = {
-  list: () => api.get("/listas-tecnicas/"),
+  list: (params?: ListagemParams) => api.get("/listas-tecnicas/", { params }),
   create: (data: any) => api.post("/listas-tecnicas/", data),          // ✅ sem sobrescrever
   update: (id: number, data: any) => api.put(`/listas-tecnicas/${id}/`, data), // ✅
   remove: (id: number) => api.delete(`/listas-tecnicas/${id}/`),
@@ -69,12 +91,13 @@ export  type BOMCreatePayload = Omit<BOMItem, "id" | "quant_ponderada" | "lista_
 type BOMUpdatePayload = Partial<BOMCreatePayload>;
 
 export const BOMAPI = {
-  list: () => api.get<BOMItem[]>("/bom/"),
+  list: (params?: ListagemParams) => api.get("/bom/", { params }),
   create: (data: BOMCreatePayload) => api.post("/bom/", data),
   update: (id: number, data: BOMUpdatePayload) => api.put(`/bom/${id}/`, data),
   remove: (id: number) => api.delete(`/bom/${id}/`),
-  listas: () => api.get("/listas-tecnicas/"),
-  componentes: () => api.get("/componentes/"),
+  // combos: só o que o rótulo usa
+  listas: () => api.get("/listas-tecnicas/", { params: { fields: "id,codigo,nome" } }),
+  componentes: () => api.get("/componentes/", { params: { fields: "id,codigo,nome" } }),
 };
 
 api.interceptors.request.use((config) => {
@@ -83,6 +106,11 @@ api.interceptors.request.use((config) => {
 });
 
 export const BOMFlatAPI = {
-  list: (params?: { lista_id?: number | string; search?: string }) =>
-    api.get("/bom-flat/", { params }),
+  list: (params?: {
+    lista_id?: number | string;
+    search?: string;
+    incluir_grupos?: string;
+    page_size?: number;
+    cursor?: string;
+  }) => api.get("/bom-flat/", { params }),
 };
\ No newline at end of file